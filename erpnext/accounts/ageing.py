@@ -0,0 +1,114 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import getdate, flt, cint
+
+default_ageing_ranges = [30, 60, 90]
+
+def get_outstanding_entries(accounts, report_date, dr_or_cr="debit", company=None):
+	"""GL Entries of receivable / payable accounts till report date, which are
+		outstanding on report date: invoices, advances and entries adjusted against
+		vouchers made after report date. `dr_or_cr` is the side invoices are booked on,
+		debit for receivables and credit for payables.
+
+		amounts adjusted against each voucher are summed in one grouped query,
+		instead of looking up the payments of every voucher"""
+	if not accounts:
+		return []
+
+	conditions = " and account in ({0})".format(", ".join(["%(account_{0})s".format(i)
+		for i in xrange(len(accounts))]))
+	values = dict((("account_{0}".format(i), account) for i, account in enumerate(accounts)))
+	values["report_date"] = report_date
+
+	if company:
+		conditions += " and company=%(company)s"
+		values["company"] = company
+
+	adjusted_amounts = get_adjusted_amounts(conditions, values)
+	future_vouchers = get_future_vouchers(conditions, values)
+
+	outstanding_entries = []
+	for gle in frappe.db.sql("""select name, posting_date, account, debit, credit,
+			voucher_type, voucher_no, against_voucher_type, against_voucher, remarks
+		from `tabGL Entry`
+		where docstatus < 2 and posting_date <= %(report_date)s {0}
+		order by posting_date, account""".format(conditions), values, as_dict=True):
+			if is_outstanding_voucher(gle, dr_or_cr, future_vouchers):
+				gle.outstanding_amount = get_outstanding_amount(gle, dr_or_cr, adjusted_amounts)
+				outstanding_entries.append(gle)
+
+	return outstanding_entries
+
+def get_adjusted_amounts(conditions, values):
+	"""net debit of entries till report date, made against each voucher"""
+	return dict((((d.account, d.against_voucher_type, d.against_voucher), flt(d.amount))
+		for d in frappe.db.sql("""select account, against_voucher_type, against_voucher,
+				sum(ifnull(debit, 0)) - sum(ifnull(credit, 0)) as amount
+			from `tabGL Entry`
+			where docstatus < 2 and posting_date <= %(report_date)s
+				and ifnull(against_voucher, '') != '' {0}
+			group by account, against_voucher_type, against_voucher""".format(conditions),
+			values, as_dict=True)))
+
+def get_future_vouchers(conditions, values):
+	return set(frappe.db.sql("""select distinct voucher_type, voucher_no
+		from `tabGL Entry`
+		where docstatus < 2 and posting_date > %(report_date)s {0}""".format(conditions), values))
+
+def is_outstanding_voucher(gle, dr_or_cr, future_vouchers):
+	return (
+		# advance
+		(not gle.against_voucher) or
+
+		# invoice
+		(gle.against_voucher==gle.voucher_no and flt(gle.get(dr_or_cr)) > 0) or
+
+		# entries adjusted with future vouchers
+		((gle.against_voucher_type, gle.against_voucher) in future_vouchers)
+	)
+
+def get_outstanding_amount(gle, dr_or_cr, adjusted_amounts):
+	adjusted_amount = adjusted_amounts.get((gle.account, gle.voucher_type, gle.voucher_no), 0.0)
+
+	# an invoice entry is already part of the amount adjusted against the invoice
+	if gle.against_voucher_type==gle.voucher_type and gle.against_voucher==gle.voucher_no:
+		outstanding_amount = adjusted_amount
+	else:
+		outstanding_amount = flt(gle.debit) - flt(gle.credit) + adjusted_amount
+
+	return outstanding_amount if dr_or_cr=="debit" else -outstanding_amount
+
+def get_ageing_ranges(filters):
+	"""upper limits of ageing ranges in days, from filters range1, range2 and range3"""
+	ageing_ranges = [cint(filters.get("range{0}".format(i + 1))) or days
+		for i, days in enumerate(default_ageing_ranges)]
+	return sorted(ageing_ranges)
+
+def get_ageing_columns(ageing_ranges):
+	columns, lower_limit = [], 0
+	for days in ageing_ranges:
+		columns.append("{0}-{1}:Currency:100".format(lower_limit, days))
+		lower_limit = days
+
+	return columns + ["{0}-Above:Currency:100".format(lower_limit)]
+
+def get_ageing_data(age_as_on, entry_date, outstanding_amount, ageing_ranges=None):
+	"""age in days and outstanding amount placed in its ageing range"""
+	ageing_ranges = ageing_ranges or default_ageing_ranges
+	outstanding_range = [0.0] * (len(ageing_ranges) + 1)
+	if not (age_as_on and entry_date):
+		return [0] + outstanding_range
+
+	age = (getdate(age_as_on) - getdate(entry_date)).days or 0
+	index = len(ageing_ranges)
+	for i, days in enumerate(ageing_ranges):
+		if age <= days:
+			index = i
+			break
+
+	outstanding_range[index] = outstanding_amount
+
+	return [age] + outstanding_range
@@ -0,0 +1,74 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+import hashlib
+from frappe.utils import cstr, flt, getdate, now
+
+from frappe.model.document import Document
+
+class AccountBalance(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabAccount Balance`
+		where Key_name="account_posting_date_index" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabAccount Balance`
+			add index account_posting_date_index(account, posting_date)""")
+
+def get_rollup_name(account, cost_center, posting_date, is_period_closing):
+	# same as the key built in rebuild_account_balances
+	return hashlib.md5(cstr("%s::%s::%s::%s" % (account, cstr(cost_center),
+		getdate(posting_date).strftime("%Y-%m-%d"), is_period_closing)).encode("utf-8")).hexdigest()[:20]
+
+def update_account_balances(gl_entries, sign=1):
+	"""add (or remove, with sign=-1) GL Entries to the daily totals of their
+		account and cost center, with one statement for all entries"""
+	rollups = {}
+	for gle in gl_entries:
+		is_period_closing = 1 if gle.get("voucher_type") == "Period Closing Voucher" else 0
+		name = get_rollup_name(gle.get("account"), gle.get("cost_center"), gle.get("posting_date"),
+			is_period_closing)
+
+		if name not in rollups:
+			rollups[name] = [name, gle.get("account"), gle.get("cost_center") or None,
+				getdate(gle.get("posting_date")), is_period_closing, gle.get("company"), 0.0, 0.0]
+
+		rollups[name][6] += sign * flt(gle.get("debit"))
+		rollups[name][7] += sign * flt(gle.get("credit"))
+
+	if not rollups:
+		return
+
+	timestamp, user = now(), frappe.session.user
+	values = []
+	for rollup in rollups.values():
+		values.extend(rollup[:1] + [timestamp, timestamp, user, user] + rollup[1:])
+
+	frappe.db.sql("""insert into `tabAccount Balance`
+		(name, creation, modified, owner, modified_by, docstatus, account, cost_center,
+			posting_date, is_period_closing, company, debit, credit)
+		values {0}
+		on duplicate key update modified=values(modified), modified_by=values(modified_by),
+			debit=debit + values(debit), credit=credit + values(credit)""".format(", ".join(
+				["(%s, %s, %s, %s, %s, 0, %s, %s, %s, %s, %s, %s, %s)"] * len(rollups))),
+		tuple(values))
+
+def rebuild_account_balances():
+	"""rebuild daily totals from the General Ledger"""
+	frappe.db.sql("""delete from `tabAccount Balance`""")
+	frappe.db.sql("""insert into `tabAccount Balance`
+		(name, creation, modified, owner, modified_by, docstatus, account, cost_center,
+			posting_date, is_period_closing, company, debit, credit)
+		select
+			substr(md5(concat_ws('::', account, ifnull(cost_center, ''), posting_date,
+				if(voucher_type='Period Closing Voucher', 1, 0))), 1, 20),
+			%(now)s, %(now)s, %(user)s, %(user)s, 0, account, cost_center, posting_date,
+			if(voucher_type='Period Closing Voucher', 1, 0), company,
+			sum(ifnull(debit, 0)), sum(ifnull(credit, 0))
+		from `tabGL Entry`
+		group by account, ifnull(cost_center, ''), posting_date,
+			if(voucher_type='Period Closing Voucher', 1, 0)""",
+		{"now": now(), "user": frappe.session.user})
@@ -8,18 +8,18 @@ from frappe.utils import flt, fmt_money, getdate, formatdate
 from frappe import _
 
 from frappe.model.document import Document
+from erpnext.utilities.master_data import get_master, get_master_value
 
 class GLEntry(Document):
 
 	def validate(self):
-		self.check_mandatory()
-		self.pl_must_have_cost_center()
+		# same checks as entries posted in bulk, see general_ledger.save_entries_in_bulk
+		from erpnext.accounts.general_ledger import validate_entry
+		validate_entry(self, {self.account: get_master("Account", self.account)},
+			{self.cost_center: get_master("Cost Center", self.cost_center)})
 		self.validate_posting_date()
-		self.check_pl_account()
-		self.validate_cost_center()
 
 	def on_update_with_args(self, adv_adj, update_outstanding = 'Yes'):
-		self.validate_account_details(adv_adj)
 		validate_frozen_account(self.account, adv_adj)
 		check_freezing_date(self.posting_date, adv_adj)
 		validate_balance_type(self.account, adv_adj)
@@ -29,64 +29,13 @@ class GLEntry(Document):
 				update_outstanding_amt(self.account, self.against_voucher_type,
 					self.against_voucher)
 
-	def check_mandatory(self):
-		mandatory = ['account','remarks','voucher_type','voucher_no','fiscal_year','company']
-		for k in mandatory:
-			if not self.get(k):
-				frappe.throw(_("{0} is required").format(self.meta.get_label(k)))
-
-		# Zero value transaction is not allowed
-		if not (flt(self.debit) or flt(self.credit)):
-			frappe.throw(_("Either debit or credit amount is required for {0}").format(self.account))
-
-	def pl_must_have_cost_center(self):
-		if frappe.db.get_value("Account", self.account, "report_type") == "Profit and Loss":
-			if not self.cost_center and self.voucher_type != 'Period Closing Voucher':
-				frappe.throw(_("Cost Center is required for 'Profit and Loss' account {0}").format(self.account))
-		elif self.cost_center:
-			self.cost_center = None
-
 	def validate_posting_date(self):
 		from erpnext.accounts.utils import validate_fiscal_year
 		validate_fiscal_year(self.posting_date, self.fiscal_year, "Posting Date")
 
-	def check_pl_account(self):
-		if self.is_opening=='Yes' and \
-				frappe.db.get_value("Account", self.account, "report_type")=="Profit and Loss":
-			frappe.throw(_("'Profit and Loss' type account {0} not allowed in Opening Entry").format(self.account))
-
-	def validate_account_details(self, adv_adj):
-		"""Account must be ledger, active and not freezed"""
-
-		ret = frappe.db.sql("""select group_or_ledger, docstatus, company
-			from tabAccount where name=%s""", self.account, as_dict=1)[0]
-
-		if ret.group_or_ledger=='Group':
-			frappe.throw(_("Account {0} cannot be a Group").format(self.account))
-
-		if ret.docstatus==2:
-			frappe.throw(_("Account {0} is inactive").format(self.account))
-
-		if ret.company != self.company:
-			frappe.throw(_("Account {0} does not belong to Company {1}").format(self.account, self.company))
-
-	def validate_cost_center(self):
-		if not hasattr(self, "cost_center_company"):
-			self.cost_center_company = {}
-
-		def _get_cost_center_company():
-			if not self.cost_center_company.get(self.cost_center):
-				self.cost_center_company[self.cost_center] = frappe.db.get_value(
-					"Cost Center", self.cost_center, "company")
-
-			return self.cost_center_company[self.cost_center]
-
-		if self.cost_center and _get_cost_center_company() != self.company:
-			frappe.throw(_("Cost Center {0} does not belong to Company {1}").format(self.cost_center, self.company))
-
 def validate_balance_type(account, adv_adj=False):
 	if not adv_adj and account:
-		balance_must_be = frappe.db.get_value("Account", account, "balance_must_be")
+		balance_must_be = get_master_value("Account", account, "balance_must_be")
 		if balance_must_be:
 			balance = frappe.db.sql("""select sum(ifnull(debit, 0)) - sum(ifnull(credit, 0))
 				from `tabGL Entry` where account = %s""", account)[0][0]
@@ -137,7 +86,7 @@ def update_outstanding_amt(account, against_voucher_type, against_voucher, on_ca
 			(against_voucher_type, '%s', '%s'),	(bal, against_voucher))
 
 def validate_frozen_account(account, adv_adj=None):
-	frozen_account = frappe.db.get_value("Account", account, "freeze_account")
+	frozen_account = get_master_value("Account", account, "freeze_account")
 	if frozen_account == 'Yes' and not adv_adj:
 		frozen_accounts_modifier = frappe.db.get_value( 'Accounts Settings', None,
 			'frozen_accounts_modifier')
@@ -146,3 +95,11 @@ def validate_frozen_account(account, adv_adj=None):
 			frappe.throw(_("Account {0} is frozen").format(account))
 		elif frozen_accounts_modifier not in frappe.user.get_roles():
 			frappe.throw(_("Not authorized to edit frozen Account {0}").format(account))
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabGL Entry`
+		where Key_name="posting_date_name_index" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabGL Entry`
+			add index posting_date_name_index(posting_date, name),
+			add index account_posting_date_index(account, posting_date)""")
@@ -128,8 +128,45 @@ class TestJournalVoucher(unittest.TestCase):
 
 		frappe.db.set_value("Company", "_Test Company", "monthly_bgt_flag", "Ignore")
 
+	def test_bulk_gl_posting(self):
+		import erpnext.accounts.general_ledger
+		self.clear_account_balance()
+		erpnext.accounts.general_ledger.bulk_posting_threshold = 1
+
+		try:
+			jv = frappe.copy_doc(test_records[0])
+			jv.insert()
+			jv.submit()
+		finally:
+			erpnext.accounts.general_ledger.bulk_posting_threshold = 20
+
+		gl_entries = frappe.db.sql("""select account, debit, credit, docstatus
+			from `tabGL Entry` where voucher_type='Journal Voucher' and voucher_no=%s
+			order by account""", jv.name)
+
+		self.assertEquals(gl_entries, (("_Test Account Bank Account - _TC", 400.0, 0.0, 1),
+			("_Test Customer - _TC", 0.0, 400.0, 1)))
+
+	def test_account_balance_rollup(self):
+		from erpnext.accounts.utils import get_balance_on
+		self.clear_account_balance()
+
+		jv = frappe.copy_doc(test_records[0])
+		jv.insert()
+		jv.submit()
+
+		self.assertEquals(get_balance_on("_Test Account Bank Account - _TC"), 400.0)
+		self.assertEquals(get_balance_on("_Test Customer - _TC"), -400.0)
+
+		jv.cancel()
+
+		self.assertEquals(get_balance_on("_Test Account Bank Account - _TC"), 0.0)
+		self.assertFalse(frappe.db.sql("""select name from `tabAccount Balance`
+			where ifnull(debit, 0) != 0 or ifnull(credit, 0) != 0"""))
+
 	def clear_account_balance(self):
 		frappe.db.sql("""delete from `tabGL Entry`""")
+		frappe.db.sql("""delete from `tabAccount Balance`""")
 
 
 test_records = frappe.get_test_records('Journal Voucher')
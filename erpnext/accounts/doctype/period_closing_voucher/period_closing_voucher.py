@@ -16,8 +16,8 @@ class PeriodClosingVoucher(AccountsController):
 		self.make_gl_entries()
 
 	def on_cancel(self):
-		frappe.db.sql("""delete from `tabGL Entry`
-			where voucher_type = 'Period Closing Voucher' and voucher_no=%s""", self.name)
+		from erpnext.accounts.general_ledger import delete_voucher_gl_entries
+		delete_voucher_gl_entries("Period Closing Voucher", self.name)
 
 	def validate_account_head(self):
 		if frappe.db.get_value("Account", self.closing_account_head, "report_type") \
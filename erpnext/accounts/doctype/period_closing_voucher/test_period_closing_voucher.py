@@ -11,6 +11,7 @@ class TestPeriodClosingVoucher(unittest.TestCase):
 	def test_closing_entry(self):
 		# clear GL Entries
 		frappe.db.sql("""delete from `tabGL Entry`""")
+		frappe.db.sql("""delete from `tabAccount Balance`""")
 		jv = frappe.copy_doc(jv_records[2])
 		jv.insert()
 		jv.submit()
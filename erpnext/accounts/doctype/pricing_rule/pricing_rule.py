@@ -5,8 +5,9 @@
 
 from __future__ import unicode_literals
 import frappe
+import cPickle
 from frappe import throw, _
-from frappe.utils import flt
+from frappe.utils import flt, cstr, getdate
 from frappe.model.document import Document
 
 class PricingRule(Document):
@@ -15,6 +16,12 @@ class PricingRule(Document):
 		self.validate_min_max_qty()
 		self.cleanup_fields_value()
 
+	def on_update(self):
+		clear_pricing_rule_index()
+
+	def on_trash(self):
+		clear_pricing_rule_index()
+
 
 	def validate_mandatory(self):
 		for field in ["apply_on", "applicable_for", "price_or_discount"]:
@@ -39,3 +46,121 @@ class PricingRule(Document):
 				f = frappe.scrub(f)
 				if f!=fieldname:
 					self.set(f, None)
+
+# fields of a rule used while applying it
+rule_fields = ["name", "item_code", "item_group", "brand", "customer", "customer_group", "territory",
+	"supplier", "supplier_type", "campaign", "sales_partner", "for_price_list", "valid_from",
+	"valid_upto", "min_qty", "max_qty", "priority", "price", "discount_percentage"]
+
+# party fields matching either the transaction's value or blank
+party_fields = ["customer", "supplier", "supplier_type", "campaign", "sales_partner"]
+
+# tree fields, matching the transaction's value, any of its parents, or blank
+tree_doctypes = ["Customer Group", "Territory"]
+
+# bump when the shape of the index changes, so that indexes cached by older code are not read
+pricing_rule_index_version = 2
+
+# memcache does not store values over 1 MB, larger indexes are only kept for the request
+max_cached_index_size = 900 * 1024
+
+def get_pricing_rule_index():
+	"""active pricing rules keyed by item code, item group and brand, along with
+		the ancestors of every item group, customer group and territory.
+		built once and kept in cache until a pricing rule or one of the trees changes"""
+	if not getattr(frappe.local, "pricing_rule_index", None):
+		cache_key = get_pricing_rule_index_key()
+		index = frappe.cache().get_value(cache_key)
+		if not index:
+			index = build_pricing_rule_index()
+			if len(cPickle.dumps(index, cPickle.HIGHEST_PROTOCOL)) < max_cached_index_size:
+				frappe.cache().set_value(cache_key, index)
+
+		frappe.local.pricing_rule_index = index
+
+	return frappe.local.pricing_rule_index
+
+def get_pricing_rule_index_key():
+	return "pricing_rule_index:v{0}".format(pricing_rule_index_version)
+
+def clear_pricing_rule_index(doc=None, method=None, *args, **kwargs):
+	"""called on update, trash and rename of pricing rules, items and trees"""
+	frappe.cache().delete_value(get_pricing_rule_index_key())
+	frappe.local.pricing_rule_index = None
+
+def build_pricing_rule_index():
+	index = {"rules": {}, "item_code": {}, "item_group": {}, "brand": {}, "ancestors": {}}
+
+	for rule in frappe.db.sql("""select {0} from `tabPricing Rule`
+		where docstatus < 2 and ifnull(disable, 0) = 0""".format(", ".join(rule_fields)), as_dict=1):
+			index["rules"][rule.name] = rule
+			for field in ("item_code", "item_group", "brand"):
+				if rule.get(field):
+					index[field].setdefault(rule[field], []).append(rule.name)
+
+	for doctype in ["Item Group"] + tree_doctypes:
+		index["ancestors"][doctype] = get_tree_ancestors(doctype)
+
+	return index
+
+def get_tree_ancestors(doctype):
+	"""map of every node in a nested set tree to itself and all its parents"""
+	ancestors, path = {}, []
+	for name, lft, rgt in frappe.db.sql("""select name, lft, rgt from `tab%s`
+		order by lft""" % doctype):
+			while path and path[-1][1] < lft:
+				path.pop()
+			path.append((name, rgt))
+			ancestors[name] = [d[0] for d in path]
+
+	return ancestors
+
+def get_applicable_pricing_rules(args, index=None):
+	"""pricing rules applicable to an item row (item_code, item_group, brand),
+		for the party, price list and date of the transaction, highest priority first"""
+	index = index or get_pricing_rule_index()
+
+	names = set(index["item_code"].get(args.get("item_code"), []))
+	for item_group in index["ancestors"]["Item Group"].get(args.get("item_group"), []):
+		names.update(index["item_group"].get(item_group, []))
+	if args.get("brand"):
+		names.update(index["brand"].get(args.get("brand"), []))
+
+	transaction_date = args.get("transaction_date") and getdate(args.get("transaction_date"))
+	tree_values = {}
+	for doctype in tree_doctypes:
+		ancestors = index["ancestors"][doctype].get(args.get(frappe.scrub(doctype)))
+		if ancestors:
+			tree_values[frappe.scrub(doctype)] = set(ancestors)
+
+	rules = []
+	for name in names:
+		rule = index["rules"][name]
+		if is_applicable(rule, args, tree_values, transaction_date):
+			rules.append(rule)
+
+	return sorted(rules, key=lambda rule: (cstr(rule.priority), rule.name), reverse=True)
+
+def get_applicable_pricing_rules_for_items(items, args):
+	"""applicable pricing rules of each item row of a transaction, looked up
+		in one pass over the rows. `args` has the transaction level values"""
+	index = get_pricing_rule_index()
+	return [get_applicable_pricing_rules(frappe._dict(args, **item), index) for item in items]
+
+def is_applicable(rule, args, tree_values, transaction_date):
+	for field in party_fields:
+		if cstr(rule.get(field)) not in ("", cstr(args.get(field))):
+			return False
+
+	for field, values in tree_values.items():
+		if rule.get(field) and rule.get(field) not in values:
+			return False
+
+	if cstr(rule.for_price_list) not in ("", cstr(args.get("price_list"))):
+		return False
+
+	if transaction_date and not ((not rule.valid_from or getdate(rule.valid_from) <= transaction_date)
+		and (not rule.valid_upto or getdate(rule.valid_upto) >= transaction_date)):
+			return False
+
+	return True
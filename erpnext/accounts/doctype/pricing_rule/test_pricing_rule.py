@@ -5,6 +5,8 @@
 from __future__ import unicode_literals
 import unittest
 import frappe
+from erpnext.accounts.doctype.pricing_rule.pricing_rule import clear_pricing_rule_index, \
+	get_tree_ancestors
 
 class TestPricingRule(unittest.TestCase):
 	def test_pricing_rule_for_discount(self):
@@ -12,6 +14,7 @@ class TestPricingRule(unittest.TestCase):
 		from frappe import MandatoryError
 
 		frappe.db.sql("delete from `tabPricing Rule`")
+		clear_pricing_rule_index()
 
 		test_record = {
 			"doctype": "Pricing Rule",
@@ -71,6 +74,7 @@ class TestPricingRule(unittest.TestCase):
 		self.assertEquals(details.get("discount_percentage"), 5)
 
 		frappe.db.sql("update `tabPricing Rule` set priority=NULL where campaign='_Test Campaign'")
+		clear_pricing_rule_index()
 		from erpnext.stock.get_item_details import MultiplePricingRuleConflict
 		self.assertRaises (MultiplePricingRuleConflict, get_item_details, args)
 
@@ -79,3 +83,27 @@ class TestPricingRule(unittest.TestCase):
 		self.assertEquals(details.get("discount_percentage"), 15)
 
 		frappe.db.sql("delete from `tabPricing Rule`")
+		clear_pricing_rule_index()
+
+	def test_tree_ancestors(self):
+		ancestors = get_tree_ancestors("Item Group")
+		self.assertEquals(ancestors["All Item Groups"], ["All Item Groups"])
+		self.assertEquals(ancestors["_Test Item Group"][0], "All Item Groups")
+		self.assertEquals(ancestors["_Test Item Group"][-1], "_Test Item Group")
+
+	def test_index_cleared_on_rename(self):
+		from erpnext.accounts.doctype.pricing_rule.pricing_rule import get_pricing_rule_index
+		for name in ("_Test Territory Rename", "_Test Territory Renamed"):
+			if frappe.db.exists("Territory", name):
+				frappe.delete_doc("Territory", name)
+
+		frappe.get_doc({"doctype": "Territory", "territory_name": "_Test Territory Rename",
+			"parent_territory": "All Territories", "is_group": "No"}).insert()
+		self.assertTrue("_Test Territory Rename" in get_pricing_rule_index()["ancestors"]["Territory"])
+
+		frappe.rename_doc("Territory", "_Test Territory Rename", "_Test Territory Renamed")
+		ancestors = get_pricing_rule_index()["ancestors"]["Territory"]
+		self.assertFalse("_Test Territory Rename" in ancestors)
+		self.assertTrue("_Test Territory Renamed" in ancestors)
+
+		frappe.delete_doc("Territory", "_Test Territory Renamed")
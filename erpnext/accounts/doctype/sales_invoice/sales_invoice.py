@@ -12,6 +12,8 @@ from frappe import _, msgprint, throw
 
 from erpnext.accounts.party import get_party_account, get_due_date
 from erpnext.controllers.stock_controller import update_gl_entries_after
+from erpnext.stock.doctype.stock_repost_request.stock_repost_request import is_reposting_deferred
+from erpnext.utilities.master_data import get_master_value
 from frappe.model.mapper import get_mapped_doc
 
 month_map = {'Monthly': 1, 'Quarterly': 3, 'Half-yearly': 6, 'Yearly': 12}
@@ -323,7 +325,7 @@ class SalesInvoice(SellingController):
 		for i in dic:
 			if frappe.db.get_value('Selling Settings', None, dic[i]) == 'Yes':
 				for d in self.get('entries'):
-					if frappe.db.get_value('Item', d.item_code, 'is_stock_item') == 'Yes' \
+					if get_master_value("Item", d.item_code, "is_stock_item") == 'Yes' \
 						and not d.get(i.lower().replace(' ','_')):
 						msgprint(_("{0} is mandatory for Item {1}").format(i,d.item_code), raise_exception=1)
 
@@ -443,11 +445,11 @@ class SalesInvoice(SellingController):
 	def update_stock_ledger(self):
 		sl_entries = []
 		for d in self.get_item_list():
-			if frappe.db.get_value("Item", d.item_code, "is_stock_item") == "Yes" \
+			if get_master_value("Item", d.item_code, "is_stock_item") == "Yes" \
 					and d.warehouse:
 				sl_entries.append(self.get_sl_entries(d, {
 					"actual_qty": -1*flt(d.qty),
-					"stock_uom": frappe.db.get_value("Item", d.item_code, "stock_uom")
+					"stock_uom": get_master_value("Item", d.item_code, "stock_uom")
 				}))
 
 		self.make_sl_entries(sl_entries)
@@ -468,7 +470,8 @@ class SalesInvoice(SellingController):
 				update_outstanding_amt(self.debit_to, self.doctype, self.name)
 
 			if repost_future_gle and cint(self.update_stock) \
-				and cint(frappe.defaults.get_global_default("auto_accounting_for_stock")):
+				and cint(frappe.defaults.get_global_default("auto_accounting_for_stock")) \
+				and not is_reposting_deferred():
 					items, warehouse_account = self.get_items_and_warehouse_accounts()
 					update_gl_entries_after(self.posting_date, self.posting_time,
 						warehouse_account, items)
@@ -349,6 +349,7 @@ class TestSalesInvoice(unittest.TestCase):
 
 	def test_payment(self):
 		frappe.db.sql("""delete from `tabGL Entry`""")
+		frappe.db.sql("""delete from `tabAccount Balance`""")
 		w = self.make()
 
 		from erpnext.accounts.doctype.journal_voucher.test_journal_voucher \
@@ -805,6 +806,7 @@ class TestSalesInvoice(unittest.TestCase):
 		frappe.db.sql("delete from `tabStock Ledger Entry`")
 		frappe.db.sql("delete from tabBin")
 		frappe.db.sql("delete from `tabGL Entry`")
+		frappe.db.sql("delete from `tabAccount Balance`")
 
 	def test_serialized(self):
 		from erpnext.stock.doctype.stock_entry.test_stock_entry import make_serialized_item
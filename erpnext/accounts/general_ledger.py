@@ -6,16 +6,26 @@ import frappe
 from frappe.utils import flt, cstr
 from frappe import _
 from erpnext.accounts.utils import validate_expense_against_budget
+from erpnext.accounts.doctype.account_balance.account_balance import update_account_balances
 
 
 class StockAccountInvalidTransaction(frappe.ValidationError): pass
 
+# gl maps with at least these many entries are posted in bulk
+bulk_posting_threshold = 20
+
 def make_gl_entries(gl_map, cancel=False, adv_adj=False, merge_entries=True,
-		update_outstanding='Yes'):
+		update_outstanding='Yes', bulk=None):
 	if gl_map:
 		if not cancel:
 			gl_map = process_gl_map(gl_map, merge_entries)
-			save_entries(gl_map, adv_adj, update_outstanding)
+			if bulk is None:
+				bulk = len(gl_map) >= bulk_posting_threshold
+
+			if bulk:
+				save_entries_in_bulk(gl_map, adv_adj, update_outstanding)
+			else:
+				save_entries(gl_map, adv_adj, update_outstanding)
 		else:
 			delete_gl_entries(gl_map, adv_adj=adv_adj, update_outstanding=update_outstanding)
 
@@ -36,35 +46,34 @@ def process_gl_map(gl_map, merge_entries=True):
 
 def merge_similar_entries(gl_map):
 	merged_gl_map = []
+	merged_entries = {}
 	for entry in gl_map:
 		# if there is already an entry in this account then just add it
 		# to that entry
-		same_head = check_if_in_list(entry, merged_gl_map)
+		key = get_merge_key(entry)
+		same_head = merged_entries.get(key)
 		if same_head:
 			same_head.debit	= flt(same_head.debit) + flt(entry.debit)
 			same_head.credit = flt(same_head.credit) + flt(entry.credit)
 		else:
+			merged_entries[key] = entry
 			merged_gl_map.append(entry)
 
 	# filter zero debit and credit entries
 	merged_gl_map = filter(lambda x: flt(x.debit)!=0 or flt(x.credit)!=0, merged_gl_map)
 	return merged_gl_map
 
-def check_if_in_list(gle, gl_map):
-	for e in gl_map:
-		if e.account == gle.account and \
-				cstr(e.get('against_voucher'))==cstr(gle.get('against_voucher')) \
-				and cstr(e.get('against_voucher_type')) == \
-					cstr(gle.get('against_voucher_type')) \
-				and cstr(e.get('cost_center')) == cstr(gle.get('cost_center')):
-			return e
+def get_merge_key(gle):
+	return (gle.account, cstr(gle.get('against_voucher')), cstr(gle.get('against_voucher_type')),
+		cstr(gle.get('cost_center')))
 
 def save_entries(gl_map, adv_adj, update_outstanding):
 	validate_account_for_auto_accounting_for_stock(gl_map)
 
 	total_debit = total_credit = 0.0
+	gl_entries = []
 	for entry in gl_map:
-		make_entry(entry, adv_adj, update_outstanding)
+		gl_entries.append(make_entry(entry, adv_adj, update_outstanding))
 		# check against budget
 		validate_expense_against_budget(entry)
 
@@ -73,8 +82,115 @@ def save_entries(gl_map, adv_adj, update_outstanding):
 		total_debit += flt(entry.debit)
 		total_credit += flt(entry.credit)
 
+	update_account_balances(gl_entries)
 	validate_total_debit_credit(total_debit, total_credit)
 
+def save_entries_in_bulk(gl_map, adv_adj, update_outstanding):
+	"""
+		validate the whole gl_map against one snapshot of its accounts and
+		cost centers, insert all GL Entries in one statement and then run
+		balance, budget and outstanding checks once per account / against voucher.
+
+		entries are not inserted as documents, but go through the same checks as
+		the GL Entry controller: `validate_entry` (shared with GLEntry.validate),
+		fiscal year, freezing date, frozen account and balance type
+	"""
+	from erpnext.accounts.doctype.gl_entry.gl_entry import validate_balance_type, \
+		check_freezing_date, update_outstanding_amt, validate_frozen_account
+	from erpnext.accounts.utils import validate_fiscal_year
+	from erpnext.utilities import bulk_insert
+
+	validate_account_for_auto_accounting_for_stock(gl_map)
+
+	accounts = get_map("Account", [entry.account for entry in gl_map],
+		["report_type", "group_or_ledger", "docstatus", "company", "freeze_account",
+			"balance_must_be"])
+	cost_centers = get_map("Cost Center", [entry.cost_center for entry in gl_map
+		if entry.cost_center], ["company"])
+
+	total_debit = total_credit = 0.0
+	for entry in gl_map:
+		validate_entry(entry, accounts, cost_centers)
+
+		if accounts[entry.account].freeze_account == "Yes":
+			validate_frozen_account(entry.account, adv_adj)
+
+		total_debit += flt(entry.debit)
+		total_credit += flt(entry.credit)
+
+	for posting_date, fiscal_year in set((entry.posting_date, entry.fiscal_year) for entry in gl_map):
+		validate_fiscal_year(posting_date, fiscal_year, "Posting Date")
+		check_freezing_date(posting_date, adv_adj)
+
+	bulk_insert("GL Entry", gl_map, docstatus=1)
+	update_account_balances(gl_map)
+
+	for account in set(entry.account for entry in gl_map):
+		if accounts[account].balance_must_be:
+			validate_balance_type(account, adv_adj)
+
+	# check against budget, with all entries of the voucher posted
+	budget_entries = {}
+	for entry in gl_map:
+		if accounts[entry.account].report_type == "Profit and Loss":
+			budget_entries[(entry.account, entry.cost_center)] = entry
+
+	for entry in budget_entries.values():
+		validate_expense_against_budget(entry)
+
+	if update_outstanding == 'Yes':
+		for account, against_voucher_type, against_voucher in set((entry.account,
+			entry.against_voucher_type, entry.against_voucher) for entry in gl_map
+				if entry.against_voucher):
+					update_outstanding_amt(account, against_voucher_type, against_voucher)
+
+	validate_total_debit_credit(total_debit, total_credit)
+
+def get_map(doctype, names, fields):
+	names = list(set(names))
+	if not names:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select name, {0} from `tab{1}`
+		where name in ({2})""".format(", ".join(fields), doctype, ", ".join(["%s"] * len(names))),
+		tuple(names), as_dict=1))
+
+def validate_entry(entry, accounts, cost_centers):
+	"""validations of a GL Entry against preloaded accounts and cost centers,
+		run by GLEntry.validate and for every entry posted in bulk"""
+	for k in ['account','remarks','voucher_type','voucher_no','fiscal_year','company']:
+		if not entry.get(k):
+			frappe.throw(_("{0} is required").format(frappe.get_meta("GL Entry").get_label(k)))
+
+	# Zero value transaction is not allowed
+	if not (flt(entry.debit) or flt(entry.credit)):
+		frappe.throw(_("Either debit or credit amount is required for {0}").format(entry.account))
+
+	account = accounts.get(entry.account)
+	if not account:
+		frappe.throw(_("Account {0} does not exist").format(entry.account), frappe.DoesNotExistError)
+
+	if account.report_type == "Profit and Loss":
+		if not entry.cost_center and entry.voucher_type != 'Period Closing Voucher':
+			frappe.throw(_("Cost Center is required for 'Profit and Loss' account {0}").format(entry.account))
+
+		if entry.is_opening == 'Yes':
+			frappe.throw(_("'Profit and Loss' type account {0} not allowed in Opening Entry").format(entry.account))
+	elif entry.cost_center:
+		entry.cost_center = None
+
+	if entry.cost_center and (cost_centers.get(entry.cost_center) or {}).get("company") != entry.company:
+		frappe.throw(_("Cost Center {0} does not belong to Company {1}").format(entry.cost_center, entry.company))
+
+	if account.group_or_ledger=='Group':
+		frappe.throw(_("Account {0} cannot be a Group").format(entry.account))
+
+	if account.docstatus==2:
+		frappe.throw(_("Account {0} is inactive").format(entry.account))
+
+	if account.company != entry.company:
+		frappe.throw(_("Account {0} does not belong to Company {1}").format(entry.account, entry.company))
+
 def make_entry(args, adv_adj, update_outstanding):
 	args.update({"doctype": "GL Entry"})
 	gle = frappe.get_doc(args)
@@ -82,6 +198,7 @@ def make_entry(args, adv_adj, update_outstanding):
 	gle.insert()
 	gle.run_method("on_update_with_args", adv_adj, update_outstanding)
 	gle.submit()
+	return gle
 
 def validate_total_debit_credit(total_debit, total_credit):
 	if abs(total_debit - total_credit) > 0.005:
@@ -109,8 +226,8 @@ def delete_gl_entries(gl_entries=None, voucher_type=None, voucher_no=None,
 	if gl_entries:
 		check_freezing_date(gl_entries[0]["posting_date"], adv_adj)
 
-	frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
-		(voucher_type or gl_entries[0]["voucher_type"], voucher_no or gl_entries[0]["voucher_no"]))
+	delete_voucher_gl_entries(voucher_type or gl_entries[0]["voucher_type"],
+		voucher_no or gl_entries[0]["voucher_no"])
 
 	for entry in gl_entries:
 		validate_frozen_account(entry["account"], adv_adj)
@@ -120,3 +237,12 @@ def delete_gl_entries(gl_entries=None, voucher_type=None, voucher_no=None,
 		if entry.get("against_voucher") and update_outstanding == 'Yes':
 			update_outstanding_amt(entry["account"], entry.get("against_voucher_type"),
 				entry.get("against_voucher"), on_cancel=True)
+
+def delete_voucher_gl_entries(voucher_type, voucher_no):
+	"""delete GL Entries of a voucher, along with their account balance totals"""
+	update_account_balances(frappe.db.sql("""select account, cost_center, posting_date,
+		voucher_type, company, debit, credit from `tabGL Entry`
+		where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no), as_dict=1), sign=-1)
+
+	frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
+		(voucher_type, voucher_no))
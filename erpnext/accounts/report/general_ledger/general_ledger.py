@@ -3,7 +3,8 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import cstr, flt
+import json
+from frappe.utils import cint, flt
 from frappe import _
 
 def execute(filters=None):
@@ -35,116 +36,166 @@ def get_columns():
 		"Credit:Float:100", "Voucher Type::120", "Voucher No::160", "Link::20", 
 		"Against Account::120", "Cost Center:Link/Cost Center:100", "Remarks::400"]
 		
-def get_result(filters, account_details):	
-	gl_entries = get_gl_entries(filters)
+def get_result(filters, account_details):
+	gl_entries = iter_gl_entries(filters)
 
 	data = get_data_with_opening_closing(filters, account_details, gl_entries)
-		
+
 	result = get_result_as_list(data)
 
 	return result
-	
-def get_gl_entries(filters):
-	group_by_condition = "group by voucher_type, voucher_no, account" \
-		if filters.get("group_by_voucher") else "group by name"
-		
-	gl_entries = frappe.db.sql("""select posting_date, account, 
-			sum(ifnull(debit, 0)) as debit, sum(ifnull(credit, 0)) as credit, 
-			voucher_type, voucher_no, cost_center, remarks, is_opening, against 
+
+def iter_gl_entries(filters, page_length=1000):
+	"""yield entries in posting date order, fetching them a page at a time"""
+	after = None
+	while True:
+		gl_entries = get_gl_entries(filters, after, page_length)
+		for gle in gl_entries:
+			yield gle
+
+		# grouped entries are fetched in one go, as they have no name to page on
+		if filters.get("group_by_voucher") or len(gl_entries) < page_length:
+			break
+
+		after = (gl_entries[-1].posting_date, gl_entries[-1].name)
+
+def get_gl_entries(filters, after=None, page_length=None):
+	"""entries between from and to date, ordered by posting date and name.
+		if `after` (posting date, name) of the last entry of a page is given,
+		the page after it is returned"""
+	conditions, values = get_conditions(filters), filters.copy()
+
+	if filters.get("group_by_voucher"):
+		group_by_condition = "group by voucher_type, voucher_no, account"
+		order_by = "posting_date, account"
+	else:
+		group_by_condition = "group by name"
+		order_by = "posting_date, name"
+
+		if after:
+			conditions += " and (posting_date > %(after_date)s or (posting_date = %(after_date)s and name > %(after_name)s))"
+			values.update({"after_date": after[0], "after_name": after[1]})
+
+		if page_length:
+			order_by += " limit {0}".format(cint(page_length))
+
+	gl_entries = frappe.db.sql("""select name, posting_date, account,
+			sum(ifnull(debit, 0)) as debit, sum(ifnull(credit, 0)) as credit,
+			voucher_type, voucher_no, cost_center, remarks, is_opening, against
 		from `tabGL Entry`
-		where company=%(company)s {conditions}
+		where company=%(company)s and posting_date between %(from_date)s and %(to_date)s {conditions}
 		{group_by_condition}
-		order by posting_date, account"""\
-		.format(conditions=get_conditions(filters), group_by_condition=group_by_condition), 
-		filters, as_dict=1)
-		
+		order by {order_by}"""\
+		.format(conditions=conditions, group_by_condition=group_by_condition, order_by=order_by),
+		values, as_dict=1)
+
 	return gl_entries
-	
-def get_conditions(filters):
+
+def get_opening_balances(filters):
+	"""opening of each account under the filtered account, from entries before
+		from date and opening entries"""
+	if not filters.get("account"):
+		return {}
+
+	return dict(frappe.db.sql("""select account, sum(ifnull(debit, 0)) - sum(ifnull(credit, 0))
+		from `tabGL Entry`
+		where company=%(company)s and (posting_date < %(from_date)s or ifnull(is_opening, 'No') = 'Yes')
+			{conditions}
+		group by account""".format(conditions=get_conditions(filters, opening=True)), filters))
+
+def get_conditions(filters, opening=False):
 	conditions = []
 	if filters.get("account"):
 		lft, rgt = frappe.db.get_value("Account", filters["account"], ["lft", "rgt"])
-		conditions.append("""account in (select name from tabAccount 
+		conditions.append("""account in (select name from tabAccount
 			where lft>=%s and rgt<=%s and docstatus<2)""" % (lft, rgt))
-	else:
-		conditions.append("posting_date between %(from_date)s and %(to_date)s")
-		
+
+		# opening entries of the filtered account are part of its opening balance
+		if not opening:
+			conditions.append("ifnull(is_opening, 'No') = 'No'")
+
 	if filters.get("voucher_no"):
 		conditions.append("voucher_no=%(voucher_no)s")
-		
-		
+
 	from frappe.widgets.reportview import build_match_conditions
 	match_conditions = build_match_conditions("GL Entry")
 	if match_conditions: conditions.append(match_conditions)
-	
+
 	return "and {}".format(" and ".join(conditions)) if conditions else ""
 
 def get_data_with_opening_closing(filters, account_details, gl_entries):
+	"""build the report rows while entries are read. entries are added as they come,
+		unless grouped by account, in which case they are collected per account"""
 	data = []
-	gle_map = initialize_gle_map(gl_entries)
-	
-	opening, total_debit, total_credit, gle_map = get_accountwise_gle(filters, gl_entries, gle_map)
-	
+	opening_balances = get_opening_balances(filters)
+	opening = sum(opening_balances.values())
+	total_debit, total_credit = 0, 0
+	gle_map = frappe._dict()
+
 	# Opening for filtered account
 	if filters.get("account"):
 		data += [get_balance_row("Opening", opening), {}]
 
-	for acc, acc_dict in gle_map.items():
-		if acc_dict.entries:
-			# Opening for individual ledger, if grouped by account
-			if filters.get("group_by_account"):
-				data.append(get_balance_row("Opening", acc_dict.opening))
-
-			data += acc_dict.entries
-			
-			# Totals and closing for individual ledger, if grouped by account
-			if filters.get("group_by_account"):
-				data += [{"account": "Totals", "debit": acc_dict.total_debit, 
-					"credit": acc_dict.total_credit}, 
-					get_balance_row("Closing (Opening + Totals)", 
-						(acc_dict.opening + acc_dict.total_debit - acc_dict.total_credit)), {}]
-						
-	# Total debit and credit between from and to date	
+	for gle in gl_entries:
+		if filters.get("group_by_account"):
+			acc_dict = gle_map.setdefault(gle.account, frappe._dict({
+				"opening": flt(opening_balances.get(gle.account)),
+				"entries": [],
+				"total_debit": 0,
+				"total_credit": 0
+			}))
+			acc_dict.entries.append(gle)
+			acc_dict.total_debit += flt(gle.debit)
+			acc_dict.total_credit += flt(gle.credit)
+		else:
+			data.append(gle)
+
+		total_debit += flt(gle.debit)
+		total_credit += flt(gle.credit)
+
+	for acc in sorted(gle_map):
+		acc_dict = gle_map[acc]
+
+		# Opening, totals and closing for individual ledger
+		data.append(get_balance_row("Opening", acc_dict.opening))
+		data += acc_dict.entries
+		data += [{"account": "Totals", "debit": acc_dict.total_debit,
+			"credit": acc_dict.total_credit},
+			get_balance_row("Closing (Opening + Totals)",
+				(acc_dict.opening + acc_dict.total_debit - acc_dict.total_credit)), {}]
+
+	# Total debit and credit between from and to date
 	if total_debit or total_credit:
 		data.append({"account": "Totals", "debit": total_debit, "credit": total_credit})
-	
+
 	# Closing for filtered account
 	if filters.get("account"):
-		data.append(get_balance_row("Closing (Opening + Totals)", 
+		data.append(get_balance_row("Closing (Opening + Totals)",
 			(opening + total_debit - total_credit)))
-	
+
 	return data
 
-def initialize_gle_map(gl_entries):
-	gle_map = frappe._dict()
-	for gle in gl_entries:
-		gle_map.setdefault(gle.account, frappe._dict({
-			"opening": 0,
-			"entries": [],
-			"total_debit": 0,
-			"total_credit": 0,
-			"closing": 0
-		}))
-	return gle_map
-
-def get_accountwise_gle(filters, gl_entries, gle_map):
-	opening, total_debit, total_credit = 0, 0, 0
-	
-	for gle in gl_entries:
-		amount = flt(gle.debit) - flt(gle.credit)
-		if filters.get("account") and (gle.posting_date < filters.from_date 
-				or cstr(gle.is_opening) == "Yes"):
-			gle_map[gle.account].opening += amount
-			opening += amount
-		elif gle.posting_date <= filters.to_date:
-			gle_map[gle.account].entries.append(gle)
-			gle_map[gle.account].total_debit += flt(gle.debit)
-			gle_map[gle.account].total_credit += flt(gle.credit)
-			
-			total_debit += flt(gle.debit)
-			total_credit += flt(gle.credit)
-			
-	return opening, total_debit, total_credit, gle_map
+@frappe.whitelist()
+def get_gl_entries_page(filters, after_date=None, after_name=None, page_length=500):
+	"""entries for the report's filters, one page at a time. pass posting date and
+		name of the last entry of the previous page to get the next one.
+		opening balances of accounts are returned with the first page"""
+	if not frappe.has_permission("GL Entry"):
+		frappe.throw(_("No Permission"), frappe.PermissionError)
+
+	if isinstance(filters, basestring):
+		filters = json.loads(filters)
+	filters = frappe._dict(filters)
+
+	# entries of a page are not grouped
+	filters.group_by_voucher = filters.group_by_account = 0
+	validate_filters(filters, {})
+
+	return {
+		"opening_balances": None if after_name else get_opening_balances(filters),
+		"entries": get_gl_entries(filters, (after_date, after_name) if after_name else None,
+			cint(page_length) or 500)
+	}
 
 def get_balance_row(label, balance):
 	return {
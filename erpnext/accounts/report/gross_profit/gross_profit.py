@@ -4,14 +4,13 @@
 from __future__ import unicode_literals
 import frappe
 from frappe.utils import flt
-from erpnext.stock.utils import get_buying_amount, get_sales_bom_buying_amount
 
 def execute(filters=None):
 	if not filters: filters = {}
 	
-	stock_ledger_entries = get_stock_ledger_entries(filters)
+	buying_amounts = get_buying_amounts(filters)
 	source = get_source_data(filters)
-	item_sales_bom = get_item_sales_bom()
+	item_sales_bom = get_item_sales_bom(filters)
 	
 	columns = ["Delivery Note/Sales Invoice::120", "Link::30", "Posting Date:Date", "Posting Time", 
 		"Item Code:Link/Item", "Item Name", "Description", "Warehouse:Link/Warehouse",
@@ -25,11 +24,15 @@ def execute(filters=None):
 		item_sales_bom_map = item_sales_bom.get(row.parenttype, {}).get(row.name, frappe._dict())
 		
 		if item_sales_bom_map.get(row.item_code):
-			buying_amount = get_sales_bom_buying_amount(row.item_code, row.warehouse, 
-				row.parenttype, row.name, row.item_row, stock_ledger_entries, item_sales_bom_map)
+			# sales bom item
+			buying_amount = 0.0
+			for bom_item in item_sales_bom_map[row.item_code]:
+				if bom_item.parent_detail_docname == row.item_row:
+					buying_amount += buying_amounts.get((row.parenttype, row.name, row.item_row,
+						bom_item.item_code, row.warehouse), 0.0)
 		else:
-			buying_amount = get_buying_amount(row.parenttype, row.name, row.item_row,
-				stock_ledger_entries.get((row.item_code, row.warehouse), []))
+			buying_amount = buying_amounts.get((row.parenttype, row.name, row.item_row,
+				row.item_code, row.warehouse), 0.0)
 		
 		buying_amount = buying_amount > 0 and buying_amount or 0
 
@@ -48,48 +51,54 @@ def execute(filters=None):
 			
 	return columns, data
 	
-def get_stock_ledger_entries(filters):	
-	query = """select item_code, voucher_type, voucher_no,
-		voucher_detail_no, posting_date, posting_time, stock_value,
-		warehouse, actual_qty as qty
-		from `tabStock Ledger Entry`"""
-	
+def get_conditions(filters, parent=None):
+	prefix = "{0}.".format(parent) if parent else ""
+	conditions = ""
 	if filters.get("company"):
-		query += """ where company=%(company)s"""
-	
-	query += " order by item_code desc, warehouse desc, posting_date desc, posting_time desc, name desc"
-	
-	res = frappe.db.sql(query, filters, as_dict=True)
-	
-	out = {}
-	for r in res:
-		if (r.item_code, r.warehouse) not in out:
-			out[(r.item_code, r.warehouse)] = []
-		
-		out[(r.item_code, r.warehouse)].append(r)
+		conditions += " and {0}company=%(company)s".format(prefix)
+	if filters.get("from_date"):
+		conditions += " and {0}posting_date>=%(from_date)s".format(prefix)
+	if filters.get("to_date"):
+		conditions += " and {0}posting_date<=%(to_date)s".format(prefix)
 
-	return out
-	
-def get_item_sales_bom():
+	return conditions
+
+def get_buying_amounts(filters):
+	"""buying amount of delivered item rows in the date range, keyed by voucher, item row,
+		item and warehouse. it is the fall in stock value caused by the row's stock ledger
+		entry, which is the entry's stock value difference"""
+	buying_amounts = {}
+
+	# if a row has many entries, the latest one is taken
+	for sle in frappe.db.sql("""select voucher_type, voucher_no, voucher_detail_no,
+			item_code, warehouse, stock_value_difference
+		from `tabStock Ledger Entry`
+		where voucher_type in ('Delivery Note', 'Sales Invoice') {0}
+		order by posting_datetime, name""".format(get_conditions(filters)), filters, as_dict=True):
+			buying_amounts[(sle.voucher_type, sle.voucher_no, sle.voucher_detail_no,
+				sle.item_code, sle.warehouse)] = -flt(sle.stock_value_difference)
+
+	return buying_amounts
+
+def get_item_sales_bom(filters):
 	item_sales_bom = {}
-	
-	for d in frappe.db.sql("""select parenttype, parent, parent_item,
-		item_code, warehouse, -1*qty as total_qty, parent_detail_docname
-		from `tabPacked Item` where docstatus=1""", as_dict=True):
-		item_sales_bom.setdefault(d.parenttype, frappe._dict()).setdefault(d.parent,
-			frappe._dict()).setdefault(d.parent_item, []).append(d)
+
+	for parenttype in ("Delivery Note", "Sales Invoice"):
+		for d in frappe.db.sql("""select packed_item.parenttype, packed_item.parent,
+			packed_item.parent_item, packed_item.item_code, packed_item.warehouse,
+			-1*packed_item.qty as total_qty, packed_item.parent_detail_docname
+			from `tabPacked Item` packed_item, `tab{0}` parent
+			where packed_item.parenttype=%(parenttype)s and packed_item.parent=parent.name
+			and packed_item.docstatus=1 {1}""".format(parenttype, get_conditions(filters, "parent")),
+			dict(filters, parenttype=parenttype), as_dict=True):
+				item_sales_bom.setdefault(d.parenttype, frappe._dict()).setdefault(d.parent,
+					frappe._dict()).setdefault(d.parent_item, []).append(d)
 
 	return item_sales_bom
 	
 def get_source_data(filters):
-	conditions = ""
-	if filters.get("company"):
-		conditions += " and company=%(company)s"
-	if filters.get("from_date"):
-		conditions += " and posting_date>=%(from_date)s"
-	if filters.get("to_date"):
-		conditions += " and posting_date<=%(to_date)s"
-	
+	conditions = get_conditions(filters)
+
 	delivery_note_items = frappe.db.sql("""select item.parenttype, dn.name, 
 		dn.posting_date, dn.posting_time, dn.project_name, 
 		item.item_code, item.item_name, item.description, item.warehouse,
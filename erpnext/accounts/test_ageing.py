@@ -0,0 +1,50 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import unittest
+import frappe
+from erpnext.accounts.ageing import get_outstanding_entries, get_ageing_data, \
+	get_ageing_columns
+
+test_dependencies = ["Customer", "Sales Invoice", "Journal Voucher"]
+
+class TestAgeing(unittest.TestCase):
+	def test_outstanding_entries(self):
+		from erpnext.accounts.doctype.sales_invoice.test_sales_invoice \
+			import test_records as si_test_records
+		from erpnext.accounts.doctype.journal_voucher.test_journal_voucher \
+			import test_records as jv_test_records
+
+		# a party no other test posts to, compared only on the vouchers made here
+		si = frappe.copy_doc(si_test_records[0])
+		si.customer = "_Test Customer 2"
+		si.debit_to = "_Test Customer 2 - _TC"
+		si.is_pos = 0
+		si.insert()
+		si.submit()
+
+		jv = frappe.copy_doc(jv_test_records[0])
+		jv.get("entries")[0].account = "_Test Customer 2 - _TC"
+		jv.get("entries")[0].against_invoice = si.name
+		jv.insert()
+		jv.submit()
+
+		def _get_outstanding(report_date):
+			return dict(((gle.voucher_no, gle.outstanding_amount) for gle in
+				get_outstanding_entries(["_Test Customer 2 - _TC"], report_date, "debit", "_Test Company")
+				if gle.voucher_no in (si.name, jv.name)))
+
+		# payment made after report date
+		self.assertEquals(_get_outstanding("2013-02-01"), {si.name: 561.8})
+
+		self.assertEquals(_get_outstanding("2013-02-28"), {si.name: 161.8})
+
+	def test_ageing_ranges(self):
+		self.assertEquals(get_ageing_columns([15, 45]),
+			["0-15:Currency:100", "15-45:Currency:100", "45-Above:Currency:100"])
+
+		self.assertEquals(get_ageing_data("2013-03-01", "2013-01-31", 100, [15, 45]),
+			[29, 0.0, 100, 0.0])
+		self.assertEquals(get_ageing_data("2013-03-01", "2013-01-01", 100),
+			[59, 0.0, 100, 0.0, 0.0])
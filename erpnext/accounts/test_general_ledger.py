@@ -0,0 +1,58 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import unittest, time
+import frappe
+from erpnext.accounts.general_ledger import merge_similar_entries
+
+test_dependencies = ["Journal Voucher"]
+
+class TestGeneralLedger(unittest.TestCase):
+	def test_merge_similar_entries(self):
+		gl_map = [
+			frappe._dict({"account": "Debtors", "against_voucher": "SI-1", "debit": 100}),
+			frappe._dict({"account": "Sales", "cost_center": "Main", "credit": 100}),
+			frappe._dict({"account": "Debtors", "against_voucher": "SI-2", "debit": 50}),
+			frappe._dict({"account": "Sales", "cost_center": "Main", "credit": 50}),
+			frappe._dict({"account": "Debtors", "against_voucher": "SI-1", "debit": -100}),
+		]
+
+		merged = merge_similar_entries(gl_map)
+
+		# order of first occurrence is kept, zero entries are removed
+		self.assertEquals([(d.account, d.get("against_voucher"), d.debit, d.credit) for d in merged],
+			[("Sales", None, 0.0, 150.0), ("Debtors", "SI-2", 50, None)])
+
+	def test_merge_large_gl_map(self):
+		gl_map = []
+		for i in xrange(10000):
+			gl_map.append(frappe._dict({"account": "Stock In Hand %s" % (i % 1000),
+				"cost_center": "Main", "debit": 1.0}))
+
+		start = time.time()
+		merged = merge_similar_entries(gl_map)
+		timing = "merging 10k entries took {0:.2f}s".format(time.time() - start)
+
+		self.assertEquals(len(merged), 1000, timing)
+		self.assertEquals(merged[0].account, "Stock In Hand 0")
+		self.assertEquals(merged[0].debit, 10.0)
+		self.assertEquals(sum([d.debit for d in merged]), 10000.0, timing)
+		self.assertEquals(len(set([d.account for d in merged])), 1000)
+
+	def test_same_validation_in_bulk(self):
+		from erpnext.accounts.general_ledger import make_gl_entries
+
+		def _make_gl_map():
+			# profit and loss entry without a cost center
+			return [frappe._dict({"account": account, "debit": debit, "credit": credit,
+				"remarks": "test", "voucher_type": "Journal Voucher", "voucher_no": "_Test GL Bulk",
+				"posting_date": "2013-02-14", "fiscal_year": "_Test Fiscal Year 2013",
+				"company": "_Test Company"})
+					for account, debit, credit in (("Sales - _TC", 0, 100), ("_Test Account Bank Account - _TC", 100, 0))]
+
+		for bulk in (True, False):
+			self.assertRaises(frappe.ValidationError, make_gl_entries, _make_gl_map(), bulk=bulk)
+
+		self.assertFalse(frappe.db.sql("""select name from `tabGL Entry`
+			where voucher_no='_Test GL Bulk'"""))
@@ -54,7 +54,7 @@ def get_balance_on(account=None, date=None):
 
 	cond = []
 	if date:
-		cond.append("posting_date <= '%s'" % date)
+		cond.append("ab.posting_date <= '%s'" % date)
 	else:
 		# get balance of all entries that exist
 		date = nowdate()
@@ -73,21 +73,21 @@ def get_balance_on(account=None, date=None):
 
 	# for pl accounts, get balance within a fiscal year
 	if acc.report_type == 'Profit and Loss':
-		cond.append("posting_date >= '%s' and voucher_type != 'Period Closing Voucher'" \
-			% year_start_date)
+		cond.append("ab.posting_date >= '%s' and ab.is_period_closing = 0" % year_start_date)
 
+	# balances are read from the daily totals in Account Balance,
 	# different filter for group and ledger - improved performance
 	if acc.group_or_ledger=="Group":
 		cond.append("""exists (
-			select * from `tabAccount` ac where ac.name = gle.account
+			select * from `tabAccount` ac where ac.name = ab.account
 			and ac.lft >= %s and ac.rgt <= %s
 		)""" % (acc.lft, acc.rgt))
 	else:
-		cond.append("""gle.account = "%s" """ % (account.replace('"', '\"'), ))
+		cond.append("""ab.account = "%s" """ % (account.replace('"', '\"'), ))
 
 	bal = frappe.db.sql("""
 		SELECT sum(ifnull(debit, 0)) - sum(ifnull(credit, 0))
-		FROM `tabGL Entry` gle
+		FROM `tabAccount Balance` ab
 		WHERE %s""" % " and ".join(cond))[0][0]
 
 	# if bal is None, return 0
@@ -263,6 +263,10 @@ def fix_total_debit_credit():
 				(dr_or_cr, dr_or_cr, '%s', '%s', '%s', dr_or_cr),
 				(d.diff, d.voucher_type, d.voucher_no))
 
+	if vouchers:
+		from erpnext.accounts.doctype.account_balance.account_balance import rebuild_account_balances
+		rebuild_account_balances()
+
 def get_stock_and_account_difference(account_list=None, posting_date=None):
 	from erpnext.stock.utils import get_stock_balance_on
 
@@ -6,6 +6,7 @@ import frappe
 from frappe.utils import cstr, flt
 from frappe import msgprint, _, throw
 from frappe.model.mapper import get_mapped_doc
+from erpnext.utilities.master_data import get_master_value
 from erpnext.controllers.buying_controller import BuyingController
 
 class PurchaseOrder(BuyingController):
@@ -80,11 +81,12 @@ class PurchaseOrder(BuyingController):
 
 
 	def update_bin(self, is_submit, is_stopped = 0):
-		from erpnext.stock.utils import update_bin
+		from erpnext.stock.utils import update_bin_qty
 		pc_obj = frappe.get_doc('Purchase Common')
+		bin_args = []
 		for d in self.get('po_details'):
 			#1. Check if is_stock_item == 'Yes'
-			if frappe.db.get_value("Item", d.item_code, "is_stock_item") == "Yes":
+			if get_master_value("Item", d.item_code, "is_stock_item") == "Yes":
 				# this happens when item is changed from non-stock to stock item
 				if not d.warehouse:
 					continue
@@ -114,14 +116,15 @@ class PurchaseOrder(BuyingController):
 					ind_qty = -flt(curr_qty)
 
 				# Update ordered_qty and indented_qty in bin
-				args = {
+				bin_args.append({
 					"item_code": d.item_code,
 					"warehouse": d.warehouse,
 					"ordered_qty": (is_submit and 1 or -1) * flt(po_qty),
 					"indented_qty": (is_submit and 1 or -1) * flt(ind_qty),
 					"posting_date": self.transaction_date
-				}
-				update_bin(args)
+				})
+
+		update_bin_qty(bin_args)
 
 	def check_modified_date(self):
 		mod_db = frappe.db.sql("select modified from `tabPurchase Order` where name = %s",
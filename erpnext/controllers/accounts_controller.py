@@ -86,21 +86,24 @@ class AccountsController(TransactionBase):
 
 	def set_missing_item_details(self):
 		"""set missing item values"""
-		from erpnext.stock.get_item_details import get_item_details
+		from erpnext.stock.get_item_details import get_item_details_for_items
 		if hasattr(self, "fname"):
 			parent_dict = {"doctype": self.doctype}
 			for fieldname in self.meta.get_valid_columns():
 				parent_dict[fieldname] = self.get(fieldname)
 
-			for item in self.get(self.fname):
-				if item.get("item_code"):
-					args = item.as_dict()
-					args.update(parent_dict)
-					ret = get_item_details(args)
-					for fieldname, value in ret.items():
-						if item.meta.get_field(fieldname) and \
-							item.get(fieldname) is None and value is not None:
-								item.set(fieldname, value)
+			items = [item for item in self.get(self.fname) if item.get("item_code")]
+			rows = []
+			for item in items:
+				args = item.as_dict()
+				args.update(parent_dict)
+				rows.append(args)
+
+			for item, ret in zip(items, get_item_details_for_items(rows, {})):
+				for fieldname, value in ret.items():
+					if item.meta.get_field(fieldname) and \
+						item.get(fieldname) is None and value is not None:
+							item.set(fieldname, value)
 
 	def set_taxes(self, tax_parentfield, tax_master_field):
 		if not self.meta.get_field(tax_parentfield):
@@ -152,6 +155,11 @@ class AccountsController(TransactionBase):
 		self.calculate_item_values()
 		self.initialize_taxes()
 
+		if self.tax_doclist:
+			# precisions and item tax rates are looked up once for all the steps below
+			self.tax_precision = self.get_tax_precisions()
+			self.item_tax_rates = self.get_item_tax_rates()
+
 		if hasattr(self, "determine_exclusive_rate"):
 			self.determine_exclusive_rate()
 
@@ -205,62 +213,91 @@ class AccountsController(TransactionBase):
 				_on_previous_row_error("1 - %d" % (tax.row_id,))
 
 	def calculate_taxes(self):
-		# maintain actual tax rate based on idx
-		actual_tax_dict = dict([[tax.idx, tax.rate] for tax in self.tax_doclist
-			if tax.charge_type == "Actual"])
-
-		for n, item in enumerate(self.item_doclist):
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
-
-			for i, tax in enumerate(self.tax_doclist):
-				# tax_amount represents the amount of tax for the current step
-				current_tax_amount = self.get_current_tax_amount(item, tax, item_tax_map)
-
-				# Adjust divisional loss to the last item
-				if tax.charge_type == "Actual":
-					actual_tax_dict[tax.idx] -= current_tax_amount
-					if n == len(self.item_doclist) - 1:
-						current_tax_amount += actual_tax_dict[tax.idx]
-
-				# store tax_amount for current item as it will be used for
-				# charge type = 'On Previous Row Amount'
-				tax.tax_amount_for_current_item = current_tax_amount
-
-				# accumulate tax amount into tax.tax_amount
-				if not self.discount_amount_applied:
-					tax.tax_amount += current_tax_amount
-
-				tax.tax_amount_after_discount_amount += current_tax_amount
-
-				if getattr(tax, "category", None):
-					# if just for valuation, do not add the tax amount in total
-					# hence, setting it as 0 for further steps
-					current_tax_amount = 0.0 if (tax.category == "Valuation") \
-						else current_tax_amount
-
-					current_tax_amount *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
-
-				# Calculate tax.total viz. grand total till that step
-				# note: grand_total_for_current_item contains the contribution of
-				# item's amount, previously applied tax and the current tax on that item
-				if i==0:
-					tax.grand_total_for_current_item = flt(item.base_amount + current_tax_amount,
-						self.precision("total", tax))
-				else:
-					tax.grand_total_for_current_item = \
-						flt(self.tax_doclist[i-1].grand_total_for_current_item +
-							current_tax_amount, self.precision("total", tax))
+		"""calculate taxes one tax row at a time, as a column over all items.
+			a tax row can only refer to the rows above it, so each column is
+			computed from the item amounts and the columns already computed"""
+		if not (self.item_doclist and self.tax_doclist):
+			return
+
+		precision = self.tax_precision
+		base_amounts = [item.base_amount for item in self.item_doclist]
+		tax_amount_columns, grand_total_columns = [], []
+
+		for i, tax in enumerate(self.tax_doclist):
+			tax_rates = [rates[i] for rates in self.item_tax_rates]
+
+			# tax amount of each item for the current step
+			tax_amounts = self.get_tax_amount_column(tax, tax_rates, base_amounts,
+				tax_amount_columns, grand_total_columns, precision)
+			tax.item_wise_tax_detail = self.get_item_wise_tax_detail(tax_rates, tax_amounts)
+
+			# Adjust divisional loss to the last item
+			if tax.charge_type == "Actual":
+				actual_tax_amount = tax.rate
+				for tax_amount in tax_amounts:
+					actual_tax_amount -= tax_amount
+				tax_amounts[-1] += actual_tax_amount
+
+			# if just for valuation, do not add the tax amount in total
+			factor = 1.0
+			if getattr(tax, "category", None):
+				factor = 0.0 if (tax.category == "Valuation") else 1.0
+				factor *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
+
+			# grand total of each item till that step
+			previous_totals = grand_total_columns[i-1] if i else base_amounts
+			grand_totals = [flt(previous_total + (tax_amount * factor), precision.total)
+				for previous_total, tax_amount in zip(previous_totals, tax_amounts)]
+
+			tax_amount_columns.append(tax_amounts)
+			grand_total_columns.append(grand_totals)
+
+			# values of the last item, used by print formats and client side scripts
+			tax.tax_amount_for_current_item = tax_amounts[-1]
+			tax.grand_total_for_current_item = grand_totals[-1]
+
+			tax.tax_amount_after_discount_amount = sum(tax_amounts)
+			if not self.discount_amount_applied:
+				tax.tax_amount = tax.tax_amount_after_discount_amount
+			tax.total = sum(grand_totals)
 
-				# in tax.total, accumulate grand total of each item
-				tax.total += tax.grand_total_for_current_item
+			self.round_off_totals(tax)
 
-				# set precision in the last item iteration
-				if n == len(self.item_doclist) - 1:
-					self.round_off_totals(tax)
+		# adjust Discount Amount loss in last tax
+		if self.discount_amount_applied:
+			self.adjust_discount_amount_loss(self.tax_doclist[-1])
 
-					# adjust Discount Amount loss in last tax iteration
-					if i == (len(self.tax_doclist) - 1) and self.discount_amount_applied:
-						self.adjust_discount_amount_loss(tax)
+	def get_tax_amount_column(self, tax, tax_rates, base_amounts, tax_amount_columns,
+		grand_total_columns, precision):
+		if tax.charge_type == "Actual":
+			# distribute the tax amount proportionally to each item row
+			actual = flt(tax.rate, precision.tax_amount)
+			tax_amounts = [(self.net_total and ((base_amount / self.net_total) * actual) or 0)
+				for base_amount in base_amounts]
+		elif tax.charge_type == "On Net Total":
+			tax_amounts = [(tax_rate / 100.0) * base_amount
+				for tax_rate, base_amount in zip(tax_rates, base_amounts)]
+		elif tax.charge_type == "On Previous Row Amount":
+			tax_amounts = [(tax_rate / 100.0) * previous_row_amount for tax_rate, previous_row_amount
+				in zip(tax_rates, tax_amount_columns[cint(tax.row_id) - 1])]
+		elif tax.charge_type == "On Previous Row Total":
+			tax_amounts = [(tax_rate / 100.0) * previous_row_total for tax_rate, previous_row_total
+				in zip(tax_rates, grand_total_columns[cint(tax.row_id) - 1])]
+		else:
+			tax_amounts = [0.0] * len(base_amounts)
+
+		return [flt(tax_amount, precision.tax_amount) for tax_amount in tax_amounts]
+
+	def get_item_wise_tax_detail(self, tax_rates, tax_amounts):
+		"""tax breakup for each item, items with the same item code are clubbed"""
+		item_wise_tax_detail = {}
+		for item, tax_rate, tax_amount in zip(self.item_doclist, tax_rates, tax_amounts):
+			key = item.item_code or item.item_name
+			if item_wise_tax_detail.get(key):
+				tax_amount += item_wise_tax_detail[key][1]
+			item_wise_tax_detail[key] = [tax_rate, tax_amount]
+
+		return item_wise_tax_detail
 
 	def round_off_totals(self, tax):
 		tax.total = flt(tax.total, self.precision("total", tax))
@@ -274,46 +311,32 @@ class AccountsController(TransactionBase):
 			discount_amount_loss, self.precision("tax_amount", tax))
 		tax.total = flt(tax.total + discount_amount_loss, self.precision("total", tax))
 
-	def get_current_tax_amount(self, item, tax, item_tax_map):
-		tax_rate = self._get_tax_rate(tax, item_tax_map)
-		current_tax_amount = 0.0
-
-		if tax.charge_type == "Actual":
-			# distribute the tax amount proportionally to each item row
-			actual = flt(tax.rate, self.precision("tax_amount", tax))
-			current_tax_amount = (self.net_total
-				and ((item.base_amount / self.net_total) * actual)
-				or 0)
-		elif tax.charge_type == "On Net Total":
-			current_tax_amount = (tax_rate / 100.0) * item.base_amount
-		elif tax.charge_type == "On Previous Row Amount":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.tax_doclist[cint(tax.row_id) - 1].tax_amount_for_current_item
-		elif tax.charge_type == "On Previous Row Total":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.tax_doclist[cint(tax.row_id) - 1].grand_total_for_current_item
-
-		current_tax_amount = flt(current_tax_amount, self.precision("tax_amount", tax))
-
-		# store tax breakup for each item
-		key = item.item_code or item.item_name
-		if tax.item_wise_tax_detail.get(key):
-			item_wise_tax_amount = tax.item_wise_tax_detail[key][1] + current_tax_amount
-			tax.item_wise_tax_detail[key] = [tax_rate,item_wise_tax_amount]
-		else:
-			tax.item_wise_tax_detail[key] = [tax_rate,current_tax_amount]
-
-		return current_tax_amount
+	def get_tax_precisions(self):
+		"""precision of tax amount, total and rate, same for all tax rows"""
+		return frappe._dict((fieldname, self.precision(fieldname, self.tax_doclist[0]))
+			for fieldname in ("tax_amount", "total", "rate"))
+
+	def get_item_tax_rates(self):
+		"""tax rate of each tax row for each item, as a list of rates per item.
+			item tax rates are loaded once per distinct item tax rate"""
+		rate_precision = self.tax_precision.rate
+		rates_for_item_tax_rate = {}
+		item_tax_rates = []
+		for item in self.item_doclist:
+			if item.item_tax_rate not in rates_for_item_tax_rate:
+				item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
+				rates_for_item_tax_rate[item.item_tax_rate] = [
+					flt(item_tax_map.get(tax.account_head), rate_precision)
+						if item_tax_map.has_key(tax.account_head) else tax.rate
+					for tax in self.tax_doclist]
+
+			item_tax_rates.append(rates_for_item_tax_rate[item.item_tax_rate])
+
+		return item_tax_rates
 
 	def _load_item_tax_rate(self, item_tax_rate):
 		return json.loads(item_tax_rate) if item_tax_rate else {}
 
-	def _get_tax_rate(self, tax, item_tax_map):
-		if item_tax_map.has_key(tax.account_head):
-			return flt(item_tax_map.get(tax.account_head), self.precision("rate", tax))
-		else:
-			return tax.rate
-
 	def _cleanup(self):
 		for tax in self.tax_doclist:
 			tax.item_wise_tax_detail = json.dumps(tax.item_wise_tax_detail, separators=(',', ':'))
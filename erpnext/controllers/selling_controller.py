@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 import frappe
 from frappe.utils import cint, flt, _round, cstr
 from erpnext.setup.utils import get_company_currency
+from erpnext.utilities.master_data import get_master_value
 from frappe import _, throw
 
 from erpnext.controllers.stock_controller import StockController
@@ -121,20 +122,31 @@ class SellingController(StockController):
 			# no inclusive tax
 			return
 
-		for item in self.item_doclist:
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
-			cumulated_tax_fraction = 0
-			for i, tax in enumerate(self.tax_doclist):
-				tax.tax_fraction_for_current_item = self.get_current_tax_fraction(tax, item_tax_map)
+		if not self.item_doclist:
+			return
 
-				if i==0:
-					tax.grand_total_fraction_for_current_item = 1 + tax.tax_fraction_for_current_item
-				else:
-					tax.grand_total_fraction_for_current_item = \
-						self.tax_doclist[i-1].grand_total_fraction_for_current_item \
-						+ tax.tax_fraction_for_current_item
+		# tax fractions are computed one tax row at a time, for all items
+		tax_fraction_columns, grand_total_fraction_columns = [], []
+		for i, tax in enumerate(self.tax_doclist):
+			tax_rates = [rates[i] for rates in self.item_tax_rates]
+			tax_fractions = self.get_tax_fraction_column(tax, tax_rates,
+				tax_fraction_columns, grand_total_fraction_columns)
+
+			previous_fractions = grand_total_fraction_columns[i-1] if i \
+				else [1] * len(self.item_doclist)
+			grand_total_fractions = [previous_fraction + tax_fraction for previous_fraction, tax_fraction
+				in zip(previous_fractions, tax_fractions)]
 
-				cumulated_tax_fraction += tax.tax_fraction_for_current_item
+			tax_fraction_columns.append(tax_fractions)
+			grand_total_fraction_columns.append(grand_total_fractions)
+
+			tax.tax_fraction_for_current_item = tax_fractions[-1]
+			tax.grand_total_fraction_for_current_item = grand_total_fractions[-1]
+
+		for n, item in enumerate(self.item_doclist):
+			cumulated_tax_fraction = 0
+			for tax_fractions in tax_fraction_columns:
+				cumulated_tax_fraction += tax_fractions[n]
 
 			if cumulated_tax_fraction and not self.discount_amount_applied:
 				item.base_amount = flt((item.amount * self.conversion_rate) /
@@ -149,28 +161,26 @@ class SellingController(StockController):
 					item.base_price_list_rate = flt(item.base_rate / (1 - (item.discount_percentage / 100.0)),
 						self.precision("base_price_list_rate", item))
 
-	def get_current_tax_fraction(self, tax, item_tax_map):
+	def get_tax_fraction_column(self, tax, tax_rates, tax_fraction_columns, grand_total_fraction_columns):
 		"""
-			Get tax fraction for calculating tax exclusive amount
+			Get tax fraction of each item for calculating tax exclusive amount
 			from tax inclusive amount
 		"""
-		current_tax_fraction = 0
-
-		if cint(tax.included_in_print_rate):
-			tax_rate = self._get_tax_rate(tax, item_tax_map)
+		if not cint(tax.included_in_print_rate):
+			return [0] * len(tax_rates)
 
-			if tax.charge_type == "On Net Total":
-				current_tax_fraction = tax_rate / 100.0
+		if tax.charge_type == "On Net Total":
+			return [tax_rate / 100.0 for tax_rate in tax_rates]
 
-			elif tax.charge_type == "On Previous Row Amount":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.tax_doclist[cint(tax.row_id) - 1].tax_fraction_for_current_item
+		elif tax.charge_type == "On Previous Row Amount":
+			return [(tax_rate / 100.0) * previous_fraction for tax_rate, previous_fraction
+				in zip(tax_rates, tax_fraction_columns[cint(tax.row_id) - 1])]
 
-			elif tax.charge_type == "On Previous Row Total":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.tax_doclist[cint(tax.row_id) - 1].grand_total_fraction_for_current_item
+		elif tax.charge_type == "On Previous Row Total":
+			return [(tax_rate / 100.0) * previous_fraction for tax_rate, previous_fraction
+				in zip(tax_rates, grand_total_fraction_columns[cint(tax.row_id) - 1])]
 
-		return current_tax_fraction
+		return [0] * len(tax_rates)
 
 	def calculate_item_values(self):
 		if not self.discount_amount_applied:
@@ -315,7 +325,7 @@ class SellingController(StockController):
 			reserved_qty_for_main_item = 0
 
 			if self.doctype == "Sales Order":
-				if (frappe.db.get_value("Item", d.item_code, "is_stock_item") == 'Yes' or
+				if (get_master_value("Item", d.item_code, "is_stock_item") == 'Yes' or
 					self.has_sales_bom(d.item_code)) and not d.warehouse:
 						frappe.throw(_("Reserved Warehouse required for stock Item {0} in row {1}").format(d.item_code, d.idx))
 				reserved_warehouse = d.warehouse
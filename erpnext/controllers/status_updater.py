@@ -6,6 +6,7 @@ import frappe
 from frappe.utils import flt
 from frappe import msgprint, _, throw
 from frappe.model.document import Document
+from erpnext.utilities.master_data import get_master_value
 
 status_map = {
 	"Contact": [
@@ -257,7 +258,7 @@ def get_tolerance_for(item_code, item_tolerance={}, global_tolerance=None):
 	if item_tolerance.get(item_code):
 		return item_tolerance[item_code], item_tolerance, global_tolerance
 
-	tolerance = flt(frappe.db.get_value('Item',item_code,'tolerance') or 0)
+	tolerance = flt(get_master_value("Item", item_code, "tolerance") or 0)
 
 	if not tolerance:
 		if global_tolerance == None:
@@ -6,9 +6,13 @@ import frappe
 from frappe.utils import cint, flt, cstr
 from frappe import msgprint, _
 import frappe.defaults
+from collections import OrderedDict
 
 from erpnext.controllers.accounts_controller import AccountsController
-from erpnext.accounts.general_ledger import make_gl_entries, delete_gl_entries
+from erpnext.stock.utils import get_posting_datetime
+from erpnext.stock.doctype.stock_repost_request.stock_repost_request import is_reposting_deferred
+from erpnext.accounts.general_ledger import make_gl_entries, delete_gl_entries, \
+	delete_voucher_gl_entries
 
 class StockController(AccountsController):
 	def make_gl_entries(self, repost_future_gle=True):
@@ -22,7 +26,7 @@ class StockController(AccountsController):
 				gl_entries = self.get_gl_entries(warehouse_account)
 				make_gl_entries(gl_entries)
 
-			if repost_future_gle:
+			if repost_future_gle and not is_reposting_deferred():
 				items, warehouse_account = self.get_items_and_warehouse_accounts(warehouse_account)
 				update_gl_entries_after(self.posting_date, self.posting_time,
 					warehouse_account, items)
@@ -136,68 +140,11 @@ class StockController(AccountsController):
 		return warehouse_account
 
 	def update_gl_entries_after(self, warehouse_account=None):
-		future_stock_vouchers = self.get_future_stock_vouchers()
-		gle = self.get_voucherwise_gl_entries(future_stock_vouchers)
-		if not warehouse_account:
-			warehouse_account = self.get_warehouse_account()
-		for voucher_type, voucher_no in future_stock_vouchers:
-			existing_gle = gle.get((voucher_type, voucher_no), [])
-			voucher_obj = frappe.get_doc(voucher_type, voucher_no)
-			expected_gle = voucher_obj.get_gl_entries(warehouse_account)
-			if expected_gle:
-				matched = True
-				if existing_gle:
-					for entry in expected_gle:
-						for e in existing_gle:
-							if entry.account==e.account \
-								and entry.against_account==e.against_account\
-								and entry.cost_center==e.cost_center:
-									if entry.debit != e.debit or entry.credit != e.credit:
-										matched = False
-										break
-				else:
-					matched = False
-
-				if not matched:
-					self.delete_gl_entries(voucher_type, voucher_no)
-					voucher_obj.make_gl_entries(repost_future_gle=False)
-			else:
-				self.delete_gl_entries(voucher_type, voucher_no)
-
-
-	def get_future_stock_vouchers(self):
-		future_stock_vouchers = []
-
-		if hasattr(self, "fname"):
-			item_list = [d.item_code for d in self.get(self.fname)]
-			condition = ''.join(['and item_code in (\'', '\', \''.join(item_list) ,'\')'])
-		else:
-			condition = ""
-
-		for d in frappe.db.sql("""select distinct sle.voucher_type, sle.voucher_no
-			from `tabStock Ledger Entry` sle
-			where timestamp(sle.posting_date, sle.posting_time) >= timestamp(%s, %s) %s
-			order by timestamp(sle.posting_date, sle.posting_time) asc, name asc""" %
-			('%s', '%s', condition), (self.posting_date, self.posting_time),
-			as_dict=True):
-				future_stock_vouchers.append([d.voucher_type, d.voucher_no])
-
-		return future_stock_vouchers
-
-	def get_voucherwise_gl_entries(self, future_stock_vouchers):
-		gl_entries = {}
-		if future_stock_vouchers:
-			for d in frappe.db.sql("""select * from `tabGL Entry`
-				where posting_date >= %s and voucher_no in (%s)""" %
-				('%s', ', '.join(['%s']*len(future_stock_vouchers))),
-				tuple([self.posting_date] + [d[1] for d in future_stock_vouchers]), as_dict=1):
-					gl_entries.setdefault((d.voucher_type, d.voucher_no), []).append(d)
-
-		return gl_entries
+		items, warehouse_account = self.get_items_and_warehouse_accounts(warehouse_account)
+		update_gl_entries_after(self.posting_date, self.posting_time, warehouse_account, items)
 
 	def delete_gl_entries(self, voucher_type, voucher_no):
-		frappe.db.sql("""delete from `tabGL Entry`
-			where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
+		delete_voucher_gl_entries(voucher_type, voucher_no)
 
 	def make_adjustment_entry(self, expected_gle, voucher_obj):
 		from erpnext.accounts.utils import get_stock_and_account_difference
@@ -273,69 +220,78 @@ class StockController(AccountsController):
 				self.make_gl_entries()
 
 def update_gl_entries_after(posting_date, posting_time, warehouse_account=None, for_items=None):
-	def _delete_gl_entries(voucher_type, voucher_no):
-		frappe.db.sql("""delete from `tabGL Entry`
-			where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
-
+	"""repost GL Entries of future stock vouchers whose stock value no longer matches
+		the amount booked against their warehouse accounts"""
 	if not warehouse_account:
 		warehouse_account = get_warehouse_account()
-	future_stock_vouchers = get_future_stock_vouchers(posting_date, posting_time,
+
+	for voucher_type, voucher_no in get_vouchers_with_stock_value_difference(posting_date,
+		posting_time, warehouse_account, for_items):
+			voucher_obj = frappe.get_doc(voucher_type, voucher_no)
+			delete_voucher_gl_entries(voucher_type, voucher_no)
+			voucher_obj.make_gl_entries(repost_future_gle=False)
+
+def get_vouchers_with_stock_value_difference(posting_date, posting_time, warehouse_account,
+	for_items=None):
+	"""future stock vouchers, for which the stock value difference of their ledger entries
+		differs from the balance of their GL Entries, per warehouse account"""
+	if not warehouse_account:
+		return []
+
+	expected = get_future_stock_value_difference(posting_date, posting_time,
 		warehouse_account, for_items)
-	gle = get_voucherwise_gl_entries(future_stock_vouchers, posting_date)
-
-	for voucher_type, voucher_no in future_stock_vouchers:
-		existing_gle = gle.get((voucher_type, voucher_no), [])
-		voucher_obj = frappe.get_doc(voucher_type, voucher_no)
-		expected_gle = voucher_obj.get_gl_entries(warehouse_account)
-		if expected_gle:
-			if not existing_gle or not compare_existing_and_expected_gle(existing_gle,
-				expected_gle):
-					_delete_gl_entries(voucher_type, voucher_no)
-					voucher_obj.make_gl_entries(repost_future_gle=False)
-		else:
-			_delete_gl_entries(voucher_type, voucher_no)
-
-def compare_existing_and_expected_gle(existing_gle, expected_gle):
-	matched = True
-	for entry in expected_gle:
-		for e in existing_gle:
-			if entry.account==e.account and entry.against_account==e.against_account \
-				and entry.cost_center==e.cost_center \
-				and (entry.debit != e.debit or entry.credit != e.credit):
-					matched = False
-					break
-	return matched
-
-def get_future_stock_vouchers(posting_date, posting_time, warehouse_account=None, for_items=None):
-	future_stock_vouchers = []
-
-	condition = ""
+	if not expected:
+		return []
+
+	existing = get_future_warehouse_account_balance(posting_date, warehouse_account.values())
+
+	vouchers = OrderedDict()
+	for (voucher_type, voucher_no, account), stock_value_difference in expected.items():
+		if flt(stock_value_difference, 2) != flt(existing.get((voucher_type, voucher_no, account)), 2):
+			vouchers[(voucher_type, voucher_no)] = True
+
+	return vouchers.keys()
+
+def get_future_stock_value_difference(posting_date, posting_time, warehouse_account, for_items=None):
+	"""stock value difference of future vouchers, keyed by voucher and warehouse account.
+		only vouchers having ledger entries for one of the items are considered"""
+	item_condition, values = "1", []
 	if for_items:
-		condition = ''.join([' and item_code in (\'', '\', \''.join(for_items) ,'\')'])
-
-	if warehouse_account:
-		condition += ''.join([' and warehouse in (\'', '\', \''.join(warehouse_account.keys()) ,'\')'])
-
-	for d in frappe.db.sql("""select distinct sle.voucher_type, sle.voucher_no
-		from `tabStock Ledger Entry` sle
-		where timestamp(sle.posting_date, sle.posting_time) >= timestamp(%s, %s) %s
-		order by timestamp(sle.posting_date, sle.posting_time) asc, name asc""" %
-		('%s', '%s', condition), (posting_date, posting_time),
-		as_dict=True):
-			future_stock_vouchers.append([d.voucher_type, d.voucher_no])
-
-	return future_stock_vouchers
-
-def get_voucherwise_gl_entries(future_stock_vouchers, posting_date):
-	gl_entries = {}
-	if future_stock_vouchers:
-		for d in frappe.db.sql("""select * from `tabGL Entry`
-			where posting_date >= %s and voucher_no in (%s)""" %
-			('%s', ', '.join(['%s']*len(future_stock_vouchers))),
-			tuple([posting_date] + [d[1] for d in future_stock_vouchers]), as_dict=1):
-				gl_entries.setdefault((d.voucher_type, d.voucher_no), []).append(d)
-
-	return gl_entries
+		item_condition = "item_code in (%s)" % ", ".join(["%s"] * len(for_items))
+		values = list(for_items)
+
+	values += [get_posting_datetime(posting_date, posting_time)] + warehouse_account.keys()
+
+	stock_value_difference = OrderedDict()
+	voucher_has_items = {}
+	for d in frappe.db.sql("""select voucher_type, voucher_no, warehouse,
+			sum(round(ifnull(stock_value_difference, 0), 2)) as stock_value_difference,
+			max(%s) as has_items
+		from `tabStock Ledger Entry`
+		where posting_datetime >= %s and warehouse in (%s)
+		and ifnull(is_cancelled, 'No')='No'
+		group by voucher_type, voucher_no, warehouse
+		order by min(posting_datetime), voucher_no""" % (item_condition, "%s",
+			", ".join(["%s"] * len(warehouse_account))), tuple(values), as_dict=1):
+			key = (d.voucher_type, d.voucher_no, warehouse_account[d.warehouse])
+			stock_value_difference[key] = flt(stock_value_difference.get(key)) + \
+				flt(d.stock_value_difference)
+
+			if d.has_items:
+				voucher_has_items[(d.voucher_type, d.voucher_no)] = True
+
+	return OrderedDict((key, value) for key, value in stock_value_difference.items()
+		if voucher_has_items.get(key[:2]))
+
+def get_future_warehouse_account_balance(posting_date, accounts):
+	"""balance of warehouse accounts booked by future vouchers, keyed by voucher and account"""
+	accounts = list(set(accounts))
+	return frappe._dict(((d[0], d[1], d[2]), flt(d[3])) for d in frappe.db.sql("""
+		select voucher_type, voucher_no, account, sum(ifnull(debit, 0)) - sum(ifnull(credit, 0))
+		from `tabGL Entry`
+		where posting_date >= %s and account in (%s)
+		group by voucher_type, voucher_no, account""" % ("%s", ", ".join(["%s"] * len(accounts))),
+		tuple([posting_date] + accounts)))
 
 def get_warehouse_account():
 	warehouse_account = dict(frappe.db.sql("""select master_name, name from tabAccount
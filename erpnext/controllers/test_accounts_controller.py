@@ -0,0 +1,180 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest, json
+from frappe.utils import flt, cint
+
+test_dependencies = ["Sales Invoice"]
+
+class TestTaxCalculation(unittest.TestCase):
+	"""compare taxes and totals with the item by item calculation they replaced"""
+	def test_exclusive_taxes(self):
+		self.check_against_legacy(self.get_invoice(2))
+
+	def test_inclusive_taxes(self):
+		self.check_against_legacy(self.get_invoice(3))
+
+	def test_item_tax_rate_and_repeated_items(self):
+		for record in (2, 3):
+			si = self.get_invoice(record)
+			for item in list(si.get("entries")):
+				row = item.as_dict()
+				row.update({"name": None, "idx": None, "qty": 7,
+					"item_tax_rate": json.dumps({"_Test Account Excise Duty - _TC": 10,
+						"_Test Account VAT - _TC": 0})})
+				si.append("entries", row)
+
+			self.check_against_legacy(si)
+
+	def test_discount_amount(self):
+		for record in (2, 3):
+			si = self.get_invoice(record)
+			si.discount_amount = 104.95
+			self.check_against_legacy(si)
+
+	def get_invoice(self, record):
+		from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import test_records
+		return frappe.copy_doc(test_records[record])
+
+	def check_against_legacy(self, si):
+		legacy = frappe.copy_doc(si)
+		legacy.calculate_taxes = lambda: legacy_calculate_taxes(legacy)
+		legacy.determine_exclusive_rate = lambda: legacy_determine_exclusive_rate(legacy)
+
+		si.calculate_taxes_and_totals()
+		legacy.calculate_taxes_and_totals()
+
+		for fieldname in ("net_total", "grand_total", "other_charges_total"):
+			self.assertEquals(si.get(fieldname), legacy.get(fieldname))
+
+		for item, legacy_item in zip(si.get("entries"), legacy.get("entries")):
+			for fieldname in ("base_amount", "base_rate", "base_price_list_rate"):
+				self.assertEquals(item.get(fieldname), legacy_item.get(fieldname))
+
+		for tax, legacy_tax in zip(si.get("other_charges"), legacy.get("other_charges")):
+			for fieldname in ("tax_amount", "tax_amount_after_discount_amount", "total",
+				"tax_amount_for_current_item", "grand_total_for_current_item",
+				"tax_fraction_for_current_item", "grand_total_fraction_for_current_item"):
+					self.assertEquals(tax.get(fieldname), legacy_tax.get(fieldname))
+
+			self.assertEquals(json.loads(tax.item_wise_tax_detail),
+				json.loads(legacy_tax.item_wise_tax_detail))
+
+def legacy_get_tax_rate(doc, tax, item_tax_map):
+	if item_tax_map.has_key(tax.account_head):
+		return flt(item_tax_map.get(tax.account_head), doc.precision("rate", tax))
+	else:
+		return tax.rate
+
+def legacy_calculate_taxes(doc):
+	actual_tax_dict = dict([[tax.idx, tax.rate] for tax in doc.tax_doclist
+		if tax.charge_type == "Actual"])
+
+	for n, item in enumerate(doc.item_doclist):
+		item_tax_map = doc._load_item_tax_rate(item.item_tax_rate)
+
+		for i, tax in enumerate(doc.tax_doclist):
+			tax_rate = legacy_get_tax_rate(doc, tax, item_tax_map)
+			current_tax_amount = 0.0
+
+			if tax.charge_type == "Actual":
+				actual = flt(tax.rate, doc.precision("tax_amount", tax))
+				current_tax_amount = (doc.net_total
+					and ((item.base_amount / doc.net_total) * actual)
+					or 0)
+			elif tax.charge_type == "On Net Total":
+				current_tax_amount = (tax_rate / 100.0) * item.base_amount
+			elif tax.charge_type == "On Previous Row Amount":
+				current_tax_amount = (tax_rate / 100.0) * \
+					doc.tax_doclist[cint(tax.row_id) - 1].tax_amount_for_current_item
+			elif tax.charge_type == "On Previous Row Total":
+				current_tax_amount = (tax_rate / 100.0) * \
+					doc.tax_doclist[cint(tax.row_id) - 1].grand_total_for_current_item
+
+			current_tax_amount = flt(current_tax_amount, doc.precision("tax_amount", tax))
+
+			key = item.item_code or item.item_name
+			if tax.item_wise_tax_detail.get(key):
+				item_wise_tax_amount = tax.item_wise_tax_detail[key][1] + current_tax_amount
+				tax.item_wise_tax_detail[key] = [tax_rate,item_wise_tax_amount]
+			else:
+				tax.item_wise_tax_detail[key] = [tax_rate,current_tax_amount]
+
+			if tax.charge_type == "Actual":
+				actual_tax_dict[tax.idx] -= current_tax_amount
+				if n == len(doc.item_doclist) - 1:
+					current_tax_amount += actual_tax_dict[tax.idx]
+
+			tax.tax_amount_for_current_item = current_tax_amount
+
+			if not doc.discount_amount_applied:
+				tax.tax_amount += current_tax_amount
+
+			tax.tax_amount_after_discount_amount += current_tax_amount
+
+			if getattr(tax, "category", None):
+				current_tax_amount = 0.0 if (tax.category == "Valuation") \
+					else current_tax_amount
+
+				current_tax_amount *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
+
+			if i==0:
+				tax.grand_total_for_current_item = flt(item.base_amount + current_tax_amount,
+					doc.precision("total", tax))
+			else:
+				tax.grand_total_for_current_item = \
+					flt(doc.tax_doclist[i-1].grand_total_for_current_item +
+						current_tax_amount, doc.precision("total", tax))
+
+			tax.total += tax.grand_total_for_current_item
+
+			if n == len(doc.item_doclist) - 1:
+				doc.round_off_totals(tax)
+
+				if i == (len(doc.tax_doclist) - 1) and doc.discount_amount_applied:
+					doc.adjust_discount_amount_loss(tax)
+
+def legacy_determine_exclusive_rate(doc):
+	if not any((cint(tax.included_in_print_rate) for tax in doc.tax_doclist)):
+		return
+
+	for item in doc.item_doclist:
+		item_tax_map = doc._load_item_tax_rate(item.item_tax_rate)
+		cumulated_tax_fraction = 0
+		for i, tax in enumerate(doc.tax_doclist):
+			current_tax_fraction = 0
+			if cint(tax.included_in_print_rate):
+				tax_rate = legacy_get_tax_rate(doc, tax, item_tax_map)
+				if tax.charge_type == "On Net Total":
+					current_tax_fraction = tax_rate / 100.0
+				elif tax.charge_type == "On Previous Row Amount":
+					current_tax_fraction = (tax_rate / 100.0) * \
+						doc.tax_doclist[cint(tax.row_id) - 1].tax_fraction_for_current_item
+				elif tax.charge_type == "On Previous Row Total":
+					current_tax_fraction = (tax_rate / 100.0) * \
+						doc.tax_doclist[cint(tax.row_id) - 1].grand_total_fraction_for_current_item
+
+			tax.tax_fraction_for_current_item = current_tax_fraction
+
+			if i==0:
+				tax.grand_total_fraction_for_current_item = 1 + tax.tax_fraction_for_current_item
+			else:
+				tax.grand_total_fraction_for_current_item = \
+					doc.tax_doclist[i-1].grand_total_fraction_for_current_item \
+					+ tax.tax_fraction_for_current_item
+
+			cumulated_tax_fraction += tax.tax_fraction_for_current_item
+
+		if cumulated_tax_fraction and not doc.discount_amount_applied:
+			item.base_amount = flt((item.amount * doc.conversion_rate) /
+				(1 + cumulated_tax_fraction), doc.precision("base_amount", item))
+
+			item.base_rate = flt(item.base_amount / item.qty, doc.precision("base_rate", item))
+
+			if item.discount_percentage == 100:
+				item.base_price_list_rate = item.base_rate
+				item.base_rate = 0.0
+			else:
+				item.base_price_list_rate = flt(item.base_rate / (1 - (item.discount_percentage / 100.0)),
+					doc.precision("base_price_list_rate", item))
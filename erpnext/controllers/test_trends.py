@@ -0,0 +1,43 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest
+from frappe.utils import flt
+from erpnext.controllers.trends import get_columns, get_data
+
+test_dependencies = ["Sales Order"]
+
+class TestTrends(unittest.TestCase):
+	def test_group_rows_add_up_to_based_on_row(self):
+		from erpnext.selling.doctype.sales_order.test_sales_order import test_records
+		so = frappe.copy_doc(test_records[0])
+		so.insert()
+		so.submit()
+
+		filters = frappe._dict({"company": "_Test Company", "fiscal_year": "_Test Fiscal Year 2013",
+			"period": "Monthly", "based_on": "Customer", "group_by": "Item"})
+		conditions = get_columns(filters, "Sales Order")
+		data = get_data(filters, conditions)
+
+		for row in data:
+			self.assertEquals(len(row), len(conditions["columns"]))
+
+		customer_index = [i for i, row in enumerate(data) if row[0]=="_Test Customer"][0]
+		customer_row = data[customer_index]
+		item_rows = []
+		for row in data[customer_index + 1:]:
+			if row[0]:
+				break
+			item_rows.append(row)
+
+		self.assertTrue("_Test Item Home Desktop 100" in [row[2] for row in item_rows])
+
+		# period columns start after customer, territory and item
+		for i in xrange(3, len(customer_row)):
+			self.assertAlmostEquals(flt(customer_row[i]), sum([flt(row[i]) for row in item_rows]))
+
+		# february of the fiscal year starting in january
+		self.assertTrue(flt(customer_row[5]) >= 10)
+		self.assertAlmostEquals(flt(customer_row[-2]), sum([flt(customer_row[i])
+			for i in xrange(3, len(customer_row) - 2, 2)]))
@@ -3,7 +3,8 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import getdate
+from collections import OrderedDict
+from frappe.utils import getdate, flt, cint
 from frappe import _
 
 def get_columns(filters, trans):
@@ -12,18 +13,18 @@ def get_columns(filters, trans):
 	# get conditions for based_on filter cond
 	based_on_details = based_wise_colums_query(filters.get("based_on"), trans)
 	# get conditions for periodic filter cond
-	period_cols, period_select = period_wise_colums_query(filters, trans)
+	period_cols, period_date_ranges = period_wise_colums_query(filters, trans)
 	# get conditions for grouping filter cond
 	group_by_cols = group_wise_column(filters.get("group_by"))
 
-	columns = based_on_details["based_on_cols"] + period_cols + ["Total(Qty):Float:120", "Total(Amt):Currency:120"]
-	if group_by_cols:
-		columns = based_on_details["based_on_cols"] + group_by_cols + period_cols + \
-			["Total(Qty):Float:120", "Total(Amt):Currency:120"]
+	columns = based_on_details["based_on_cols"] + group_by_cols + period_cols + \
+		["Total(Qty):Float:120", "Total(Amt):Currency:120"]
 
-	conditions = {"based_on_select": based_on_details["based_on_select"], "period_wise_select": period_select,
-		"columns": columns, "group_by": based_on_details["based_on_group_by"], "grbc": group_by_cols, "trans": trans,
-		"addl_tables": based_on_details["addl_tables"]}
+	conditions = {"based_on_select": based_on_details["based_on_select"],
+		"based_on_cols": based_on_details["based_on_cols"], "period_date_ranges": period_date_ranges,
+		"trans_date": get_trans_date(trans), "columns": columns, "group_by": based_on_details["based_on_group_by"],
+		"grbc": group_by_cols, "trans": trans, "addl_tables": based_on_details["addl_tables"],
+		"addl_conditions": based_on_details.get("addl_conditions", "")}
 
 	return conditions
 
@@ -36,106 +37,108 @@ def validate_filters(filters):
 		frappe.throw(_("'Based On' and 'Group By' can not be same"))
 
 def get_data(filters, conditions):
+	"""a row per based on value with its period-wise and total quantity and amount,
+		followed by a row per group by value under it, if grouped.
+
+		quantity and amount of each (based on, group by, period) are fetched in one
+		grouped query and pivoted into the period columns here"""
+	group_by_field = get_group_by_field(filters.get("group_by"))
+	based_on_count = len(conditions["based_on_cols"])
+	period_start = based_on_count + len(conditions["grbc"])
+	row_length = len(conditions["columns"])
+
+	based_on_rows = OrderedDict()
+	for d in get_period_wise_aggregates(filters, conditions, group_by_field):
+		period, qty, amount = d[-3:]
+
+		if d[0] not in based_on_rows:
+			row = list(d[:based_on_count]) + [None] * (row_length - based_on_count)
+			if group_by_field:
+				row[based_on_count] = ""
+			based_on_rows[d[0]] = (row, OrderedDict())
+
+		row, group_rows = based_on_rows[d[0]]
+		add_to_row(row, period, qty, amount, period_start)
+
+		if group_by_field:
+			group_value = d[based_on_count]
+			if group_value not in group_rows:
+				group_rows[group_value] = [""] * based_on_count + [group_value] + \
+					[None] * (row_length - based_on_count - 1)
+
+			add_to_row(group_rows[group_value], period, qty, amount, period_start)
+
 	data = []
-	inc, cond= '',''
-	query_details =  conditions["based_on_select"] + conditions["period_wise_select"]
-
-	if conditions["based_on_select"] in ["t1.project_name,", "t2.project_name,"]:
-		cond = 'and '+ conditions["based_on_select"][:-1] +' IS Not NULL'
-
-	if filters.get("group_by"):
-		sel_col = ''
-		ind = conditions["columns"].index(conditions["grbc"][0])
-
-		if filters.get("group_by") == 'Item':
-			sel_col = 't2.item_code'
-		elif filters.get("group_by") == 'Customer':
-			sel_col = 't1.customer'
-		elif filters.get("group_by") == 'Supplier':
-			sel_col = 't1.supplier'
-
-		if filters.get('based_on') in ['Item','Customer','Supplier']:
-			inc = 2
-		else :
-			inc = 1
-		data1 = frappe.db.sql(""" select %s from `tab%s` t1, `tab%s Item` t2 %s
-					where t2.parent = t1.name and t1.company = %s and t1.fiscal_year = %s and
-					t1.docstatus = 1 %s
-					group by %s
-				""" % (query_details,  conditions["trans"],  conditions["trans"], conditions["addl_tables"], "%s",
-					"%s", cond, conditions["group_by"]), (filters.get("company"),
-					filters["fiscal_year"]),as_list=1)
-
-		for d in range(len(data1)):
-			#to add blanck column
-			dt = data1[d]
-			dt.insert(ind,'')
-			data.append(dt)
-
-			#to get distinct value of col specified by group_by in filter
-			row = frappe.db.sql("""select DISTINCT(%s) from `tab%s` t1, `tab%s Item` t2 %s
-						where t2.parent = t1.name and t1.company = %s and t1.fiscal_year = %s
-						and t1.docstatus = 1 and %s = %s
-					""" %
-					(sel_col,  conditions["trans"],  conditions["trans"], conditions["addl_tables"],
-						"%s", "%s", conditions["group_by"], "%s"),
-					(filters.get("company"), filters.get("fiscal_year"), data1[d][0]), as_list=1)
-
-			for i in range(len(row)):
-				des = ['' for q in range(len(conditions["columns"]))]
-
-				#get data for group_by filter
-				row1 = frappe.db.sql(""" select %s , %s from `tab%s` t1, `tab%s Item` t2 %s
-							where t2.parent = t1.name and t1.company = %s and t1.fiscal_year = %s
-							and t1.docstatus = 1 and %s = %s and %s = %s
-						""" %
-						(sel_col, conditions["period_wise_select"], conditions["trans"],
-						 	conditions["trans"], conditions["addl_tables"], "%s", "%s", sel_col,
-							"%s", conditions["group_by"], "%s"),
-						(filters.get("company"), filters.get("fiscal_year"), row[i][0],
-							data1[d][0]), as_list=1)
-
-				des[ind] = row[i]
-				for j in range(1,len(conditions["columns"])-inc):
-					des[j+inc] = row1[0][j]
-
-				data.append(des)
-	else:
-		data = frappe.db.sql(""" select %s from `tab%s` t1, `tab%s Item` t2 %s
-					where t2.parent = t1.name and t1.company = %s and t1.fiscal_year = %s and
-					t1.docstatus = 1 %s
-					group by %s
-				""" %
-				(query_details, conditions["trans"], conditions["trans"], conditions["addl_tables"],
-					"%s", "%s", cond,conditions["group_by"]),
-				(filters.get("company"), filters.get("fiscal_year")), as_list=1)
+	for row, group_rows in based_on_rows.values():
+		data.append(row)
+		data.extend(group_rows.values())
 
 	return data
 
+def get_period_wise_aggregates(filters, conditions, group_by_field=None):
+	"""rows of based on values, group by value (if grouped), period index,
+		quantity and amount. period index is None for dates outside the periods"""
+	values = []
+	period_cases = []
+	for i, (from_date, to_date) in enumerate(conditions["period_date_ranges"]):
+		period_cases.append("when t1.{0} between %s and %s then {1}".format(conditions["trans_date"], i))
+		values += [from_date, to_date]
+
+	values += [filters.get("company"), filters.get("fiscal_year")]
+
+	group_by = conditions["group_by"] + (", " + group_by_field if group_by_field else "")
+
+	return frappe.db.sql("""select {based_on_select} {group_by_select}
+			case {period_cases} end as period, sum(t2.qty), sum(t1.grand_total)
+		from `tab{trans}` t1, `tab{trans} Item` t2 {addl_tables}
+		where t2.parent = t1.name and t1.company = %s and t1.fiscal_year = %s
+			and t1.docstatus = 1 {addl_conditions}
+		group by {group_by}, period
+		order by {group_by}, period""".format(based_on_select=conditions["based_on_select"],
+			group_by_select=(group_by_field + ",") if group_by_field else "",
+			period_cases=" ".join(period_cases), trans=conditions["trans"],
+			addl_tables=conditions["addl_tables"], addl_conditions=conditions["addl_conditions"],
+			group_by=group_by), tuple(values))
+
+def add_to_row(row, period, qty, amount, period_start):
+	"""add quantity and amount to the period's columns and to the totals,
+		the last two columns"""
+	indexes = [len(row) - 2]
+	if period is not None:
+		indexes.append(period_start + cint(period) * 2)
+
+	for i in indexes:
+		row[i] = flt(row[i]) + flt(qty)
+		row[i + 1] = flt(row[i + 1]) + flt(amount)
+
+def get_group_by_field(group_by):
+	return {
+		"Item": "t2.item_code",
+		"Customer": "t1.customer",
+		"Supplier": "t1.supplier"
+	}.get(group_by)
+
+def get_trans_date(trans):
+	if trans in ['Purchase Receipt', 'Delivery Note', 'Purchase Invoice', 'Sales Invoice']:
+		return 'posting_date'
+	else:
+		return 'transaction_date'
+
 def get_mon(dt):
 	return getdate(dt).strftime("%b")
 
 def period_wise_colums_query(filters, trans):
-	query_details = ''
 	pwc = []
 	bet_dates = get_period_date_ranges(filters.get("period"), filters.get("fiscal_year"))
 
-	if trans in ['Purchase Receipt', 'Delivery Note', 'Purchase Invoice', 'Sales Invoice']:
-		trans_date = 'posting_date'
-	else:
-		trans_date = 'transaction_date'
-
 	if filters.get("period") != 'Yearly':
 		for dt in bet_dates:
 			get_period_wise_columns(dt, filters.get("period"), pwc)
-			query_details = get_period_wise_query(dt, trans_date, query_details)
 	else:
 		pwc = [filters.get("fiscal_year") + " (Qty):Float:120",
 			filters.get("fiscal_year") + " (Amt):Currency:120"]
-		query_details = " SUM(t2.qty), SUM(t1.grand_total),"
 
-	query_details += 'SUM(t2.qty), SUM(t1.grand_total)'
-	return pwc, query_details
+	return pwc, bet_dates
 
 def get_period_wise_columns(bet_dates, period, pwc):
 	if period == 'Monthly':
@@ -145,12 +148,6 @@ def get_period_wise_columns(bet_dates, period, pwc):
 		pwc += [get_mon(bet_dates[0]) + "-" + get_mon(bet_dates[1]) + " (Qty):Float:120",
 			get_mon(bet_dates[0]) + "-" + get_mon(bet_dates[1]) + " (Amt):Currency:120"]
 
-def get_period_wise_query(bet_dates, trans_date, query_details):
-	query_details += """SUM(IF(t1.%(trans_date)s BETWEEN '%(sd)s' AND '%(ed)s', t2.qty, NULL)),
-					SUM(IF(t1.%(trans_date)s BETWEEN '%(sd)s' AND '%(ed)s', t1.grand_total, NULL)),
-				""" % {"trans_date": trans_date, "sd": bet_dates[0],"ed": bet_dates[1]}
-	return query_details
-
 @frappe.whitelist(allow_guest=True)
 def get_period_date_ranges(period, fiscal_year=None, year_start_date=None):
 	from dateutil.relativedelta import relativedelta
@@ -224,12 +221,14 @@ def based_wise_colums_query(based_on, trans):
 		based_on_details["based_on_select"] = "t1.supplier, t3.supplier_type,"
 		based_on_details["based_on_group_by"] = 't1.supplier'
 		based_on_details["addl_tables"] = ',`tabSupplier` t3'
+		based_on_details["addl_conditions"] = ' and t3.name = t1.supplier'
 
 	elif based_on == 'Supplier Type':
 		based_on_details["based_on_cols"] = ["Supplier Type:Link/Supplier Type:140"]
 		based_on_details["based_on_select"] = "t3.supplier_type,"
 		based_on_details["based_on_group_by"] = 't3.supplier_type'
-		based_on_details["addl_tables"] =',`tabSupplier` t3'
+		based_on_details["addl_tables"] = ',`tabSupplier` t3'
+		based_on_details["addl_conditions"] = ' and t3.name = t1.supplier'
 
 	elif based_on == "Territory":
 		based_on_details["based_on_cols"] = ["Territory:Link/Territory:120"]
@@ -243,11 +242,13 @@ def based_wise_colums_query(based_on, trans):
 			based_on_details["based_on_select"] = "t1.project_name,"
 			based_on_details["based_on_group_by"] = 't1.project_name'
 			based_on_details["addl_tables"] = ''
+			based_on_details["addl_conditions"] = ' and t1.project_name is not null'
 		elif trans in ['Purchase Order', 'Purchase Invoice', 'Purchase Receipt']:
 			based_on_details["based_on_cols"] = ["Project:Link/Project:120"]
 			based_on_details["based_on_select"] = "t2.project_name,"
 			based_on_details["based_on_group_by"] = 't2.project_name'
 			based_on_details["addl_tables"] = ''
+			based_on_details["addl_conditions"] = ' and t2.project_name is not null'
 		else:
 			frappe.throw(_("Project-wise data is not available for Quotation"))
 
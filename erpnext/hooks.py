@@ -48,6 +48,54 @@ doc_events = {
 	},
 	"User": {
 		"on_update": "erpnext.hr.doctype.employee.employee.update_user_default"
+	},
+	"Item Group": {
+		"on_update": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index",
+		"on_trash": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index",
+		"after_rename": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index"
+	},
+	"Customer Group": {
+		"on_update": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index",
+		"on_trash": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index",
+		"after_rename": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index"
+	},
+	"Territory": {
+		"on_update": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index",
+		"on_trash": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index",
+		"after_rename": "erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index"
+	},
+	"Item": {
+		"on_update": "erpnext.utilities.master_data.clear_master_cache",
+		"on_cancel": "erpnext.utilities.master_data.clear_master_cache",
+		"on_trash": "erpnext.utilities.master_data.clear_master_cache",
+		"after_rename": [
+			"erpnext.utilities.master_data.clear_master_cache",
+			"erpnext.accounts.doctype.pricing_rule.pricing_rule.clear_pricing_rule_index"
+		]
+	},
+	"Account": {
+		"on_update": "erpnext.utilities.master_data.clear_master_cache",
+		"on_cancel": "erpnext.utilities.master_data.clear_master_cache",
+		"on_trash": "erpnext.utilities.master_data.clear_master_cache",
+		"after_rename": "erpnext.utilities.master_data.clear_master_cache"
+	},
+	"Cost Center": {
+		"on_update": "erpnext.utilities.master_data.clear_master_cache",
+		"on_cancel": "erpnext.utilities.master_data.clear_master_cache",
+		"on_trash": "erpnext.utilities.master_data.clear_master_cache",
+		"after_rename": "erpnext.utilities.master_data.clear_master_cache"
+	},
+	"Company": {
+		"on_update": "erpnext.utilities.master_data.clear_master_cache",
+		"on_cancel": "erpnext.utilities.master_data.clear_master_cache",
+		"on_trash": "erpnext.utilities.master_data.clear_master_cache",
+		"after_rename": "erpnext.utilities.master_data.clear_master_cache"
+	},
+	"Warehouse": {
+		"on_update": "erpnext.utilities.master_data.clear_master_cache",
+		"on_cancel": "erpnext.utilities.master_data.clear_master_cache",
+		"on_trash": "erpnext.utilities.master_data.clear_master_cache",
+		"after_rename": "erpnext.utilities.master_data.clear_master_cache"
 	}
 }
 
@@ -55,7 +103,9 @@ scheduler_events = {
 	"all": [
 		"erpnext.support.doctype.support_ticket.get_support_mails.get_support_mails",
 		"erpnext.hr.doctype.job_applicant.get_job_applications.get_job_applications",
-		"erpnext.selling.doctype.lead.get_leads.get_leads"
+		"erpnext.selling.doctype.lead.get_leads.get_leads",
+		"erpnext.stock.doctype.stock_repost_request.stock_repost_request.process_repost_queue",
+		"erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot.rebuild_pending_snapshots"
 	],
 	"daily": [
 		"erpnext.accounts.doctype.sales_invoice.sales_invoice.manage_recurring_invoices",
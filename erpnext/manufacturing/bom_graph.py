@@ -0,0 +1,307 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+"""
+	All BOMs that are not cancelled, with their materials, loaded in two queries.
+	While saving a BOM, only it and its sub-assemblies are loaded, a level of the
+	tree per query.
+
+	Recursion is found with a topological sort of the sub-assembly links.
+	Costs and exploded items are rolled up from the leaves, so that each
+	sub-assembly is computed once however many BOMs use it, and the results
+	for all affected BOMs are written in one batch.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import flt, now
+from erpnext.utilities import bulk_insert
+
+class BOMRecursionError(frappe.ValidationError): pass
+
+class BOMGraph(object):
+	def __init__(self, boms=None):
+		"""the whole graph, or with `boms`, only they and their sub-assemblies"""
+		self.boms = {}
+		self.materials = {}
+		self.parents = {}
+		self.exploded_items = {}
+		self.load(boms)
+
+	def load(self, boms=None):
+		if boms is None:
+			self.load_boms()
+			return
+
+		# one level of sub-assemblies at a time
+		requested = set()
+		while boms:
+			boms = [bom for bom in set(boms) if bom not in requested]
+			requested.update(boms)
+
+			children = []
+			for i in xrange(0, len(boms), 1000):
+				children.extend(self.load_boms(boms[i:i + 1000]))
+			boms = children
+
+	def load_boms(self, names=None):
+		"""load BOMs (all, or `names`) and their materials, returns the sub-assemblies used"""
+		bom_condition = parent_condition = ""
+		values = tuple(names or [])
+		if names is not None:
+			placeholders = ", ".join(["%s"] * len(names))
+			bom_condition = " and name in ({0})".format(placeholders)
+			parent_condition = " and parent in ({0})".format(placeholders)
+
+		for d in frappe.db.sql("""select name, item, quantity, is_active, docstatus,
+				rm_cost_as_per, buying_price_list, operating_cost, raw_material_cost, total_cost
+			from `tabBOM` where docstatus < 2 {0}""".format(bom_condition), values, as_dict=True):
+				self.boms[d.name] = d
+				self.materials[d.name] = []
+
+		children = []
+		for d in frappe.db.sql("""select name, parent, item_code, bom_no, qty, rate,
+				description, stock_uom
+			from `tabBOM Item` where parenttype='BOM' and docstatus < 2 {0}
+			order by parent, idx""".format(parent_condition), values, as_dict=True):
+				if d.parent in self.materials:
+					self.materials[d.parent].append(d)
+					if d.bom_no:
+						self.parents.setdefault(d.bom_no, set()).add(d.parent)
+						children.append(d.bom_no)
+
+		return children
+
+	def get_children(self, bom):
+		children = []
+		for d in self.materials.get(bom, []):
+			if d.bom_no and d.bom_no not in children:
+				children.append(d.bom_no)
+		return children
+
+	def get_order(self, boms):
+		"""`boms` and all their sub-assemblies, children before parents"""
+		order, done = [], set()
+		for root in boms:
+			if root in done:
+				continue
+
+			# depth first, with the children left to visit of each BOM on the path
+			stack, path = [(root, iter(self.get_children(root)))], set([root])
+			while stack:
+				bom, children = stack[-1]
+				for child in children:
+					if child in path:
+						frappe.throw(_("BOM recursion: {0} cannot be parent or child of {1}").format(child, bom),
+							BOMRecursionError)
+					if child not in done:
+						stack.append((child, iter(self.get_children(child))))
+						path.add(child)
+						break
+				else:
+					stack.pop()
+					path.discard(bom)
+					done.add(bom)
+					order.append(bom)
+
+		return order
+
+	def get_ancestors(self, boms):
+		"""`boms` and all BOMs using them, directly or through other sub-assemblies"""
+		ancestors, count = list(boms), 0
+		while count < len(ancestors):
+			for parent in sorted(self.parents.get(ancestors[count], [])):
+				if parent not in ancestors:
+					ancestors.append(parent)
+			count += 1
+
+		return ancestors
+
+	def get_unit_cost(self, bom):
+		bom = self.boms.get(bom)
+		if not (bom and bom.is_active and flt(bom.quantity)):
+			return 0.0
+		return flt(bom.total_cost) / flt(bom.quantity)
+
+	def get_exploded_items(self, bom):
+		"""raw materials of a BOM for its quantity, with submitted sub-assemblies replaced
+			by their own raw materials"""
+		for b in self.get_order([bom]):
+			if b not in self.exploded_items:
+				self.explode(b)
+
+		return self.exploded_items[bom]
+
+	def explode(self, bom):
+		exploded_items = frappe._dict()
+		item_codes = []
+
+		def _add(d, qty):
+			if d.item_code in exploded_items:
+				exploded_items[d.item_code].qty += qty
+			else:
+				item_codes.append(d.item_code)
+				exploded_items[d.item_code] = frappe._dict({
+					"item_code": d.item_code,
+					"description": d.description,
+					"stock_uom": d.stock_uom,
+					"qty": qty,
+					"rate": flt(d.rate)
+				})
+
+		for d in self.materials.get(bom, []):
+			if d.bom_no:
+				child = self.boms.get(d.bom_no)
+				if not (child and child.docstatus == 1 and flt(child.quantity)):
+					continue
+				for item in self.exploded_items[d.bom_no]:
+					_add(item, flt(item.qty) / flt(child.quantity) * flt(d.qty))
+			else:
+				_add(d, flt(d.qty))
+
+		self.exploded_items[bom] = [exploded_items[item_code] for item_code in item_codes]
+
+	def update_boms(self, boms):
+		"""recompute rates, costs and exploded items of `boms`, their sub-assemblies and
+			all BOMs using them, and write them in one batch"""
+		order = [bom for bom in self.get_order(self.get_ancestors(boms)) if bom in self.boms]
+		rates = MaterialRates([d for bom in order for d in self.materials[bom] if not d.bom_no])
+
+		for bom in order:
+			self.calculate_cost(bom, rates)
+			self.explode(bom)
+
+		self.write(order)
+		return order
+
+	def calculate_cost(self, bom, rates):
+		bom = self.boms[bom]
+		bom.raw_material_cost = 0.0
+		for d in self.materials[bom.name]:
+			d.rate = self.get_unit_cost(d.bom_no) if d.bom_no else rates.get_rate(bom, d.item_code)
+			d.amount = flt(d.rate) * flt(d.qty)
+			d.qty_consumed_per_unit = flt(d.qty) / flt(bom.quantity) if flt(bom.quantity) else 0.0
+			bom.raw_material_cost += d.amount
+
+		bom.total_cost = bom.raw_material_cost + flt(bom.operating_cost)
+
+	def write(self, boms):
+		timestamp = now()
+		for bom in boms:
+			self.boms[bom].modified = timestamp
+
+		update_in_batch("BOM", [self.boms[bom] for bom in boms],
+			["raw_material_cost", "total_cost", "modified"])
+		update_in_batch("BOM Item", [d for bom in boms for d in self.materials[bom]],
+			["rate", "amount", "qty_consumed_per_unit"])
+
+		exploded_items = {}
+		for bom in boms:
+			bom = self.boms[bom]
+			for idx, item in enumerate(self.exploded_items[bom.name]):
+				exploded_items.setdefault(bom.docstatus, []).append({
+					"parent": bom.name,
+					"parentfield": "flat_bom_details",
+					"parenttype": "BOM",
+					"idx": idx + 1,
+					"item_code": item.item_code,
+					"description": item.description,
+					"stock_uom": item.stock_uom,
+					"qty": item.qty,
+					"rate": item.rate,
+					"amount": flt(item.qty) * flt(item.rate),
+					"qty_consumed_per_unit": flt(item.qty) / flt(bom.quantity) if flt(bom.quantity) else 0.0
+				})
+
+		for i in xrange(0, len(boms), 500):
+			chunk = boms[i:i + 500]
+			frappe.db.sql("""delete from `tabBOM Explosion Item` where parent in ({0})""".format(
+				", ".join(["%s"] * len(chunk))), tuple(chunk))
+
+		for docstatus, rows in exploded_items.items():
+			bulk_insert("BOM Explosion Item", rows, docstatus=docstatus)
+
+class MaterialRates(object):
+	"""raw material rates for each basis of BOM costing, fetched once for all materials"""
+	def __init__(self, materials):
+		self.item_codes = list(set(d.item_code for d in materials))
+		self.items = get_item_rate_details(self.item_codes)
+		self.valuation_rates = None
+		self.price_list_rates = {}
+
+	def get_rate(self, bom, item_code):
+		item = self.items.get(item_code)
+		if not (item and (item.is_purchase_item == "Yes" or item.is_sub_contracted_item == "Yes")):
+			return 0.0
+
+		if bom.rm_cost_as_per == "Valuation Rate":
+			if self.valuation_rates is None:
+				self.valuation_rates = get_valuation_rates(self.item_codes)
+			return self.valuation_rates.get(item_code, 0.0)
+
+		elif bom.rm_cost_as_per == "Last Purchase Rate":
+			return flt(item.last_purchase_rate)
+
+		elif bom.rm_cost_as_per == "Price List":
+			if not bom.buying_price_list:
+				frappe.throw(_("Please select Price List"))
+			if bom.buying_price_list not in self.price_list_rates:
+				self.price_list_rates[bom.buying_price_list] = get_price_list_rates(
+					bom.buying_price_list, self.item_codes)
+			return self.price_list_rates[bom.buying_price_list].get(item_code, 0.0)
+
+		elif bom.rm_cost_as_per == "Standard Rate":
+			return flt(item.standard_rate)
+
+		return 0.0
+
+def get_item_rate_details(item_codes, chunk_size=1000):
+	items = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		chunk = item_codes[i:i + chunk_size]
+		for d in frappe.db.sql("""select name, is_purchase_item, is_sub_contracted_item,
+				last_purchase_rate, standard_rate
+			from `tabItem` where name in ({0})""".format(", ".join(["%s"] * len(chunk))),
+			tuple(chunk), as_dict=True):
+				items[d.name] = d
+
+	return items
+
+def get_valuation_rates(item_codes, chunk_size=1000):
+	"""average of the current non-zero valuation rates of each item across warehouses"""
+	valuation_rates = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		chunk = item_codes[i:i + chunk_size]
+		valuation_rates.update(dict(((item_code, flt(rate)) for item_code, rate in
+			frappe.db.sql("""select item_code, avg(valuation_rate) from `tabBin`
+				where item_code in ({0}) and ifnull(valuation_rate, 0) != 0
+				group by item_code""".format(", ".join(["%s"] * len(chunk))), tuple(chunk)))))
+
+	return valuation_rates
+
+def get_price_list_rates(price_list, item_codes, chunk_size=1000):
+	price_list_rates = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		chunk = item_codes[i:i + chunk_size]
+		for item_code, rate in frappe.db.sql("""select item_code, price_list_rate
+			from `tabItem Price` where price_list=%s and item_code in ({0})
+			order by modified""".format(", ".join(["%s"] * len(chunk))), tuple([price_list] + chunk)):
+				price_list_rates[item_code] = flt(rate)
+
+	return price_list_rates
+
+def update_in_batch(doctype, rows, fields, chunk_size=500):
+	"""set `fields` of many records with one update statement per chunk"""
+	for i in xrange(0, len(rows), chunk_size):
+		chunk = rows[i:i + chunk_size]
+		assignments, values = [], []
+		for fieldname in fields:
+			assignments.append("`{0}` = case name {1} else `{0}` end".format(fieldname,
+				" ".join(["when %s then %s"] * len(chunk))))
+			for d in chunk:
+				values.extend([d.name, d.get(fieldname)])
+
+		values.extend([d.name for d in chunk])
+		frappe.db.sql("""update `tab{0}` set {1} where name in ({2})""".format(doctype,
+			", ".join(assignments), ", ".join(["%s"] * len(chunk))), tuple(values))
@@ -3,10 +3,11 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import cint, cstr, flt, now, nowdate
+from frappe.utils import cint, cstr, flt
 
 from frappe import _
 from frappe.model.document import Document
+from erpnext.manufacturing.bom_graph import BOMGraph, get_valuation_rates
 
 class BOM(Document):
 
@@ -33,8 +34,9 @@ class BOM(Document):
 		self.calculate_cost()
 
 	def on_update(self):
-		self.check_recursion()
-		self.update_exploded_items()
+		graph = BOMGraph([self.name])
+		self.check_recursion(graph)
+		self.update_exploded_items(graph)
 
 	def on_submit(self):
 		self.manage_default_bom()
@@ -138,22 +140,7 @@ class BOM(Document):
 			as per valuation method (MAR/FIFO)
 			as on costing date
 		"""
-		from erpnext.stock.utils import get_incoming_rate
-		posting_date, posting_time = nowdate(), now().split()[1]
-		warehouse = frappe.db.sql("select warehouse from `tabBin` where item_code = %s", args['item_code'])
-		rate = []
-		for wh in warehouse:
-			r = get_incoming_rate({
-				"item_code": args.get("item_code"),
-				"warehouse": wh[0],
-				"posting_date": posting_date,
-				"posting_time": posting_time,
-				"qty": args.get("qty") or 0
-			})
-			if r:
-				rate.append(r)
-
-		return rate and flt(sum(rate))/len(rate) or 0
+		return get_valuation_rates([args["item_code"]]).get(args["item_code"], 0)
 
 	def manage_default_bom(self):
 		""" Uncheck others if current one is selected as default,
@@ -237,46 +224,14 @@ class BOM(Document):
 		else:
 			check_list.append([cstr(item), cstr(op)])
 
-	def check_recursion(self):
+	def check_recursion(self, graph=None):
 		""" Check whether recursion occurs in any bom"""
+		(graph or BOMGraph([self.name])).get_order([self.name])
 
-		check_list = [['parent', 'bom_no', 'parent'], ['bom_no', 'parent', 'child']]
-		for d in check_list:
-			bom_list, count = [self.name], 0
-			while (len(bom_list) > count ):
-				boms = frappe.db.sql(" select %s from `tabBOM Item` where %s = %s " %
-					(d[0], d[1], '%s'), cstr(bom_list[count]))
-				count = count + 1
-				for b in boms:
-					if b[0] == self.name:
-						frappe.throw(_("BOM recursion: {0} cannot be parent or child of {2}").format(b[0], self.name))
-					if b[0]:
-						bom_list.append(b[0])
-
-	def update_cost_and_exploded_items(self, bom_list=[]):
-		bom_list = self.traverse_tree(bom_list)
-		for bom in bom_list:
-			bom_obj = frappe.get_doc("BOM", bom)
-			bom_obj.on_update()
-
-		return bom_list
-
-	def traverse_tree(self, bom_list=[]):
-		def _get_children(bom_no):
-			return [cstr(d[0]) for d in frappe.db.sql("""select bom_no from `tabBOM Item`
-				where parent = %s and ifnull(bom_no, '') != ''""", bom_no)]
-
-		count = 0
-		if self.name not in bom_list:
-			bom_list.append(self.name)
-
-		while(count < len(bom_list)):
-			for child_bom in _get_children(bom_list[count]):
-				if child_bom not in bom_list:
-					bom_list.append(child_bom)
-			count += 1
-		bom_list.reverse()
-		return bom_list
+	def update_cost_and_exploded_items(self):
+		"""Update costs and exploded items of this BOM, its sub-assemblies and
+			all BOMs using it"""
+		return BOMGraph().update_boms([self.name])
 
 	def calculate_cost(self):
 		"""Calculate bom totals"""
@@ -307,47 +262,14 @@ class BOM(Document):
 
 		self.raw_material_cost = total_rm_cost
 
-	def update_exploded_items(self):
+	def update_exploded_items(self, graph=None):
 		""" Update Flat BOM, following will be correct data"""
-		self.get_exploded_items()
+		self.get_exploded_items(graph)
 		self.add_exploded_items()
 
-	def get_exploded_items(self):
+	def get_exploded_items(self, graph=None):
 		""" Get all raw materials including items from child bom"""
-		self.cur_exploded_items = {}
-		for d in self.get('bom_materials'):
-			if d.bom_no:
-				self.get_child_exploded_items(d.bom_no, d.qty)
-			else:
-				self.add_to_cur_exploded_items(frappe._dict({
-					'item_code'				: d.item_code,
-					'description'			: d.description,
-					'stock_uom'				: d.stock_uom,
-					'qty'					: flt(d.qty),
-					'rate'					: flt(d.rate),
-				}))
-
-	def add_to_cur_exploded_items(self, args):
-		if self.cur_exploded_items.get(args.item_code):
-			self.cur_exploded_items[args.item_code]["qty"] += args.qty
-		else:
-			self.cur_exploded_items[args.item_code] = args
-
-	def get_child_exploded_items(self, bom_no, qty):
-		""" Add all items from Flat BOM of child BOM"""
-
-		child_fb_items = frappe.db.sql("""select item_code, description, stock_uom, qty, rate,
-			qty_consumed_per_unit from `tabBOM Explosion Item`
-			where parent = %s and docstatus = 1""", bom_no, as_dict = 1)
-
-		for d in child_fb_items:
-			self.add_to_cur_exploded_items(frappe._dict({
-				'item_code'				: d['item_code'],
-				'description'			: d['description'],
-				'stock_uom'				: d['stock_uom'],
-				'qty'					: flt(d['qty_consumed_per_unit'])*qty,
-				'rate'					: flt(d['rate']),
-			}))
+		self.cur_exploded_items = (graph or BOMGraph([self.name])).get_exploded_items(self.name)
 
 	def add_exploded_items(self):
 		"Add items to Flat BOM table"
@@ -355,8 +277,8 @@ class BOM(Document):
 		self.set('flat_bom_details', [])
 		for d in self.cur_exploded_items:
 			ch = self.append('flat_bom_details', {})
-			for i in self.cur_exploded_items[d].keys():
-				ch.set(i, self.cur_exploded_items[d][i])
+			for i in d.keys():
+				ch.set(i, d[i])
 			ch.amount = flt(ch.qty) * flt(ch.rate)
 			ch.qty_consumed_per_unit = flt(ch.qty) / flt(self.quantity)
 			ch.docstatus = self.docstatus
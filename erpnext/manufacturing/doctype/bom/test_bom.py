@@ -28,3 +28,35 @@ class TestBOM(unittest.TestCase):
 	def test_get_items_list(self):
 		from erpnext.manufacturing.doctype.bom.bom import get_bom_items
 		self.assertEquals(len(get_bom_items(bom="BOM/_Test FG Item 2/001", qty=1, fetch_exploded=1)), 3)
+
+	def test_bom_graph(self):
+		from erpnext.manufacturing.bom_graph import BOMGraph, MaterialRates, BOMRecursionError
+		graph = BOMGraph()
+		parent, child = "BOM/_Test FG Item 2/001", "BOM/_Test Item Home Desktop Manufactured/001"
+
+		self.assertEquals(graph.get_order([parent]), [child, parent])
+		self.assertTrue(parent in graph.get_ancestors([child]))
+
+		# only sub-assemblies are loaded for a BOM being saved
+		subgraph = BOMGraph([parent])
+		self.assertEquals(sorted(subgraph.boms), sorted([child, parent]))
+		self.assertFalse(parent in BOMGraph([child]).boms)
+		self.assertEquals(subgraph.get_order([parent]), [child, parent])
+
+		exploded_items = dict(((d.item_code, d.qty) for d in graph.get_exploded_items(parent)))
+		self.assertEquals(exploded_items, {"_Test Item": 1, "_Test Serialized Item With Series": 2,
+			"_Test Item 2": 4})
+
+		# costs are rolled up from the sub-assembly, without writing them
+		order = graph.get_order([parent])
+		rates = MaterialRates([d for bom in order for d in graph.materials[bom] if not d.bom_no])
+		for bom in order:
+			graph.calculate_cost(bom, rates)
+
+		material = [d for d in graph.materials[parent] if d.bom_no == child][0]
+		self.assertEquals(material.rate, graph.get_unit_cost(child))
+		self.assertEquals(graph.boms[parent].total_cost, sum([d.amount for d in graph.materials[parent]])
+			+ frappe.utils.flt(graph.boms[parent].operating_cost))
+
+		graph.materials[child].append(frappe._dict({"item_code": "_Test FG Item 2", "bom_no": parent}))
+		self.assertRaises(BOMRecursionError, graph.get_order, [parent])
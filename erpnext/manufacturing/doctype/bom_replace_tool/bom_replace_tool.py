@@ -7,16 +7,15 @@ from frappe.utils import cstr, flt
 from frappe import _
 
 from frappe.model.document import Document
+from erpnext.manufacturing.bom_graph import BOMGraph
 
 class BOMReplaceTool(Document):
 	def replace_bom(self):
 		self.validate_bom()
 		self.update_new_bom()
 		bom_list = self.get_parent_boms()
-		updated_bom = []
-		for bom in bom_list:
-			bom_obj = frappe.get_doc("BOM", bom)
-			updated_bom = bom_obj.update_cost_and_exploded_items(updated_bom)
+		if bom_list:
+			BOMGraph().update_boms(bom_list)
 
 		frappe.msgprint(_("BOM replaced"))
 
@@ -0,0 +1,8 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+
+def execute():
+	from erpnext.accounts.doctype.gl_entry.gl_entry import on_doctype_update
+	on_doctype_update()
@@ -0,0 +1,12 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+def execute():
+	frappe.reload_doc("accounts", "doctype", "account_balance")
+
+	from erpnext.accounts.doctype.account_balance.account_balance \
+		import rebuild_account_balances
+	rebuild_account_balances()
@@ -0,0 +1,13 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+def execute():
+	frappe.reload_doc("stock", "doctype", "stock_settings")
+	frappe.reload_doc("stock", "doctype", "stock_balance_snapshot")
+
+	from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+		import rebuild_snapshots
+	rebuild_snapshots()
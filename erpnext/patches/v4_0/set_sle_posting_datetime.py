@@ -0,0 +1,14 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+
+def execute():
+	frappe.reload_doc("stock", "doctype", "stock_ledger_entry")
+
+	frappe.db.sql("""update `tabStock Ledger Entry`
+		set posting_datetime = timestamp(posting_date, ifnull(posting_time, '00:00'))""")
+
+	from erpnext.stock.doctype.stock_ledger_entry.stock_ledger_entry import on_doctype_update
+	on_doctype_update()
@@ -9,6 +9,7 @@ from frappe.utils import cstr, flt, getdate, comma_and
 
 from frappe import _
 from frappe.model.mapper import get_mapped_doc
+from erpnext.utilities.master_data import get_master_value
 
 from erpnext.controllers.selling_controller import SellingController
 
@@ -44,7 +45,7 @@ class SalesOrder(SellingController):
 			e = [d.item_code, d.description, d.warehouse, d.prevdoc_docname or '']
 			f = [d.item_code, d.description]
 
-			if frappe.db.get_value("Item", d.item_code, "is_stock_item") == 'Yes':
+			if get_master_value("Item", d.item_code, "is_stock_item") == 'Yes':
 				if not d.warehouse:
 					frappe.throw(_("Reserved warehouse required for stock item {0}").format(d.item_code))
 
@@ -226,10 +227,11 @@ class SalesOrder(SellingController):
 
 
 	def update_stock_ledger(self, update_stock):
-		from erpnext.stock.utils import update_bin
+		from erpnext.stock.utils import update_bin_qty
+		bin_args = []
 		for d in self.get_item_list():
-			if frappe.db.get_value("Item", d['item_code'], "is_stock_item") == "Yes":
-				args = {
+			if get_master_value("Item", d['item_code'], "is_stock_item") == "Yes":
+				bin_args.append({
 					"item_code": d['item_code'],
 					"warehouse": d['reserved_warehouse'],
 					"reserved_qty": flt(update_stock) * flt(d['reserved_qty']),
@@ -237,8 +239,9 @@ class SalesOrder(SellingController):
 					"voucher_type": self.doctype,
 					"voucher_no": self.name,
 					"is_amended": self.amended_from and 'Yes' or 'No'
-				}
-				update_bin(args)
+				})
+
+		update_bin_qty(bin_args)
 
 	def on_update(self):
 		pass
@@ -6,6 +6,7 @@ import frappe
 from frappe import throw, _
 
 from frappe.model.document import Document
+from erpnext.utilities.master_data import get_master_value
 
 class Currency(Document):
 	pass
@@ -13,7 +14,7 @@ class Currency(Document):
 def validate_conversion_rate(currency, conversion_rate, conversion_rate_label, company):
 	"""common validation for currency and price list currency"""
 
-	company_currency = frappe.db.get_value("Company", company, "default_currency")
+	company_currency = get_master_value("Company", company, "default_currency")
 
 	if not conversion_rate:
 		throw(_('%(conversion_rate_label)s is mandatory. Maybe Currency Exchange record is not created for %(from_currency)s to %(to_currency)s') % {
@@ -4,9 +4,10 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _, throw
+from erpnext.utilities.master_data import get_master_value
 
 def get_company_currency(company):
-	currency = frappe.db.get_value("Company", company, "default_currency")
+	currency = get_master_value("Company", company, "default_currency")
 	if not currency:
 		currency = frappe.db.get_default("currency")
 	if not currency:
@@ -3,14 +3,15 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import flt, nowdate
+from frappe.utils import flt, nowdate, now
 import frappe.defaults
 from frappe.model.document import Document
+from erpnext.utilities.master_data import get_master_value
 
 class Bin(Document):
 	def validate(self):
 		if self.get("__islocal") or not self.stock_uom:
-			self.stock_uom = frappe.db.get_value('Item', self.item_code, 'stock_uom')
+			self.stock_uom = get_master_value("Item", self.item_code, "stock_uom")
 				
 		self.validate_mandatory()
 		
@@ -27,39 +28,62 @@ class Bin(Document):
 		self.update_qty(args)
 		
 		if args.get("actual_qty"):
-			from erpnext.stock.stock_ledger import update_entries_after
-			
-			if not args.get("posting_date"):
-				args["posting_date"] = nowdate()
-			
-			# update valuation and qty after transaction for post dated entry
-			update_entries_after({
-				"item_code": self.item_code,
-				"warehouse": self.warehouse,
-				"posting_date": args.get("posting_date"),
-				"posting_time": args.get("posting_time")
-			})
-			
+			repost_entries_after(self.item_code, self.warehouse,
+				args.get("posting_date") or nowdate(), args.get("posting_time"))
+
 	def update_qty(self, args):
 		# update the stock values (for current quantities)
-		
-		self.actual_qty = flt(self.actual_qty) + flt(args.get("actual_qty"))
-		self.ordered_qty = flt(self.ordered_qty) + flt(args.get("ordered_qty"))
-		self.reserved_qty = flt(self.reserved_qty) + flt(args.get("reserved_qty"))
-		self.indented_qty = flt(self.indented_qty) + flt(args.get("indented_qty"))
-		self.planned_qty = flt(self.planned_qty) + flt(args.get("planned_qty"))
-		
-		self.projected_qty = flt(self.actual_qty) + flt(self.ordered_qty) + \
-		 	flt(self.indented_qty) + flt(self.planned_qty) - flt(self.reserved_qty)
-		
-		self.save()
-		
+		self.update(update_qty(self.name, args))
+
 	def get_first_sle(self):
 		sle = frappe.db.sql("""
 			select * from `tabStock Ledger Entry`
 			where item_code = %s
 			and warehouse = %s
-			order by timestamp(posting_date, posting_time) asc, name asc
+			order by posting_datetime asc, name asc
 			limit 1
 		""", (self.item_code, self.warehouse), as_dict=1)
-		return sle and sle[0] or None
\ No newline at end of file
+		return sle and sle[0] or None
+
+qty_fields = ("actual_qty", "reserved_qty", "ordered_qty", "indented_qty", "planned_qty")
+
+def update_qty(bin_name, args):
+	"""add qty deltas in args to the Bin in one atomic update, without loading and saving
+		it, so that concurrent transactions do not overwrite each other's quantities.
+		returns the updated quantities"""
+	values = dict((fieldname, flt(args.get(fieldname))) for fieldname in qty_fields)
+	values.update({"name": bin_name, "modified": now()})
+
+	# mysql assigns columns left to right, so projected qty is from the updated quantities
+	frappe.db.sql("""update `tabBin` set
+			actual_qty = ifnull(actual_qty, 0) + %(actual_qty)s,
+			reserved_qty = ifnull(reserved_qty, 0) + %(reserved_qty)s,
+			ordered_qty = ifnull(ordered_qty, 0) + %(ordered_qty)s,
+			indented_qty = ifnull(indented_qty, 0) + %(indented_qty)s,
+			planned_qty = ifnull(planned_qty, 0) + %(planned_qty)s,
+			projected_qty = actual_qty + ordered_qty + indented_qty + planned_qty - reserved_qty,
+			modified = %(modified)s
+		where name = %(name)s""", values)
+
+	return frappe.db.get_value("Bin", bin_name, list(qty_fields) + ["projected_qty"], as_dict=True)
+
+def repost_entries_after(item_code, warehouse, posting_date, posting_time=None):
+	"""value entries of item and warehouse from posting date and time onwards"""
+	from erpnext.stock.stock_ledger import update_entries_after
+	from erpnext.stock.doctype.stock_repost_request.stock_repost_request \
+		import is_reposting_deferred, enqueue_repost
+
+	repost_args = {
+		"item_code": item_code,
+		"warehouse": warehouse,
+		"posting_date": posting_date,
+		"posting_time": posting_time
+	}
+
+	if is_reposting_deferred():
+		# value this entry now, later entries are reposted in the background
+		if update_entries_after(repost_args.copy(), defer_later_entries=True).deferred:
+			enqueue_repost(item_code, warehouse, posting_date, posting_time)
+	else:
+		# update valuation and qty after transaction for post dated entry
+		update_entries_after(repost_args)
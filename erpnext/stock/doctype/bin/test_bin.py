@@ -0,0 +1,48 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest
+from frappe.utils import flt
+from erpnext.stock.utils import get_bin, update_bin_qty
+
+test_dependencies = ["Item", "Warehouse"]
+
+class TestBin(unittest.TestCase):
+	def test_update_bin_qty(self):
+		bin = get_bin("_Test Item", "_Test Warehouse - _TC")
+		before = frappe.db.get_value("Bin", bin.name, ["reserved_qty", "ordered_qty",
+			"projected_qty"], as_dict=True)
+
+		# rows of the same item and warehouse are added to the bin together
+		update_bin_qty([
+			{"item_code": "_Test Item", "warehouse": "_Test Warehouse - _TC", "reserved_qty": 5},
+			{"item_code": "_Test Item", "warehouse": "_Test Warehouse - _TC", "reserved_qty": 3,
+				"ordered_qty": 10},
+			{"item_code": "_Test Non Stock Item", "warehouse": "_Test Warehouse - _TC",
+				"reserved_qty": 7}
+		])
+
+		after = frappe.db.get_value("Bin", bin.name, ["reserved_qty", "ordered_qty",
+			"projected_qty"], as_dict=True)
+
+		self.assertEquals(flt(after.reserved_qty), flt(before.reserved_qty) + 8)
+		self.assertEquals(flt(after.ordered_qty), flt(before.ordered_qty) + 10)
+		self.assertEquals(flt(after.projected_qty), flt(before.projected_qty) + 2)
+
+		update_bin_qty([{"item_code": "_Test Item", "warehouse": "_Test Warehouse - _TC",
+			"reserved_qty": -8, "ordered_qty": -10}])
+
+	def test_update_qty_of_loaded_bin(self):
+		bin = get_bin("_Test Item", "_Test Warehouse - _TC")
+		stale = frappe.get_doc("Bin", bin.name)
+
+		bin.update_qty({"indented_qty": 4})
+		stale.update_qty({"indented_qty": 6})
+
+		# the second update is added to the first, not saved over it
+		self.assertEquals(flt(stale.indented_qty), flt(bin.indented_qty) + 6)
+		self.assertEquals(flt(frappe.db.get_value("Bin", bin.name, "indented_qty")),
+			flt(stale.indented_qty))
+
+		stale.update_qty({"indented_qty": -10})
@@ -9,7 +9,8 @@ from frappe.utils import flt, cint
 from frappe import msgprint, _
 import frappe.defaults
 from frappe.model.mapper import get_mapped_doc
-from erpnext.stock.utils import update_bin
+from erpnext.stock.utils import update_bin_qty
+from erpnext.utilities.master_data import get_master_value
 from erpnext.controllers.selling_controller import SellingController
 
 class DeliveryNote(SellingController):
@@ -114,7 +115,7 @@ class DeliveryNote(SellingController):
 			e = [d.item_code, d.description, d.warehouse, d.against_sales_order or d.against_sales_invoice, d.batch_no or '']
 			f = [d.item_code, d.description, d.against_sales_order or d.against_sales_invoice]
 
-			if frappe.db.get_value("Item", d.item_code, "is_stock_item") == 'Yes':
+			if get_master_value("Item", d.item_code, "is_stock_item") == 'Yes':
 				if e in check_list:
 					msgprint(_("Note: Item {0} entered multiple times").format(d.item_code))
 				else:
@@ -127,7 +128,7 @@ class DeliveryNote(SellingController):
 
 	def validate_warehouse(self):
 		for d in self.get_item_list():
-			if frappe.db.get_value("Item", d['item_code'], "is_stock_item") == "Yes":
+			if get_master_value("Item", d['item_code'], "is_stock_item") == "Yes":
 				if not d['warehouse']:
 					frappe.throw(_("Warehouse required for stock Item {0}").format(d["item_code"]))
 
@@ -219,34 +220,34 @@ class DeliveryNote(SellingController):
 
 
 	def update_stock_ledger(self):
-		sl_entries = []
+		sl_entries, bin_args = [], []
 		for d in self.get_item_list():
-			if frappe.db.get_value("Item", d.item_code, "is_stock_item") == "Yes" \
+			if get_master_value("Item", d.item_code, "is_stock_item") == "Yes" \
 					and d.warehouse:
-				self.update_reserved_qty(d)
+				if d['reserved_qty'] < 0:
+					bin_args.append(self.get_reserved_qty_args(d))
 
 				sl_entries.append(self.get_sl_entries(d, {
 					"actual_qty": -1*flt(d['qty']),
 				}))
 
+		update_bin_qty(bin_args)
 		self.make_sl_entries(sl_entries)
 
-	def update_reserved_qty(self, d):
-		if d['reserved_qty'] < 0 :
-			# Reduce reserved qty from reserved warehouse mentioned in so
-			if not d["reserved_warehouse"]:
-				frappe.throw(_("Reserved Warehouse is missing in Sales Order"))
-
-			args = {
-				"item_code": d['item_code'],
-				"warehouse": d["reserved_warehouse"],
-				"voucher_type": self.doctype,
-				"voucher_no": self.name,
-				"reserved_qty": (self.docstatus==1 and 1 or -1)*flt(d['reserved_qty']),
-				"posting_date": self.posting_date,
-				"is_amended": self.amended_from and 'Yes' or 'No'
-			}
-			update_bin(args)
+	def get_reserved_qty_args(self, d):
+		# Reduce reserved qty from reserved warehouse mentioned in so
+		if not d["reserved_warehouse"]:
+			frappe.throw(_("Reserved Warehouse is missing in Sales Order"))
+
+		return {
+			"item_code": d['item_code'],
+			"warehouse": d["reserved_warehouse"],
+			"voucher_type": self.doctype,
+			"voucher_no": self.name,
+			"reserved_qty": (self.docstatus==1 and 1 or -1)*flt(d['reserved_qty']),
+			"posting_date": self.posting_date,
+			"is_amended": self.amended_from and 'Yes' or 'No'
+		}
 
 	def credit_limit(self):
 		"""check credit limit of items in DN Detail which are not fetched from sales order"""
@@ -211,6 +211,7 @@ class TestDeliveryNote(unittest.TestCase):
 		frappe.db.sql("""delete from `tabBin`""")
 		frappe.db.sql("delete from `tabStock Ledger Entry`")
 		frappe.db.sql("delete from `tabGL Entry`")
+		frappe.db.sql("delete from `tabAccount Balance`")
 
 test_dependencies = ["Sales BOM"]
 
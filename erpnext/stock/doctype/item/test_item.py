@@ -60,4 +60,68 @@ class TestItem(unittest.TestCase):
 		for key, value in to_check.iteritems():
 			self.assertEquals(value, details.get(key))
 
+	def test_get_item_details_for_items(self):
+		from erpnext.stock.get_item_details import get_item_details_for_items
+		to_check = [
+			{
+				"item_code": "_Test Item",
+				"warehouse": "_Test Warehouse - _TC",
+				"income_account": "Sales - _TC",
+				"expense_account": "_Test Account Cost for Goods Sold - _TC",
+				"cost_center": "_Test Cost Center - _TC",
+				"qty": 1.0,
+				"price_list_rate": 100.0,
+				"item_tax_rate": '{}',
+				"uom": "_Test UOM",
+				"conversion_factor": 1.0,
+			},
+			{
+				"item_code": "_Test Item 2",
+				"warehouse": "_Test Warehouse - _TC",
+				"income_account": "Sales - _TC",
+				"expense_account": "_Test Account Cost for Goods Sold - _TC",
+				"cost_center": None,
+				"qty": 1.0,
+				"price_list_rate": 0.0,
+				"item_tax_rate": '{}',
+				"uom": "_Test UOM",
+				"conversion_factor": 1.0,
+			},
+			{
+				"item_code": "_Test Item",
+				"warehouse": "_Test Warehouse 1 - _TC",
+				"income_account": "Sales - _TC",
+				"expense_account": "_Test Account Cost for Goods Sold - _TC",
+				"cost_center": "_Test Cost Center - _TC",
+				"qty": 1.0,
+				"price_list_rate": 100.0,
+				"item_tax_rate": '{}',
+				"uom": "_Test UOM",
+				"conversion_factor": 1.0,
+			}
+		]
+
+		make_test_records("Item Price")
+
+		details = get_item_details_for_items([
+			{"item_code": "_Test Item"},
+			{"item_code": "_Test Item 2", "qty": 5},
+			{"item_code": "_Test Item", "warehouse": "_Test Warehouse 1 - _TC"}
+		], {
+			"company": "_Test Company",
+			"price_list": "_Test Price List",
+			"currency": "_Test Currency",
+			"doctype": "Sales Order",
+			"conversion_rate": 1,
+			"price_list_currency": "_Test Currency",
+			"plc_conversion_rate": 1,
+			"order_type": "Sales",
+			"transaction_type": "selling"
+		})
+
+		self.assertEquals(len(details), 3)
+		for expected, row in zip(to_check, details):
+			for key, value in expected.iteritems():
+				self.assertEquals(value, row.get(key))
+
 test_records = frappe.get_test_records('Item')
\ No newline at end of file
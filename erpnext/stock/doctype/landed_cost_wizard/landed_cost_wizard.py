@@ -7,6 +7,7 @@ from frappe.utils import flt
 from frappe import msgprint, _
 
 from frappe.model.document import Document
+from erpnext.accounts.general_ledger import delete_voucher_gl_entries
 
 class LandedCostWizard(Document):
 
@@ -82,8 +83,7 @@ class LandedCostWizard(Document):
 
 			frappe.db.sql("""delete from `tabStock Ledger Entry`
 				where voucher_type='Purchase Receipt' and voucher_no=%s""", pr)
-			frappe.db.sql("""delete from `tabGL Entry` where voucher_type='Purchase Receipt'
-				and voucher_no=%s""", pr)
+			delete_voucher_gl_entries("Purchase Receipt", pr)
 
 	def submit_pr(self, purchase_receipts):
 		for pr in purchase_receipts:
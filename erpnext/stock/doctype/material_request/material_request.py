@@ -10,6 +10,7 @@ import frappe
 from frappe.utils import cstr, flt
 from frappe import _
 from frappe.model.mapper import get_mapped_doc
+from erpnext.utilities.master_data import get_master_value
 
 from erpnext.controllers.buying_controller import BuyingController
 class MaterialRequest(BuyingController):
@@ -77,9 +78,10 @@ class MaterialRequest(BuyingController):
 	def update_bin(self, is_submit, is_stopped):
 		""" Update Quantity Requested for Purchase in Bin for Material Request of type 'Purchase'"""
 
-		from erpnext.stock.utils import update_bin
+		from erpnext.stock.utils import update_bin_qty
+		bin_args = []
 		for d in self.get('indent_details'):
-			if frappe.db.get_value("Item", d.item_code, "is_stock_item") == "Yes":
+			if get_master_value("Item", d.item_code, "is_stock_item") == "Yes":
 				if not d.warehouse:
 					frappe.throw(_("Warehouse required for stock Item {0}").format(d.item_code))
 
@@ -87,13 +89,14 @@ class MaterialRequest(BuyingController):
 				if is_stopped:
 					qty = (d.qty > d.ordered_qty) and flt(flt(d.qty) - flt(d.ordered_qty)) or 0
 
-				args = {
+				bin_args.append({
 					"item_code": d.item_code,
 					"warehouse": d.warehouse,
 					"indented_qty": (is_submit and 1 or -1) * flt(qty),
 					"posting_date": self.transaction_date
-				}
-				update_bin(args)
+				})
+
+		update_bin_qty(bin_args)
 
 	def on_submit(self):
 		frappe.db.set(self, 'status', 'Submitted')
@@ -179,7 +182,8 @@ def update_completed_qty(doc, method):
 
 def _update_requested_qty(doc, mr_obj, mr_items):
 	"""update requested qty (before ordered_qty is updated)"""
-	from erpnext.stock.utils import update_bin
+	from erpnext.stock.utils import update_bin_qty
+	bin_args = []
 	for mr_item_name in mr_items:
 		mr_item = mr_obj.get("indent_details", {"name": mr_item_name})
 		se_detail = doc.get("mtn_details", {"material_request": mr_obj.name,
@@ -201,13 +205,15 @@ def _update_requested_qty(doc, mr_obj, mr_items):
 			else:
 				add_indented_qty = se_detail.transfer_qty
 
-			update_bin({
+			bin_args.append({
 				"item_code": se_detail.item_code,
 				"warehouse": se_detail.t_warehouse,
 				"indented_qty": (se_detail.docstatus==2 and 1 or -1) * add_indented_qty,
 				"posting_date": doc.posting_date,
 			})
 
+	update_bin_qty(bin_args)
+
 def set_missing_values(source, target_doc):
 	target_doc.run_method("set_missing_values")
 	target_doc.run_method("calculate_taxes_and_totals")
@@ -8,7 +8,7 @@ from frappe.utils import cstr, flt, cint
 
 from frappe import _
 import frappe.defaults
-from erpnext.stock.utils import update_bin
+from erpnext.stock.utils import update_bin_qty
 
 from erpnext.controllers.buying_controller import BuyingController
 class PurchaseReceipt(BuyingController):
@@ -145,6 +145,7 @@ class PurchaseReceipt(BuyingController):
 
 	def update_ordered_qty(self):
 		stock_items = self.get_stock_items()
+		bin_args = []
 		for d in self.get("purchase_receipt_details"):
 			if d.item_code in stock_items and d.warehouse \
 					and cstr(d.prevdoc_doctype) == 'Purchase Order':
@@ -161,13 +162,15 @@ class PurchaseReceipt(BuyingController):
 				else:
 					ordered_qty = - flt(d.qty) * flt(d.conversion_factor)
 
-				update_bin({
+				bin_args.append({
 					"item_code": d.item_code,
 					"warehouse": ordered_warehouse,
 					"posting_date": self.posting_date,
 					"ordered_qty": flt(ordered_qty) if self.docstatus==1 else -flt(ordered_qty)
 				})
 
+		update_bin_qty(bin_args)
+
 	def get_already_received_qty(self, po, po_detail):
 		qty = frappe.db.sql("""select sum(qty) from `tabPurchase Receipt Item`
 			where prevdoc_detail_docname = %s and docstatus = 1
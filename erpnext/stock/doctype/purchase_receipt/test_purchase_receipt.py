@@ -88,6 +88,7 @@ class TestPurchaseReceipt(unittest.TestCase):
 		frappe.db.sql("delete from `tabStock Ledger Entry`")
 		frappe.db.sql("""delete from `tabBin`""")
 		frappe.db.sql("""delete from `tabGL Entry`""")
+		frappe.db.sql("""delete from `tabAccount Balance`""")
 
 	def test_subcontracting(self):
 		pr = frappe.copy_doc(test_records[1])
@@ -4,7 +4,7 @@
 from __future__ import unicode_literals
 import frappe
 
-from frappe.utils import cint, cstr, flt, add_days, nowdate
+from frappe.utils import cint, cstr, flt, add_days, nowdate, now
 from frappe import _, ValidationError
 
 from erpnext.controllers.stock_controller import StockController
@@ -76,61 +76,19 @@ class SerialNo(StockController):
 		self.warranty_period = item.warranty_period
 
 	def set_status(self, last_sle):
-		if last_sle:
-			if last_sle.voucher_type == "Stock Entry":
-				document_type = frappe.db.get_value("Stock Entry", last_sle.voucher_no,
-					"purpose")
-			else:
-				document_type = last_sle.voucher_type
-
-			if last_sle.actual_qty > 0:
-				if document_type == "Sales Return":
-					self.status = "Sales Returned"
-				else:
-					self.status = "Available"
-			else:
-				if document_type == "Purchase Return":
-					self.status = "Purchase Returned"
-				elif last_sle.voucher_type in ("Delivery Note", "Sales Invoice"):
-					self.status = "Delivered"
-				else:
-					self.status = "Not Available"
-		else:
-			self.status = "Not Available"
+		self.status = get_status(last_sle)
 
 	def set_purchase_details(self, purchase_sle):
-		if purchase_sle:
-			self.purchase_document_type = purchase_sle.voucher_type
-			self.purchase_document_no = purchase_sle.voucher_no
-			self.purchase_date = purchase_sle.posting_date
-			self.purchase_time = purchase_sle.posting_time
-			self.purchase_rate = purchase_sle.incoming_rate
-			if purchase_sle.voucher_type == "Purchase Receipt":
-				self.supplier, self.supplier_name = \
-					frappe.db.get_value("Purchase Receipt", purchase_sle.voucher_no,
-						["supplier", "supplier_name"])
-		else:
-			for fieldname in ("purchase_document_type", "purchase_document_no",
-				"purchase_date", "purchase_time", "purchase_rate", "supplier", "supplier_name"):
-					self.set(fieldname, None)
+		self.update(get_purchase_details(purchase_sle))
 
 	def set_sales_details(self, delivery_sle):
+		self.update(get_delivery_details(delivery_sle))
 		if delivery_sle:
-			self.delivery_document_type = delivery_sle.voucher_type
-			self.delivery_document_no = delivery_sle.voucher_no
-			self.delivery_date = delivery_sle.posting_date
-			self.delivery_time = delivery_sle.posting_time
-			self.customer, self.customer_name = \
-				frappe.db.get_value(delivery_sle.voucher_type, delivery_sle.voucher_no,
-					["customer", "customer_name"])
 			if self.warranty_period:
 				self.warranty_expiry_date	= add_days(cstr(delivery_sle.posting_date),
 					cint(self.warranty_period))
 		else:
-			for fieldname in ("delivery_document_type", "delivery_document_no",
-				"delivery_date", "delivery_time", "customer", "customer_name",
-				"warranty_expiry_date"):
-					self.set(fieldname, None)
+			self.warranty_expiry_date = None
 
 	def get_last_sle(self):
 		entries = {}
@@ -151,7 +109,7 @@ class SerialNo(StockController):
 		sle_dict = {}
 		for sle in frappe.db.sql("""select * from `tabStock Ledger Entry`
 			where serial_no like %s and item_code=%s and ifnull(is_cancelled, 'No')='No'
-			order by posting_date desc, posting_time desc, name desc""",
+			order by posting_datetime desc, name desc""",
 			("%%%s%%" % self.name, self.item_code), as_dict=1):
 				if self.name.upper() in get_serial_nos(sle.serial_no):
 					if sle.actual_qty > 0:
@@ -218,10 +176,10 @@ def validate_serial_no(sle, item_det):
 			if len(serial_nos) != len(set(serial_nos)):
 				frappe.throw(_("Duplicate Serial No entered for Item {0}").format(sle.item_code), SerialNoDuplicateError)
 
+			existing_serial_nos = get_existing_serial_nos(serial_nos)
 			for serial_no in serial_nos:
-				if frappe.db.exists("Serial No", serial_no):
-					sr = frappe.get_doc("Serial No", serial_no)
-
+				sr = existing_serial_nos.get(serial_no)
+				if sr:
 					if sr.item_code!=sle.item_code:
 						frappe.throw(_("Serial No {0} does not belong to Item {1}").format(sle.item_code,
 							serial_no), SerialNoItemError)
@@ -249,26 +207,173 @@ def validate_serial_no(sle, item_det):
 
 def update_serial_nos(sle, item_det):
 	if sle.is_cancelled == "No" and not sle.serial_no and sle.actual_qty > 0 and item_det.serial_no_series:
-		from frappe.model.naming import make_autoname
-		serial_nos = []
-		for i in xrange(cint(sle.actual_qty)):
-			serial_nos.append(make_autoname(item_det.serial_no_series))
+		from erpnext.utilities import make_autonames
+		serial_nos = make_autonames(item_det.serial_no_series, cint(sle.actual_qty))
 		frappe.db.set(sle, "serial_no", "\n".join(serial_nos))
 
 	if sle.serial_no:
 		serial_nos = get_serial_nos(sle.serial_no)
-		for serial_no in serial_nos:
-			if frappe.db.exists("Serial No", serial_no):
-				sr = frappe.get_doc("Serial No", serial_no)
-				sr.via_stock_ledger = True
-				sr.warehouse = sle.warehouse if sle.actual_qty > 0 else None
-				sr.save(ignore_permissions=True)
-			elif sle.actual_qty > 0:
-				make_serial_no(serial_no, sle)
+		existing_serial_nos = get_existing_serial_nos(serial_nos)
+
+		if sle.is_cancelled == "Yes":
+			# entries of a cancelled voucher are reversed, serial nos are
+			# set as per their remaining stock ledger entries
+			for serial_no in serial_nos:
+				if serial_no in existing_serial_nos:
+					sr = frappe.get_doc("Serial No", existing_serial_nos[serial_no].name)
+					sr.via_stock_ledger = True
+					sr.warehouse = sle.warehouse if sle.actual_qty > 0 else None
+					sr.save(ignore_permissions=True)
+				elif sle.actual_qty > 0:
+					make_serial_no(serial_no, sle)
+		else:
+			if existing_serial_nos:
+				update_existing_serial_nos([d.name for d in existing_serial_nos.values()],
+					sle, item_det)
+
+			new_serial_nos = [serial_no for serial_no in serial_nos
+				if serial_no not in existing_serial_nos]
+			if new_serial_nos and sle.actual_qty > 0:
+				make_serial_nos(new_serial_nos, sle, item_det)
+
+def get_existing_serial_nos(serial_nos, chunk_size=1000):
+	"""item, warehouse and status of serial nos which exist, by upper case serial no,
+		looked up with one query per chunk of serial nos"""
+	existing_serial_nos = {}
+	for i in xrange(0, len(serial_nos), chunk_size):
+		chunk = serial_nos[i:i + chunk_size]
+		for d in frappe.db.sql("""select name, item_code, warehouse, status from `tabSerial No`
+			where name in ({0})""".format(", ".join(["%s"] * len(chunk))), tuple(chunk), as_dict=True):
+				existing_serial_nos[d.name.upper()] = d
+
+	return existing_serial_nos
+
+def update_existing_serial_nos(names, sle, item_det, chunk_size=1000):
+	"""move serial nos as per `sle`, the latest entry of all of them,
+		with one update per chunk of serial nos"""
+	values = get_serial_no_values(sle, item_det)
+	values.update({"modified": now(), "modified_by": frappe.session.user})
+
+	if sle.actual_qty > 0:
+		values.update(get_purchase_details(sle))
+		values.update(get_delivery_details(None))
+		values["warranty_expiry_date"] = None
+	else:
+		values.update(get_delivery_details(sle))
+		if item_det.warranty_period:
+			values["warranty_expiry_date"] = add_days(cstr(sle.posting_date),
+				cint(item_det.warranty_period))
+
+	set_clause = ", ".join(["`{0}`=%({0})s".format(fieldname) for fieldname in values])
+
+	for i in xrange(0, len(names), chunk_size):
+		chunk = names[i:i + chunk_size]
+		chunk_values = dict(values, today=nowdate())
+		chunk_values.update((("name_{0}".format(j), name) for j, name in enumerate(chunk)))
+
+		# mysql assigns columns left to right, so maintenance status is as per
+		# the warranty expiry date set before it
+		frappe.db.sql("""update `tabSerial No` set {set_clause},
+				maintenance_status = case
+					when warranty_expiry_date >= %(today)s then 'Under Warranty'
+					when amc_expiry_date >= %(today)s then 'Under AMC'
+					when amc_expiry_date < %(today)s then 'Out of AMC'
+					when warranty_expiry_date < %(today)s then 'Out of Warranty'
+					else null end
+			where name in ({names})""".format(set_clause=set_clause,
+				names=", ".join(["%(name_{0})s".format(j) for j in xrange(len(chunk))])), chunk_values)
+
+def make_serial_nos(serial_nos, sle, item_det):
+	"""insert serial nos received by `sle` in bulk"""
+	from erpnext.utilities import bulk_insert
+
+	values = get_serial_no_values(sle, item_det)
+	values.update(get_purchase_details(sle))
+	values.update({"item_code": sle.item_code, "company": sle.company})
+
+	bulk_insert("Serial No", [dict(values, name=serial_no, serial_no=serial_no)
+		for serial_no in serial_nos])
+
+	if len(serial_nos) > 10:
+		frappe.msgprint(_("{0} Serial Nos created").format(len(serial_nos)))
+	else:
+		frappe.msgprint(_("Serial No {0} created").format(", ".join(serial_nos)))
+
+def get_serial_no_values(sle, item_det):
+	"""warehouse, status and item details of serial nos after `sle`"""
+	return {
+		"warehouse": sle.warehouse if sle.actual_qty > 0 else None,
+		"status": get_status(sle),
+		"item_name": item_det.item_name,
+		"description": item_det.description,
+		"item_group": item_det.item_group,
+		"brand": item_det.brand,
+		"warranty_period": item_det.warranty_period
+	}
+
+def get_status(last_sle):
+	"""status of a serial no whose latest stock ledger entry is `last_sle`"""
+	if not last_sle:
+		return "Not Available"
+
+	if last_sle.voucher_type == "Stock Entry":
+		document_type = frappe.db.get_value("Stock Entry", last_sle.voucher_no, "purpose")
+	else:
+		document_type = last_sle.voucher_type
+
+	if last_sle.actual_qty > 0:
+		if document_type == "Sales Return":
+			return "Sales Returned"
+		else:
+			return "Available"
+	else:
+		if document_type == "Purchase Return":
+			return "Purchase Returned"
+		elif last_sle.voucher_type in ("Delivery Note", "Sales Invoice"):
+			return "Delivered"
+		else:
+			return "Not Available"
+
+def get_purchase_details(purchase_sle):
+	details = dict.fromkeys(("purchase_document_type", "purchase_document_no",
+		"purchase_date", "purchase_time", "purchase_rate", "supplier", "supplier_name"))
+
+	if purchase_sle:
+		details.update({
+			"purchase_document_type": purchase_sle.voucher_type,
+			"purchase_document_no": purchase_sle.voucher_no,
+			"purchase_date": purchase_sle.posting_date,
+			"purchase_time": purchase_sle.posting_time,
+			"purchase_rate": purchase_sle.incoming_rate
+		})
+		if purchase_sle.voucher_type == "Purchase Receipt":
+			details["supplier"], details["supplier_name"] = \
+				frappe.db.get_value("Purchase Receipt", purchase_sle.voucher_no,
+					["supplier", "supplier_name"])
+
+	return details
+
+def get_delivery_details(delivery_sle):
+	details = dict.fromkeys(("delivery_document_type", "delivery_document_no",
+		"delivery_date", "delivery_time", "customer", "customer_name"))
+
+	if delivery_sle:
+		details.update({
+			"delivery_document_type": delivery_sle.voucher_type,
+			"delivery_document_no": delivery_sle.voucher_no,
+			"delivery_date": delivery_sle.posting_date,
+			"delivery_time": delivery_sle.posting_time
+		})
+		details["customer"], details["customer_name"] = \
+			frappe.db.get_value(delivery_sle.voucher_type, delivery_sle.voucher_no,
+				["customer", "customer_name"])
+
+	return details
 
 def get_item_details(item_code):
 	return frappe.db.sql("""select name, has_batch_no, docstatus,
-		is_stock_item, has_serial_no, serial_no_series
+		is_stock_item, has_serial_no, serial_no_series, item_name, description,
+		item_group, brand, warranty_period
 		from tabItem where name=%s""", item_code, as_dict=True)[0]
 
 def get_serial_nos(serial_no):
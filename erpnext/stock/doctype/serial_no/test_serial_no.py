@@ -29,3 +29,75 @@ class TestSerialNo(unittest.TestCase):
 
 		sr.warehouse = "_Test Warehouse - _TC"
 		self.assertTrue(SerialNoCannotCannotChangeError, sr.save)
+
+	def test_bulk_serial_nos(self):
+		import time
+		from erpnext.stock.doctype.stock_entry.test_stock_entry import test_records as se_test_records
+
+		item_code, qty = "_Test Serialized Item With Series", 10000
+		se = frappe.copy_doc(se_test_records[0])
+		se.get("mtn_details")[0].item_code = item_code
+		se.get("mtn_details")[0].qty = qty
+		se.get("mtn_details")[0].transfer_qty = qty
+		se.insert()
+
+		serial_nos, vouchers = [], [se.name]
+		try:
+			start = time.time()
+			se.submit()
+			timing = "receiving 10k serial nos took {0:.2f}s".format(time.time() - start)
+
+			serial_nos = get_serial_nos(se.get("mtn_details")[0].serial_no)
+			self.assertEquals(len(serial_nos), qty, timing)
+			self.assertEquals(self.get_serial_no_count(serial_nos, "_Test Warehouse - _TC", se.name),
+				qty, timing)
+
+			transfer = frappe.copy_doc(se_test_records[0])
+			transfer.purpose = "Material Transfer"
+			transfer.get("mtn_details")[0].item_code = item_code
+			transfer.get("mtn_details")[0].qty = qty
+			transfer.get("mtn_details")[0].transfer_qty = qty
+			transfer.get("mtn_details")[0].serial_no = "\n".join(serial_nos)
+			transfer.get("mtn_details")[0].s_warehouse = "_Test Warehouse - _TC"
+			transfer.get("mtn_details")[0].t_warehouse = "_Test Warehouse 1 - _TC"
+			transfer.insert()
+			vouchers.append(transfer.name)
+
+			start = time.time()
+			transfer.submit()
+			timing = "moving 10k serial nos took {0:.2f}s".format(time.time() - start)
+
+			self.assertEquals(self.get_serial_no_count(serial_nos, "_Test Warehouse 1 - _TC",
+				transfer.name), qty, timing)
+			self.assertEquals(self.get_serial_no_count(serial_nos, "_Test Warehouse - _TC"), 0)
+		finally:
+			self.delete_stock_entries(item_code, vouchers, serial_nos)
+
+	def get_serial_no_count(self, serial_nos, warehouse, purchase_document_no=None):
+		"""available serial nos in a warehouse, received by `purchase_document_no` if set"""
+		condition = " and purchase_document_no=%s" if purchase_document_no else ""
+		count = 0
+		for i in xrange(0, len(serial_nos), 1000):
+			chunk = serial_nos[i:i + 1000]
+			count += frappe.db.sql("""select count(*) from `tabSerial No`
+				where name in ({0}) and warehouse=%s and status='Available' {1}""".format(
+					", ".join(["%s"] * len(chunk)), condition),
+				tuple(chunk + [warehouse] + ([purchase_document_no] if purchase_document_no else [])))[0][0]
+
+		return count
+
+	def delete_stock_entries(self, item_code, vouchers, serial_nos):
+		for i in xrange(0, len(serial_nos), 1000):
+			chunk = serial_nos[i:i + 1000]
+			frappe.db.sql("""delete from `tabSerial No` where name in ({0})""".format(
+				", ".join(["%s"] * len(chunk))), tuple(chunk))
+
+		for voucher_no in vouchers:
+			frappe.db.sql("""delete from `tabStock Ledger Entry`
+				where voucher_type='Stock Entry' and voucher_no=%s""", voucher_no)
+			frappe.db.sql("""delete from `tabGL Entry`
+				where voucher_type='Stock Entry' and voucher_no=%s""", voucher_no)
+			frappe.db.sql("""delete from `tabStock Entry Detail` where parent=%s""", voucher_no)
+			frappe.db.sql("""delete from `tabStock Entry` where name=%s""", voucher_no)
+
+		frappe.db.sql("""delete from `tabBin` where item_code=%s""", item_code)
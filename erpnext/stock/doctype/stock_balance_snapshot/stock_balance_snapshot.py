@@ -0,0 +1,163 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+import hashlib
+from datetime import date
+from frappe.utils import cint, cstr, getdate, get_last_day, now
+
+from frappe.model.document import Document
+
+class StockBalanceSnapshot(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabStock Balance Snapshot`
+		where Key_name="item_warehouse_period_index" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabStock Balance Snapshot`
+			add index item_warehouse_period_index(item_code, warehouse, period_end_date)""")
+
+def get_snapshot_period():
+	return frappe.db.get_value("Stock Settings", None, "stock_balance_snapshot_period") or "Monthly"
+
+def get_period_dates(posting_date, period=None):
+	"""start and end date of the snapshot period in which posting_date falls"""
+	posting_date = getdate(posting_date)
+	period = period or get_snapshot_period()
+
+	if period == "Yearly":
+		return date(posting_date.year, 1, 1), date(posting_date.year, 12, 31)
+
+	months = 3 if period == "Quarterly" else 1
+	first_month = (posting_date.month - 1) // months * months + 1
+	period_start = date(posting_date.year, first_month, 1)
+	period_end = get_last_day(date(posting_date.year, first_month + months - 1, 1))
+
+	return period_start, getdate(period_end)
+
+def snapshots_complete():
+	"""snapshots exist for every period having stock ledger entries"""
+	return cint(frappe.db.get_default("stock_balance_snapshots_built"))
+
+def get_snapshot_before(item_code, warehouse, posting_date):
+	"""closing balance of the latest period ending before posting_date,
+		in the shape of the Stock Ledger Entry it was taken from"""
+	snapshot = frappe.db.sql("""select stock_ledger_entry as name, period_end_date,
+			item_code, warehouse, posting_date, posting_time, qty_after_transaction, valuation_rate,
+			stock_value, stock_queue, company
+		from `tabStock Balance Snapshot`
+		where item_code=%s and warehouse=%s and period_end_date < %s
+		order by period_end_date desc limit 1""", (item_code, warehouse, posting_date), as_dict=1)
+
+	return snapshot and snapshot[0] or None
+
+def make_snapshot(item_code, warehouse, sle, period=None):
+	"""save balance after `sle` as the closing balance of its period"""
+	period_end_date = get_period_dates(sle.posting_date, period)[1]
+
+	# one snapshot per item, warehouse and period, so that it can be upserted
+	name = hashlib.md5(cstr("%s::%s::%s" % (item_code, warehouse, period_end_date))
+		.encode("utf-8")).hexdigest()[:20]
+
+	frappe.db.sql("""insert into `tabStock Balance Snapshot`
+		(name, creation, modified, owner, modified_by, docstatus, item_code, warehouse,
+			period_end_date, company, stock_ledger_entry, posting_date, posting_time,
+			qty_after_transaction, valuation_rate, stock_value, stock_queue)
+		values (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, 0, %(item_code)s, %(warehouse)s,
+			%(period_end_date)s, %(company)s, %(sle)s, %(posting_date)s, %(posting_time)s,
+			%(qty_after_transaction)s, %(valuation_rate)s, %(stock_value)s, %(stock_queue)s)
+		on duplicate key update modified=%(now)s, modified_by=%(user)s,
+			stock_ledger_entry=%(sle)s, posting_date=%(posting_date)s,
+			posting_time=%(posting_time)s, qty_after_transaction=%(qty_after_transaction)s,
+			valuation_rate=%(valuation_rate)s, stock_value=%(stock_value)s,
+			stock_queue=%(stock_queue)s""", {
+				"name": name,
+				"now": now(),
+				"user": frappe.session.user,
+				"item_code": item_code,
+				"warehouse": warehouse,
+				"period_end_date": period_end_date,
+				"company": sle.company,
+				"sle": sle.name,
+				"posting_date": sle.posting_date,
+				"posting_time": sle.posting_time,
+				"qty_after_transaction": sle.qty_after_transaction,
+				"valuation_rate": sle.valuation_rate,
+				"stock_value": sle.stock_value,
+				"stock_queue": sle.stock_queue
+			})
+
+def delete_snapshots_for_voucher(voucher_type, voucher_no):
+	"""snapshots taken at entries of a voucher are retaken at the last
+		remaining entry of their period, when the entries are removed"""
+	for snapshot in frappe.db.sql("""select name, item_code, warehouse, period_end_date
+		from `tabStock Balance Snapshot` where stock_ledger_entry in
+			(select name from `tabStock Ledger Entry` where voucher_type=%s and voucher_no=%s)""",
+		(voucher_type, voucher_no), as_dict=1):
+			frappe.db.sql("""delete from `tabStock Balance Snapshot` where name=%s""", snapshot.name)
+
+			sle = frappe.db.sql("""select name, posting_date, posting_time, company,
+					qty_after_transaction, valuation_rate, stock_value, stock_queue
+				from `tabStock Ledger Entry`
+				where item_code=%s and warehouse=%s and posting_date between %s and %s
+				and ifnull(is_cancelled, 'No')='No'
+				and not (voucher_type=%s and voucher_no=%s)
+				order by posting_datetime desc, name desc limit 1""",
+				(snapshot.item_code, snapshot.warehouse,
+					get_period_dates(snapshot.period_end_date)[0], snapshot.period_end_date,
+					voucher_type, voucher_no), as_dict=1)
+
+			if sle:
+				make_snapshot(snapshot.item_code, snapshot.warehouse, sle[0])
+
+def rebuild_snapshots(period=None):
+	"""rebuild snapshots of all items and warehouses from the stock ledger"""
+	frappe.db.set_default("stock_balance_snapshots_built", 0)
+	frappe.db.sql("""delete from `tabStock Balance Snapshot`""")
+
+	period = period or get_snapshot_period()
+	for item_code, warehouse in frappe.db.sql("""select distinct item_code, warehouse
+		from `tabStock Ledger Entry`"""):
+			last_sle = None
+			for sle in frappe.db.sql("""select name, posting_date, posting_time, company,
+					qty_after_transaction, valuation_rate, stock_value, stock_queue
+				from `tabStock Ledger Entry`
+				where item_code=%s and warehouse=%s and ifnull(is_cancelled, 'No')='No'
+				order by posting_datetime asc, name asc""",
+				(item_code, warehouse), as_dict=1):
+					if last_sle and get_period_dates(sle.posting_date, period) != \
+							get_period_dates(last_sle.posting_date, period):
+						make_snapshot(item_code, warehouse, last_sle, period)
+					last_sle = sle
+
+			if last_sle:
+				make_snapshot(item_code, warehouse, last_sle, period)
+
+	frappe.db.set_default("stock_balance_snapshots_built", 1)
+
+def queue_rebuild_snapshots():
+	"""drop snapshots at once and leave the rebuild to the scheduler, so that it does not
+		run in the request changing the snapshot period"""
+	frappe.db.set_default("stock_balance_snapshots_built", 0)
+	frappe.db.sql("""delete from `tabStock Balance Snapshot`""")
+	frappe.db.set_default("stock_balance_snapshots_rebuild_pending", 1)
+
+def rebuild_pending_snapshots():
+	"""scheduler task, rebuilds snapshots queued by `queue_rebuild_snapshots`"""
+	if not cint(frappe.db.get_default("stock_balance_snapshots_rebuild_pending")):
+		return
+
+	# claimed before starting, so that the next run does not start it again
+	frappe.db.set_default("stock_balance_snapshots_rebuild_pending", 0)
+	frappe.db.commit()
+
+	try:
+		rebuild_snapshots()
+		frappe.db.commit()
+	except Exception:
+		frappe.db.rollback()
+		frappe.db.set_default("stock_balance_snapshots_rebuild_pending", 1)
+		frappe.db.commit()
+		raise
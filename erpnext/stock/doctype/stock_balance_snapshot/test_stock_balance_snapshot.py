@@ -0,0 +1,91 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest
+from frappe.utils import flt, getdate
+from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+	import get_period_dates, get_snapshot_before, snapshots_complete
+
+class TestStockBalanceSnapshot(unittest.TestCase):
+	def test_period_dates(self):
+		self.assertEquals(get_period_dates("2014-02-10", "Monthly"),
+			(getdate("2014-02-01"), getdate("2014-02-28")))
+		self.assertEquals(get_period_dates("2014-05-10", "Quarterly"),
+			(getdate("2014-04-01"), getdate("2014-06-30")))
+		self.assertEquals(get_period_dates("2014-05-10", "Yearly"),
+			(getdate("2014-01-01"), getdate("2014-12-31")))
+
+	def test_snapshot_on_stock_entry(self):
+		from erpnext.stock.doctype.stock_entry.test_stock_entry import test_records
+		frappe.db.sql("delete from `tabStock Ledger Entry`")
+		frappe.db.sql("delete from `tabStock Balance Snapshot`")
+		frappe.db.sql("delete from `tabBin`")
+
+		se = frappe.copy_doc(test_records[0])
+		se.insert()
+		se.submit()
+
+		row = se.get("mtn_details")[0]
+		period_end_date = get_period_dates(se.posting_date)[1]
+		snapshot = get_snapshot_before(row.item_code, row.t_warehouse,
+			frappe.utils.add_days(period_end_date, 1))
+
+		self.assertTrue(snapshot)
+		self.assertEquals(flt(snapshot.qty_after_transaction), flt(row.transfer_qty))
+		self.assertEquals(snapshot.name, frappe.db.get_value("Stock Ledger Entry",
+			{"voucher_type": "Stock Entry", "voucher_no": se.name}))
+
+	def test_repost_after_snapshot(self):
+		from erpnext.stock.doctype.stock_entry.test_stock_entry import test_records
+		from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot import rebuild_snapshots
+		from erpnext.stock.stock_ledger import update_entries_after
+		frappe.db.sql("delete from `tabStock Ledger Entry`")
+		frappe.db.sql("delete from `tabStock Balance Snapshot`")
+		frappe.db.sql("delete from `tabBin`")
+
+		se = frappe.copy_doc(test_records[0])
+		se.insert()
+		se.submit()
+		rebuild_snapshots("Monthly")
+
+		try:
+			# first entry of the next period has only the snapshot before it
+			se = frappe.copy_doc(test_records[0])
+			se.posting_date = "2013-02-05"
+			se.insert()
+			se.submit()
+
+			row = se.get("mtn_details")[0]
+			update_entries_after({"item_code": row.item_code, "warehouse": row.t_warehouse,
+				"posting_date": se.posting_date, "posting_time": se.posting_time})
+		finally:
+			frappe.db.set_default("stock_balance_snapshots_built", 0)
+
+		self.assertEquals(flt(frappe.db.get_value("Stock Ledger Entry",
+			{"voucher_type": "Stock Entry", "voucher_no": se.name}, "qty_after_transaction")),
+			2 * flt(row.transfer_qty))
+		self.assertEquals(flt(frappe.db.get_value("Bin", {"item_code": row.item_code,
+			"warehouse": row.t_warehouse}, "actual_qty")), 2 * flt(row.transfer_qty))
+
+	def test_rebuild_on_period_change(self):
+		from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+			import rebuild_pending_snapshots
+
+		stock_settings = frappe.get_doc("Stock Settings")
+		period = stock_settings.stock_balance_snapshot_period or "Monthly"
+		stock_settings.stock_balance_snapshot_period = "Yearly" if period != "Yearly" else "Monthly"
+		stock_settings.save()
+
+		try:
+			# the save only queues the rebuild
+			self.assertFalse(snapshots_complete())
+			self.assertFalse(frappe.db.sql("""select name from `tabStock Balance Snapshot`"""))
+
+			rebuild_pending_snapshots()
+			self.assertTrue(snapshots_complete())
+		finally:
+			stock_settings.stock_balance_snapshot_period = period
+			stock_settings.save()
+			rebuild_pending_snapshots()
+			frappe.db.set_default("stock_balance_snapshots_built", 0)
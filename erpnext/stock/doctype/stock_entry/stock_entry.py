@@ -11,6 +11,7 @@ from frappe import _
 from erpnext.stock.utils import get_incoming_rate
 from erpnext.stock.stock_ledger import get_previous_sle
 from erpnext.controllers.queries import get_match_cond
+from erpnext.utilities.master_data import get_master_value
 
 class NotUpdateStockError(frappe.ValidationError): pass
 class StockOverReturnError(frappe.ValidationError): pass
@@ -77,7 +78,7 @@ class StockEntry(StockController):
 			if item.item_code not in stock_items:
 				frappe.throw(_("{0} is not a stock Item").format(item.item_code))
 			if not item.stock_uom:
-				item.stock_uom = frappe.db.get_value("Item", item.item_code, "stock_uom")
+				item.stock_uom = get_master_value("Item", item.item_code, "stock_uom")
 			if not item.uom:
 				item.uom = item.stock_uom
 			if not item.conversion_factor:
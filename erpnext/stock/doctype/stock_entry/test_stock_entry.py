@@ -39,6 +39,49 @@ class TestStockEntry(unittest.TestCase):
 
 		self.assertTrue(mr_name)
 
+	def test_reorder_dry_run(self):
+		frappe.db.sql("""delete from `tabMaterial Request Item`""")
+		frappe.db.sql("""delete from `tabMaterial Request`""")
+		self._clear_stock_account_balance()
+
+		for test_record in test_records[:2]:
+			se = frappe.copy_doc(test_record)
+			se.insert()
+			se.submit()
+
+		from erpnext.stock.utils import reorder_item
+		plan = reorder_item(dry_run=True)
+
+		candidates = dict(((d.item_code, d.warehouse), d) for d in plan.candidates)
+		candidate = candidates[("_Test Item", "_Test Warehouse - _TC")]
+		self.assertEquals(flt(candidate.projected_qty), 10)
+		self.assertEquals(flt(candidate.reorder_qty), 20)
+		self.assertEquals(candidate.company, "_Test Company")
+		self.assertTrue(candidate in plan.material_requests["Purchase"]["_Test Company"])
+		self.assertTrue("query" in plan.timings)
+
+		self.assertFalse(frappe.db.sql("""select name from `tabMaterial Request`"""))
+
+		# the first reorder row of a warehouse decides, later duplicates are ignored
+		reorder_level = frappe.db.get_value("Item Reorder", {"parent": "_Test Item",
+			"warehouse": "_Test Warehouse - _TC"}, "warehouse_reorder_level")
+		frappe.db.sql("""update `tabItem Reorder` set warehouse_reorder_level=5
+			where parent='_Test Item' and warehouse='_Test Warehouse - _TC'""")
+		frappe.db.sql("""insert into `tabItem Reorder` (name, parent, parentfield, parenttype,
+				idx, docstatus, warehouse, warehouse_reorder_level, warehouse_reorder_qty,
+				material_request_type)
+			values ('_Test Duplicate Reorder', '_Test Item', 'item_reorder', 'Item', 100, 0,
+				'_Test Warehouse - _TC', 100, 100, 'Purchase')""")
+
+		try:
+			plan = reorder_item(dry_run=True)
+			self.assertFalse([d for d in plan.candidates if d.item_code=="_Test Item"
+				and d.warehouse=="_Test Warehouse - _TC"])
+		finally:
+			frappe.db.sql("""delete from `tabItem Reorder` where name='_Test Duplicate Reorder'""")
+			frappe.db.sql("""update `tabItem Reorder` set warehouse_reorder_level=%s
+				where parent='_Test Item' and warehouse='_Test Warehouse - _TC'""", reorder_level)
+
 	def test_material_receipt_gl_entry(self):
 		self._clear_stock_account_balance()
 		set_perpetual_inventory()
@@ -609,6 +652,7 @@ class TestStockEntry(unittest.TestCase):
 		frappe.db.sql("delete from `tabStock Ledger Entry`")
 		frappe.db.sql("""delete from `tabBin`""")
 		frappe.db.sql("""delete from `tabGL Entry`""")
+		frappe.db.sql("""delete from `tabAccount Balance`""")
 
 		self.old_default_company = frappe.db.get_default("company")
 		frappe.db.set_default("company", "_Test Company")
@@ -816,6 +860,82 @@ class TestStockEntry(unittest.TestCase):
 		self.assertRaises (StockFreezeError, se.submit)
 		frappe.db.set_value("Stock Settings", None, "stock_frozen_upto_days", 0)
 
+	def test_repost_stops_when_converged(self):
+		from erpnext.stock.stock_ledger import update_entries_after
+		self._clear_stock_account_balance()
+
+		make_stock_entry("_Test Item", None, "_Test Warehouse - _TC", 10, 100)
+		make_stock_entry("_Test Item", None, "_Test Warehouse - _TC", 5, 200)
+		actual_qty = self._get_actual_qty()
+
+		args = {"item_code": "_Test Item", "warehouse": "_Test Warehouse - _TC",
+			"posting_date": "2013-01-01", "posting_time": "00:00"}
+
+		status = update_entries_after(args.copy())
+		self.assertTrue(status.converged)
+		self.assertEquals(status.updated, 0)
+		self.assertEquals(self._get_actual_qty(), actual_qty)
+
+		status = update_entries_after(args.copy(), allow_early_exit=False)
+		self.assertFalse(status.converged)
+		self.assertEquals(status.processed, 2)
+		self.assertEquals(status.updated, 0)
+
+		frappe.db.set_default("company", self.old_default_company)
+
+	def test_future_gl_reposted_for_revalued_vouchers(self):
+		self._clear_stock_account_balance()
+		set_perpetual_inventory()
+
+		def _make_entry(posting_date, qty, incoming_rate=None, issue=False):
+			se = frappe.copy_doc(test_records[0])
+			se.posting_date = posting_date
+			if issue:
+				se.purpose = "Material Issue"
+				se.get("mtn_details")[0].s_warehouse = "_Test Warehouse - _TC"
+				se.get("mtn_details")[0].t_warehouse = None
+			se.get("mtn_details")[0].qty = se.get("mtn_details")[0].transfer_qty = qty
+			se.get("mtn_details")[0].incoming_rate = incoming_rate
+			se.insert()
+			se.submit()
+			return se
+
+		receipt = _make_entry("2013-01-10", 10, 100)
+		issue = _make_entry("2013-01-15", 10, issue=True)
+		receipt_gle = frappe.db.sql("""select name from `tabGL Entry`
+			where voucher_no=%s order by name""", receipt.name)
+
+		# backdated receipt revalues the issue, but not the receipt after it
+		_make_entry("2013-01-05", 10, 200)
+
+		stock_in_hand_account = frappe.db.get_value("Account", {"account_type": "Warehouse",
+			"master_name": "_Test Warehouse - _TC"})
+		stock_value_difference = frappe.db.sql("""select sum(stock_value_difference)
+			from `tabStock Ledger Entry` where voucher_no=%s""", issue.name)[0][0]
+		self.assertNotEquals(stock_value_difference, -1000.0)
+
+		self.check_gl_entries("Stock Entry", issue.name, sorted([
+			[stock_in_hand_account, 0.0, -stock_value_difference],
+			["Stock Adjustment - _TC", -stock_value_difference, 0.0]
+		]))
+		self.assertEquals(frappe.db.sql("""select name from `tabGL Entry`
+			where voucher_no=%s order by name""", receipt.name), receipt_gle)
+
+		set_perpetual_inventory(0)
+
+	def test_sle_posting_datetime(self):
+		from erpnext.stock.utils import get_posting_datetime
+		self._clear_stock_account_balance()
+
+		se = make_stock_entry("_Test Item", None, "_Test Warehouse - _TC", 10, 100)
+		self.assertFalse(frappe.db.sql("""select name from `tabStock Ledger Entry`
+			where voucher_no=%s and posting_datetime != timestamp(posting_date, posting_time)""",
+			se.name))
+
+		self.assertEquals(str(get_posting_datetime("2014-01-01", "9:05")), "2014-01-01 09:05:00")
+
+		frappe.db.set_default("company", self.old_default_company)
+
 def make_serialized_item():
 	se = frappe.copy_doc(test_records[0])
 	se.get("mtn_details")[0].item_code = "_Test Serialized Item With Series"
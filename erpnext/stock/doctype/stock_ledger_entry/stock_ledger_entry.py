@@ -18,6 +18,7 @@ class StockLedgerEntry(Document):
 		self.validate_item()
 		validate_warehouse_company(self.warehouse, self.company)
 		self.scrub_posting_time()
+		self.set_posting_datetime()
 
 		from erpnext.accounts.utils import validate_fiscal_year
 		validate_fiscal_year(self.posting_date, self.fiscal_year,
@@ -89,9 +90,21 @@ class StockLedgerEntry(Document):
 		if not self.posting_time or self.posting_time == '00:0':
 			self.posting_time = '00:00'
 
+	def set_posting_datetime(self):
+		from erpnext.stock.utils import get_posting_datetime
+		self.posting_datetime = get_posting_datetime(self.posting_date, self.posting_time)
+
 def on_doctype_update():
 	if not frappe.db.sql("""show index from `tabStock Ledger Entry`
 		where Key_name="posting_sort_index" """):
 		frappe.db.commit()
 		frappe.db.sql("""alter table `tabStock Ledger Entry`
 			add index posting_sort_index(posting_date, posting_time, name)""")
+
+	if not frappe.db.sql("""show index from `tabStock Ledger Entry`
+		where Key_name="posting_datetime_index" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabStock Ledger Entry`
+			add index posting_datetime_index(posting_datetime, name),
+			add index item_warehouse_posting_datetime_index(item_code, warehouse,
+				posting_datetime, name)""")
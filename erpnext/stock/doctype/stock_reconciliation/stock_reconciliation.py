@@ -7,9 +7,15 @@ import frappe.defaults
 import json
 from frappe import msgprint, _
 from frappe.utils import cstr, flt, cint
-from erpnext.stock.stock_ledger import update_entries_after
+from erpnext.stock.stock_ledger import update_entries_after, make_sl_entries_in_bulk
+from erpnext.stock.fifo_queue import FifoQueue
+from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+	import delete_snapshots_for_voucher
 from erpnext.controllers.stock_controller import StockController
 
+# rows of a sheet, posted in bulk
+max_rows = 50000
+
 class StockReconciliation(StockController):
 	def validate(self):
 		self.head_row = ["Item Code", "Warehouse", "Quantity", "Valuation Rate"]
@@ -50,24 +56,28 @@ class StockReconciliation(StockController):
 			return _("Row # {0}: ").format(row_num+head_row_no+2) + msg
 
 		self.validation_messages = []
-		item_warehouse_combinations = []
 
 		# validate no of rows
 		rows = data[1:]
-		if len(rows) > 100:
-			msgprint(_("""Sorry! We can only allow upto 100 rows for Stock Reconciliation."""),
+		if len(rows) > max_rows:
+			msgprint(_("Sorry! We can only allow upto {0} rows for Stock Reconciliation.").format(max_rows),
 				raise_exception=True)
+
+		items = get_item_details(set(row[0] for row in rows))
+		warehouses = set(d[0] for d in frappe.db.sql("""select name from tabWarehouse"""))
+		item_warehouse_combinations = set()
+
 		for row_num, row in enumerate(rows):
 			# find duplicates
-			if [row[0], row[1]] in item_warehouse_combinations:
+			if (row[0], row[1]) in item_warehouse_combinations:
 				self.validation_messages.append(_get_msg(row_num, _("Duplicate entry")))
 			else:
-				item_warehouse_combinations.append([row[0], row[1]])
+				item_warehouse_combinations.add((row[0], row[1]))
 
-			self.validate_item(row[0], row_num+head_row_no+2)
+			self.validate_item(row[0], row_num+head_row_no+2, items.get(row[0]))
 
 			# validate warehouse
-			if not frappe.db.get_value("Warehouse", row[1]):
+			if row[1] not in warehouses:
 				self.validation_messages.append(_get_msg(row_num, _("Warehouse not found in the system")))
 
 			# if both not specified
@@ -92,19 +102,19 @@ class StockReconciliation(StockController):
 
 			raise frappe.ValidationError
 
-	def validate_item(self, item_code, row_num):
+	def validate_item(self, item_code, row_num, item):
 		from erpnext.stock.doctype.item.item import validate_end_of_life, \
 			validate_is_stock_item, validate_cancelled_item
 
 		# using try except to catch all validation msgs and display together
 
 		try:
-			item = frappe.get_doc("Item", item_code)
 			if not item:
 				raise frappe.ValidationError, (_("Item: {0} not found in the system").format(item_code))
 
 			# end of life and stock item
-			validate_end_of_life(item_code, item.end_of_life, verbose=0)
+			if item.end_of_life:
+				validate_end_of_life(item_code, item.end_of_life, verbose=0)
 			validate_is_stock_item(item_code, item.is_stock_item, verbose=0)
 
 			# item should not be serialized
@@ -125,25 +135,26 @@ class StockReconciliation(StockController):
 
 	def insert_stock_ledger_entries(self):
 		"""	find difference between current and expected entries
-			and create stock ledger entries based on the difference"""
-		from erpnext.stock.utils import get_valuation_method
-		from erpnext.stock.stock_ledger import get_previous_sle
+			and create stock ledger entries based on the difference.
 
+			previous balances and items of all rows are looked up at once,
+			and the entries are posted together"""
 		row_template = ["item_code", "warehouse", "qty", "valuation_rate"]
 
 		if not self.reconciliation_json:
 			msgprint(_("""Stock Reconciliation file not uploaded"""), raise_exception=1)
 
 		data = json.loads(self.reconciliation_json)
-		for row_num, row in enumerate(data[data.index(self.head_row)+1:]):
-			row = frappe._dict(zip(row_template, row))
+		rows = [frappe._dict(zip(row_template, row)) for row in data[data.index(self.head_row)+1:]]
+
+		self.items = get_item_details(set(row.item_code for row in rows))
+		previous_sles = get_previous_sles(set((row.item_code, row.warehouse) for row in rows),
+			self.posting_date, self.posting_time)
+		default_valuation_method = frappe.defaults.get_global_default("valuation_method") or "FIFO"
+
+		for row_num, row in enumerate(rows):
 			row["row_num"] = row_num
-			previous_sle = get_previous_sle({
-				"item_code": row.item_code,
-				"warehouse": row.warehouse,
-				"posting_date": self.posting_date,
-				"posting_time": self.posting_time
-			})
+			previous_sle = previous_sles.get((row.item_code, row.warehouse), {})
 
 			# check valuation rate mandatory
 			if row.qty != "" and not row.valuation_rate and \
@@ -156,12 +167,14 @@ class StockReconciliation(StockController):
 			change_in_rate = row.valuation_rate != "" and \
 				(flt(row.valuation_rate) - flt(previous_sle.get("valuation_rate")))
 
-			if get_valuation_method(row.item_code) == "Moving Average":
+			if (self.items[row.item_code].valuation_method or default_valuation_method) == "Moving Average":
 				self.sle_for_moving_avg(row, previous_sle, change_in_qty, change_in_rate)
 
 			else:
 				self.sle_for_fifo(row, previous_sle, change_in_qty, change_in_rate)
 
+		make_sl_entries_in_bulk(self.entries)
+
 	def sle_for_moving_avg(self, row, previous_sle, change_in_qty, change_in_rate):
 		"""Insert Stock Ledger Entries for Moving Average valuation"""
 		def _get_incoming_rate(qty, valuation_rate, previous_qty, previous_valuation_rate):
@@ -200,13 +213,12 @@ class StockReconciliation(StockController):
 
 	def sle_for_fifo(self, row, previous_sle, change_in_qty, change_in_rate):
 		"""Insert Stock Ledger Entries for FIFO valuation"""
-		previous_stock_queue = json.loads(previous_sle.get("stock_queue") or "[]")
-		previous_stock_qty = sum((batch[0] for batch in previous_stock_queue))
-		previous_stock_value = sum((batch[0] * batch[1] for batch in \
-			previous_stock_queue))
+		previous_stock_queue = FifoQueue.loads(previous_sle.get("stock_queue"))
+		previous_stock_qty = previous_stock_queue.qty
+		previous_stock_value = previous_stock_queue.value
 
 		def _insert_entries():
-			if previous_stock_queue != [[row.qty, row.valuation_rate]]:
+			if previous_stock_queue.to_list() != [[row.qty, row.valuation_rate]]:
 				# make entry as per attachment
 				if row.qty:
 					row["voucher_detail_no"] = "Row: " + cstr(row.row_num) + "/Actual Entry"
@@ -248,15 +260,14 @@ class StockReconciliation(StockController):
 			"voucher_type": self.doctype,
 			"voucher_no": self.name,
 			"company": self.company,
-			"stock_uom": frappe.db.get_value("Item", row.item_code, "stock_uom"),
+			"stock_uom": self.items[row.item_code].stock_uom,
 			"voucher_detail_no": row.voucher_detail_no,
 			"fiscal_year": self.fiscal_year,
 			"is_cancelled": "No"
 		})
 		args.update(opts)
-		self.make_sl_entries([args])
 
-		# append to entries
+		# posted together, after all rows
 		self.entries.append(args)
 
 	def delete_and_repost_sle(self):
@@ -268,6 +279,7 @@ class StockReconciliation(StockController):
 			(self.doctype, self.name), as_dict=1)
 
 		# delete entries
+		delete_snapshots_for_voucher(self.doctype, self.name)
 		frappe.db.sql("""delete from `tabStock Ledger Entry`
 			where voucher_type=%s and voucher_no=%s""", (self.doctype, self.name))
 
@@ -298,6 +310,50 @@ class StockReconciliation(StockController):
 					"report_type") == "Profit and Loss":
 				frappe.throw(_("'Profit and Loss' type Account {0} used be set for Opening Entry").format(self.expense_account))
 
+def get_item_details(item_codes, chunk_size=1000):
+	"""attributes of items of a sheet, looked up with one query per chunk of items"""
+	item_codes, items = list(item_codes), {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		chunk = item_codes[i:i + chunk_size]
+		for d in frappe.db.sql("""select name, stock_uom, valuation_method, end_of_life,
+			is_stock_item, has_serial_no, has_batch_no, docstatus
+			from tabItem where name in ({0})""".format(", ".join(["%s"] * len(chunk))),
+			tuple(chunk), as_dict=1):
+				items[d.name] = d
+
+	return items
+
+def get_previous_sles(item_warehouses, posting_date, posting_time, chunk_size=500):
+	"""last entry on or before posting date and time of each (item, warehouse),
+		looked up with one grouped query per chunk of items"""
+	from erpnext.stock.utils import get_posting_datetime
+
+	posting_datetime = get_posting_datetime(posting_date, posting_time)
+	item_codes = list(set(item_code for item_code, warehouse in item_warehouses))
+
+	previous_sles = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		chunk = item_codes[i:i + chunk_size]
+
+		# of entries posted at the same time, the one with the last name wins
+		for sle in frappe.db.sql("""select sle.item_code, sle.warehouse,
+				sle.qty_after_transaction, sle.valuation_rate, sle.stock_queue
+			from `tabStock Ledger Entry` sle,
+				(select item_code, warehouse, max(posting_datetime) as posting_datetime
+					from `tabStock Ledger Entry`
+					where item_code in ({0}) and posting_datetime <= %s
+						and ifnull(is_cancelled, 'No')='No'
+					group by item_code, warehouse) last_sle
+			where sle.item_code = last_sle.item_code and sle.warehouse = last_sle.warehouse
+				and sle.posting_datetime = last_sle.posting_datetime
+				and ifnull(sle.is_cancelled, 'No')='No'
+			order by sle.name""".format(", ".join(["%s"] * len(chunk))),
+			tuple(chunk) + (posting_datetime,), as_dict=1):
+				if (sle.item_code, sle.warehouse) in item_warehouses:
+					previous_sles[(sle.item_code, sle.warehouse)] = sle
+
+	return previous_sles
+
 @frappe.whitelist()
 def upload():
 	from frappe.utils.datautils import read_csv_content_from_uploaded_file
@@ -169,10 +169,52 @@ class TestStockReconciliation(unittest.TestCase):
 		frappe.defaults.set_global_default("auto_accounting_for_stock", 0)
 
 
+	def test_reco_with_many_rows(self):
+		frappe.defaults.set_global_default("auto_accounting_for_stock", 0)
+		self.cleanup_data()
+		self.insert_existing_sle("FIFO")
+
+		rows = [["_Test Item", "_Test Warehouse - _TC", 30, 1000],
+			["_Test Item", "_Test Warehouse 1 - _TC", 12, 500],
+			["_Test Item Home Desktop 100", "_Test Warehouse - _TC", 7, 100]]
+
+		stock_reco = frappe.get_doc({
+			"doctype": "Stock Reconciliation",
+			"posting_date": "2012-12-26",
+			"posting_time": "12:00",
+			"fiscal_year": get_fiscal_year("2012-12-26")[0],
+			"company": "_Test Company",
+			"expense_account": "Stock Adjustment - _TC",
+			"cost_center": "_Test Cost Center - _TC",
+			"reconciliation_json": json.dumps([["Item Code", "Warehouse", "Quantity",
+				"Valuation Rate"]] + rows)
+		})
+		stock_reco.insert()
+		stock_reco.submit()
+
+		# all entries of the voucher are valued once posted together
+		self.assertFalse(frappe.db.sql("""select name from `tabStock Ledger Entry`
+			where voucher_type='Stock Reconciliation' and voucher_no=%s
+			and qty_after_transaction is null""", stock_reco.name))
+
+		for item_code, warehouse, qty, rate in rows:
+			self.assertEquals(flt(frappe.db.sql("""select qty_after_transaction
+				from `tabStock Ledger Entry`
+				where item_code=%s and warehouse=%s and posting_date='2012-12-26'
+				order by posting_datetime desc, name desc limit 1""",
+				(item_code, warehouse))[0][0]), qty)
+
+		# entries after the reconciliation reduce _Test Warehouse - _TC by 5
+		self.assertEquals(flt(frappe.db.get_value("Bin", {"item_code": "_Test Item",
+			"warehouse": "_Test Warehouse - _TC"}, "actual_qty")), 25)
+		self.assertEquals(flt(frappe.db.get_value("Bin", {"item_code": "_Test Item",
+			"warehouse": "_Test Warehouse 1 - _TC"}, "actual_qty")), 12)
+
 	def cleanup_data(self):
 		frappe.db.sql("delete from `tabStock Ledger Entry`")
 		frappe.db.sql("delete from tabBin")
 		frappe.db.sql("delete from `tabGL Entry`")
+		frappe.db.sql("delete from `tabAccount Balance`")
 
 	def submit_stock_reconciliation(self, qty, rate, posting_date, posting_time):
 		stock_reco = frappe.get_doc({
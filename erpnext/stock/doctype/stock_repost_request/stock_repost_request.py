@@ -0,0 +1,115 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+import frappe.defaults
+import hashlib
+from frappe.utils import cint, cstr, now
+
+from frappe.model.document import Document
+from erpnext.stock.utils import get_posting_datetime
+
+class StockRepostRequest(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabStock Repost Request`
+		where Key_name="status_posting_datetime_index" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabStock Repost Request`
+			add index status_posting_datetime_index(status, posting_datetime)""")
+
+def is_reposting_deferred():
+	return cint(frappe.db.get_value("Stock Settings", None, "defer_back_dated_reposting"))
+
+def enqueue_repost(item_code, warehouse, posting_date, posting_time):
+	"""queue reposting of an item and warehouse from posting date and time.
+		there is one request per item and warehouse, which keeps the earliest
+		posting datetime of all requests made before it is processed"""
+	name = hashlib.md5(cstr("%s::%s" % (item_code, warehouse)).encode("utf-8")).hexdigest()[:20]
+	timestamp = now()
+
+	frappe.db.sql("""insert into `tabStock Repost Request`
+		(name, creation, modified, owner, modified_by, docstatus, item_code, warehouse,
+			posting_date, posting_time, posting_datetime, status)
+		values (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, 0, %(item_code)s, %(warehouse)s,
+			%(posting_date)s, %(posting_time)s, %(posting_datetime)s, 'Queued')
+		on duplicate key update modified=values(modified), modified_by=values(modified_by),
+			posting_date=if(values(posting_datetime) < posting_datetime,
+				values(posting_date), posting_date),
+			posting_time=if(values(posting_datetime) < posting_datetime,
+				values(posting_time), posting_time),
+			posting_datetime=least(posting_datetime, values(posting_datetime)),
+			status='Queued', error=null""", {
+				"name": name,
+				"now": timestamp,
+				"user": frappe.session.user,
+				"item_code": item_code,
+				"warehouse": warehouse,
+				"posting_date": posting_date,
+				"posting_time": posting_time or "00:00",
+				"posting_datetime": get_posting_datetime(posting_date, posting_time)
+			})
+
+def get_pending_reposts(item_code=None, warehouse=None):
+	"""item, warehouse and posting datetime from which balances are still to be reposted"""
+	conditions, values = "", {"item_code": item_code, "warehouse": warehouse}
+	if item_code:
+		conditions += " and item_code=%(item_code)s"
+	if warehouse:
+		conditions += " and warehouse=%(warehouse)s"
+
+	return frappe.db.sql("""select item_code, warehouse, posting_datetime, status
+		from `tabStock Repost Request` where 1=1 {0}
+		order by posting_datetime""".format(conditions), values, as_dict=1)
+
+def process_repost_queue(limit=100):
+	"""repost queued requests, earliest first. called by the scheduler"""
+	for request in frappe.db.sql("""select name from `tabStock Repost Request`
+		where status='Queued' order by posting_datetime limit %s""", cint(limit), as_dict=1):
+			process_repost_request(request.name)
+
+def process_repost_request(name):
+	request = frappe.db.sql("""select name, item_code, warehouse, posting_date, posting_time
+		from `tabStock Repost Request` where name=%s and status='Queued' for update""",
+		name, as_dict=1)
+	if not request:
+		return
+
+	request = request[0]
+	frappe.db.sql("""update `tabStock Repost Request` set status='Running' where name=%s""", name)
+	frappe.db.commit()
+
+	try:
+		repost(request)
+
+		# a request queued again while this one was running is kept for the next run
+		frappe.db.sql("""delete from `tabStock Repost Request`
+			where name=%s and status='Running'""", name)
+		frappe.db.commit()
+	except Exception:
+		frappe.db.rollback()
+		frappe.db.sql("""update `tabStock Repost Request` set status='Failed', error=%s
+			where name=%s and status='Running'""", (frappe.get_traceback(), name))
+		frappe.db.commit()
+
+def repost(request):
+	"""repost stock ledger of the request's item and warehouse, and GL Entries
+		of the vouchers revalued by it"""
+	from erpnext.stock.stock_ledger import update_entries_after
+	from erpnext.controllers.stock_controller import update_gl_entries_after, get_warehouse_account
+
+	frappe.local.stockledger_exceptions = []
+	update_entries_after({
+		"item_code": request.item_code,
+		"warehouse": request.warehouse,
+		"posting_date": request.posting_date,
+		"posting_time": request.posting_time
+	}, verbose=0)
+
+	if cint(frappe.defaults.get_global_default("auto_accounting_for_stock")):
+		warehouse_account = get_warehouse_account()
+		if warehouse_account.get(request.warehouse):
+			update_gl_entries_after(request.posting_date, request.posting_time,
+				{request.warehouse: warehouse_account[request.warehouse]}, [request.item_code])
@@ -0,0 +1,68 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest
+from frappe.utils import flt
+from erpnext.stock.doctype.stock_repost_request.stock_repost_request \
+	import get_pending_reposts, process_repost_queue
+
+class TestStockRepostRequest(unittest.TestCase):
+	def setUp(self):
+		for doctype in ("Stock Ledger Entry", "Stock Balance Snapshot", "Bin", "GL Entry",
+			"Account Balance", "Stock Repost Request"):
+				frappe.db.sql("delete from `tab%s`" % doctype)
+
+		frappe.db.set_value("Stock Settings", None, "defer_back_dated_reposting", 1)
+
+	def tearDown(self):
+		frappe.db.set_value("Stock Settings", None, "defer_back_dated_reposting", 0)
+
+	def test_back_dated_entry_is_queued(self):
+		self.make_entry("2013-01-10", 10)
+		issue = self.make_entry("2013-01-15", -5)
+		self.assertFalse(get_pending_reposts("_Test Item", "_Test Warehouse - _TC"))
+
+		# back-dated entries for the same item and warehouse make one request
+		self.make_entry("2013-01-08", 10)
+		self.make_entry("2013-01-05", 10)
+
+		pending = get_pending_reposts("_Test Item", "_Test Warehouse - _TC")
+		self.assertEquals(len(pending), 1)
+		self.assertEquals(str(pending[0].posting_datetime)[:10], "2013-01-05")
+		self.assertEquals(self.get_qty_after_transaction(issue.name), 5)
+
+		process_repost_queue()
+
+		self.assertFalse(get_pending_reposts("_Test Item", "_Test Warehouse - _TC"))
+		self.assertEquals(self.get_qty_after_transaction(issue.name), 25)
+		self.assertEquals(flt(frappe.db.get_value("Bin", {"item_code": "_Test Item",
+			"warehouse": "_Test Warehouse - _TC"}, "actual_qty")), 25)
+
+	def test_negative_stock_checked_before_deferring(self):
+		from erpnext.stock.stock_ledger import NegativeStockError
+		frappe.db.set_default("allow_negative_stock", 0)
+
+		self.make_entry("2013-01-10", 10)
+		self.make_entry("2013-01-15", -8)
+
+		# stock is 10 on the back-date, but the later issue would go negative
+		self.assertRaises(NegativeStockError, self.make_entry, "2013-01-12", -5)
+		self.assertFalse(get_pending_reposts("_Test Item", "_Test Warehouse - _TC"))
+
+	def make_entry(self, posting_date, qty):
+		from erpnext.stock.doctype.stock_entry.test_stock_entry import test_records
+		se = frappe.copy_doc(test_records[0])
+		se.posting_date = posting_date
+		if qty < 0:
+			se.purpose = "Material Issue"
+			se.get("mtn_details")[0].s_warehouse = "_Test Warehouse - _TC"
+			se.get("mtn_details")[0].t_warehouse = None
+		se.get("mtn_details")[0].qty = se.get("mtn_details")[0].transfer_qty = abs(qty)
+		se.insert()
+		se.submit()
+		return se
+
+	def get_qty_after_transaction(self, voucher_no):
+		return flt(frappe.db.get_value("Stock Ledger Entry", {"voucher_no": voucher_no},
+			"qty_after_transaction"))
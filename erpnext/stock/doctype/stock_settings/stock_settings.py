@@ -25,3 +25,14 @@ class StockSettings(Document):
 		if submitted_stock_frozen > stock_frozen_limit:
 			self.stock_frozen_upto_days = stock_frozen_limit
 			frappe.msgprint (_("`Freeze Stocks Older Than` should be smaller than %d days.") %stock_frozen_limit)
+
+		self.validate_snapshot_period()
+
+	def validate_snapshot_period(self):
+		from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+			import get_snapshot_period, queue_rebuild_snapshots
+
+		period = self.stock_balance_snapshot_period or "Monthly"
+		if period != get_snapshot_period():
+			# snapshots of the old period would no longer be kept up to date
+			queue_rebuild_snapshots()
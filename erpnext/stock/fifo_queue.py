@@ -0,0 +1,105 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import json
+from collections import deque
+from frappe.utils import flt
+
+class FifoQueue(object):
+	"""
+		FIFO layers of stock, oldest first, as [qty, rate] pairs.
+
+		an incoming qty at the same rate as the latest layer is merged into it,
+		so items received repeatedly at the same rate keep a short queue.
+		the rate can be any value, e.g. posting date for stock ageing.
+
+		stored in Stock Ledger Entry as compact JSON, which also reads
+		queues saved in the older (spaced) JSON format
+	"""
+	def __init__(self, layers=None):
+		self.layers = deque([layer[0], layer[1]] for layer in (layers or []))
+
+	@classmethod
+	def loads(cls, stock_queue):
+		return cls(json.loads(stock_queue or "[]"))
+
+	def dumps(self):
+		return json.dumps(list(self.layers), separators=(",", ":"))
+
+	def to_list(self):
+		return [list(layer) for layer in self.layers]
+
+	def __len__(self):
+		return len(self.layers)
+
+	@property
+	def qty(self):
+		return sum(flt(layer[0]) for layer in self.layers)
+
+	@property
+	def value(self):
+		return sum(flt(layer[0]) * flt(layer[1]) for layer in self.layers)
+
+	def add(self, qty, rate):
+		"""add incoming qty, a negative (or empty) latest layer is filled up first"""
+		if not self.layers:
+			self.layers.append([0, 0])
+
+		last = self.layers[-1]
+		if last[0] > 0:
+			if last[1] == rate:
+				last[0] += qty
+			else:
+				self.layers.append([qty, rate])
+		else:
+			qty = last[0] + qty
+			self.layers[-1] = [qty, qty > 0 and rate or 0]
+
+	def remove(self, qty, allow_negative=True):
+		"""
+			remove outgoing qty from the oldest layers and return the
+			consumed [qty, rate] pairs. if there is not enough stock,
+			the shortfall is kept as a negative layer if allow_negative
+		"""
+		consumed = []
+		qty_to_pop = abs(qty)
+		while qty_to_pop:
+			if not self.layers:
+				if not allow_negative:
+					break
+				self.layers.append([0, 0])
+
+			batch = self.layers[0]
+			if 0 < batch[0] <= qty_to_pop:
+				# if batch qty > 0
+				# not enough or exactly same qty in current batch, clear batch
+				consumed.append(batch)
+				qty_to_pop -= batch[0]
+				self.layers.popleft()
+			else:
+				# all from current batch
+				consumed.append([qty_to_pop, batch[1]])
+				batch[0] -= qty_to_pop
+				qty_to_pop = 0
+
+		return consumed
+
+	def get_outgoing_rate(self, qty):
+		"""average rate of qty if it were removed now, without changing the queue"""
+		available_qty_for_outgoing, outgoing_cost = 0, 0
+		qty_to_pop = abs(qty)
+		for batch_qty, rate in self.layers:
+			if not qty_to_pop:
+				break
+
+			if 0 < batch_qty <= qty_to_pop:
+				available_qty_for_outgoing += flt(batch_qty)
+				outgoing_cost += flt(batch_qty) * flt(rate)
+				qty_to_pop -= batch_qty
+			else:
+				available_qty_for_outgoing += flt(qty_to_pop)
+				outgoing_cost += flt(qty_to_pop) * flt(rate)
+				qty_to_pop = 0
+
+		return available_qty_for_outgoing and outgoing_cost / available_qty_for_outgoing or 0.0
@@ -4,7 +4,7 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _, throw
-from frappe.utils import flt, cint, add_days
+from frappe.utils import flt, cint, cstr, add_days
 import json
 
 class MultiplePricingRuleConflict(frappe.ValidationError): pass
@@ -31,6 +31,29 @@ def get_item_details(args):
 		}
 	"""
 
+	args = process_args(args)
+	return get_item_details_for_row(args, ItemDetailsContext([args]))
+
+@frappe.whitelist()
+def get_item_details_for_items(items, args):
+	"""
+		item details of all item rows of a document, same as get_item_details
+		for each row, but items, bins and item prices of all rows are fetched together
+
+		items = [{"item_code": "", "qty": 1.0, "warehouse": None}, ...]
+		args = document level values, as in get_item_details
+	"""
+	if isinstance(items, basestring):
+		items = json.loads(items)
+	if isinstance(args, basestring):
+		args = json.loads(args)
+
+	rows = [process_args(dict(args, **item)) for item in items]
+	context = ItemDetailsContext(rows)
+
+	return [get_item_details_for_row(row, context) for row in rows]
+
+def process_args(args):
 	if isinstance(args, basestring):
 		args = json.loads(args)
 
@@ -50,23 +73,28 @@ def get_item_details(args):
 	elif not args.item_code and args.serial_no:
 		args.item_code = get_item_code(serial_no=args.serial_no)
 
-	item_doc = frappe.get_doc("Item", args.item_code)
+	return args
+
+def get_item_details_for_row(args, context):
+	item_doc = context.get_item(args.item_code)
 	item = item_doc
 
 	validate_item_details(args, item)
 
-	out = get_basic_details(args, item_doc)
+	out = get_basic_details(args, item_doc, context)
 
 	get_party_item_code(args, item_doc, out)
 
 	if out.get("warehouse"):
-		out.update(get_available_qty(args.item_code, out.warehouse))
-		out.update(get_projected_qty(item.name, out.warehouse))
+		bin = context.get_bin(args.item_code, out.warehouse)
+		out.update(bin or {})
+		out.update({"projected_qty": bin.projected_qty if bin else None})
 
-	get_price_list_rate(args, item_doc, out)
+	get_price_list_rate(args, item_doc, out, context)
 
 	if args.transaction_type == "selling" and cint(args.is_pos):
-		out.update(get_pos_settings_item_details(args.company, args))
+		out.update(get_pos_settings_item_details(args.company, args,
+			context.get_pos_settings(args.company), context))
 
 	apply_pricing_rule(out, args)
 
@@ -116,8 +144,9 @@ def validate_item_details(args, item):
 		if args.get("is_subcontracted") == "Yes" and item.is_sub_contracted_item != "Yes":
 			throw(_("Item {0} must be a Sub-contracted Item").format(item.name))
 
-def get_basic_details(args, item_doc):
+def get_basic_details(args, item_doc, context=None):
 	item = item_doc
+	context = context or ItemDetailsContext([args])
 
 	from frappe.defaults import get_user_default_as_list
 	user_default_warehouse_list = get_user_default_as_list('warehouse')
@@ -130,9 +159,9 @@ def get_basic_details(args, item_doc):
 		"description": item.description_html or item.description,
 		"warehouse": user_default_warehouse or args.warehouse or item.default_warehouse,
 		"income_account": item.income_account or args.income_account \
-			or frappe.db.get_value("Company", args.company, "default_income_account"),
+			or context.get_company_default(args.company, "default_income_account"),
 		"expense_account": item.expense_account or args.expense_account \
-			or frappe.db.get_value("Company", args.company, "default_expense_account"),
+			or context.get_company_default(args.company, "default_expense_account"),
 		"cost_center": item.selling_cost_center \
 			if args.transaction_type == "selling" else item.buying_cost_center,
 		"batch_no": None,
@@ -156,15 +185,14 @@ def get_basic_details(args, item_doc):
 
 	return out
 
-def get_price_list_rate(args, item_doc, out):
+def get_price_list_rate(args, item_doc, out, context=None):
 	meta = frappe.get_meta(args.doctype)
+	context = context or ItemDetailsContext([args])
 
 	if meta.get_field("currency"):
-		validate_price_list(args)
-		validate_conversion_rate(args, meta)
+		context.validate_price_list_and_conversion_rate(args, meta)
 
-		price_list_rate = frappe.db.get_value("Item Price",
-			{"price_list": args.price_list, "item_code": args.item_code}, "price_list_rate")
+		price_list_rate = context.get_item_price(args.price_list, args.item_code)
 
 		if not price_list_rate: return {}
 
@@ -209,14 +237,16 @@ def validate_conversion_rate(args, meta):
 
 def get_party_item_code(args, item_doc, out):
 	if args.transaction_type == "selling":
-		customer_item_code = item_doc.get("item_customer_details", {"customer_name": args.customer})
+		customer_item_code = [d for d in item_doc.get("item_customer_details")
+			if d.customer_name == args.customer]
 		out.customer_item_code = customer_item_code[0].ref_code if customer_item_code else None
 	else:
-		item_supplier = item_doc.get("item_supplier_details", {"supplier": args.supplier})
+		item_supplier = [d for d in item_doc.get("item_supplier_details")
+			if d.supplier == args.supplier]
 		out.supplier_part_no = item_supplier[0].supplier_part_no if item_supplier else None
 
 
-def get_pos_settings_item_details(company, args, pos_settings=None):
+def get_pos_settings_item_details(company, args, pos_settings=None, context=None):
 	res = frappe._dict()
 
 	if not pos_settings:
@@ -228,8 +258,9 @@ def get_pos_settings_item_details(company, args, pos_settings=None):
 				res[fieldname] = pos_settings.get(fieldname)
 
 		if res.get("warehouse"):
-			res.actual_qty = get_available_qty(args.item_code,
-				res.warehouse).get("actual_qty")
+			bin = context.get_bin(args.item_code, res.warehouse) if context \
+				else get_available_qty(args.item_code, res.warehouse)
+			res.actual_qty = (bin or {}).get("actual_qty")
 
 	return res
 
@@ -268,46 +299,8 @@ def apply_pricing_rule(out, args):
 				rule_for_price = True
 
 def get_pricing_rules(args_dict):
-	def _get_tree_conditions(doctype, allow_blank=True):
-		field = frappe.scrub(doctype)
-		condition = ""
-		if args_dict.get(field):
-			lft, rgt = frappe.db.get_value(doctype, args_dict[field], ["lft", "rgt"])
-			parent_groups = frappe.db.sql_list("""select name from `tab%s`
-				where lft<=%s and rgt>=%s""" % (doctype, '%s', '%s'), (lft, rgt))
-
-			if parent_groups:
-				if allow_blank: parent_groups.append('')
-				condition = " ifnull("+field+", '') in ('" + "', '".join(parent_groups)+"')"
-
-		return condition
-
-
-	conditions = ""
-	for field in ["customer", "supplier", "supplier_type", "campaign", "sales_partner"]:
-			if args_dict.get(field):
-				conditions += " and ifnull("+field+", '') in (%("+field+")s, '')"
-			else:
-				conditions += " and ifnull("+field+", '') = ''"
-
-	for doctype in ["Customer Group", "Territory"]:
-		group_condition = _get_tree_conditions(doctype)
-		if group_condition:
-			conditions += " and " + group_condition
-
-	conditions += " and ifnull(for_price_list, '') in (%(price_list)s, '')"
-
-
-	if args_dict.get("transaction_date"):
-		conditions += """ and %(transaction_date)s between ifnull(valid_from, '2000-01-01')
-			and ifnull(valid_upto, '2500-12-31')"""
-
-	return frappe.db.sql("""select * from `tabPricing Rule`
-		where (item_code=%(item_code)s or {item_group_condition} or brand=%(brand)s)
-			and docstatus < 2 and ifnull(disable, 0) = 0 {conditions}
-		order by priority desc, name desc""".format(
-			item_group_condition=_get_tree_conditions("Item Group", False), conditions=conditions),
-			args_dict, as_dict=1)
+	from erpnext.accounts.doctype.pricing_rule.pricing_rule import get_applicable_pricing_rules
+	return get_applicable_pricing_rules(args_dict)
 
 def filter_pricing_rules(args_dict, pricing_rules):
 	# filter for qty
@@ -382,3 +375,101 @@ def get_projected_qty(item_code, warehouse):
 def get_available_qty(item_code, warehouse):
 	return frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
 		["projected_qty", "actual_qty"], as_dict=True) or {}
+
+class ItemDetailsContext(object):
+	"""
+		values needed to resolve item details of one or more rows of a document,
+		fetched for all rows at once on first use
+	"""
+	def __init__(self, rows):
+		self.item_codes = list(set(row.item_code for row in rows if row.get("item_code")))
+		self.items = None
+		self.bins = None
+		self.item_prices = {}
+		self.company_defaults = {}
+		self.pos_settings = {}
+		self.validated_rates = {}
+
+	def get_item(self, item_code):
+		if self.items is None:
+			self.items = self.load_items()
+
+		# names are matched case insensitively, as by the database
+		item = self.items.get(cstr(item_code).lower())
+		if not item:
+			frappe.throw(_("Item {0} not found").format(item_code), frappe.DoesNotExistError)
+
+		return item
+
+	def load_items(self):
+		"""items with the child tables used in item details, in one query per table"""
+		if not self.item_codes:
+			return {}
+
+		condition = ", ".join(["%s"] * len(self.item_codes))
+		items = {}
+		for item in frappe.db.sql("""select * from tabItem where name in ({0})""".format(condition),
+			self.item_codes, as_dict=1):
+				items[item.name.lower()] = item
+
+		for parentfield, doctype in (("item_tax", "Item Tax"),
+			("item_customer_details", "Item Customer Detail"), ("item_supplier_details", "Item Supplier")):
+				for item in items.values():
+					item[parentfield] = []
+
+				for d in frappe.db.sql("""select * from `tab{0}` where parent in ({1})
+					and parenttype='Item' and parentfield=%s order by idx""".format(doctype, condition),
+					self.item_codes + [parentfield], as_dict=1):
+						items[d.parent.lower()][parentfield].append(d)
+
+		return items
+
+	def get_bin(self, item_code, warehouse):
+		if self.bins is None:
+			self.bins = {}
+			if self.item_codes:
+				for d in frappe.db.sql("""select item_code, warehouse, projected_qty, actual_qty
+					from tabBin where item_code in ({0})""".format(", ".join(["%s"] * len(self.item_codes))),
+					self.item_codes, as_dict=1):
+						self.bins[(d.item_code.lower(), d.warehouse.lower())] = frappe._dict({
+							"projected_qty": d.projected_qty,
+							"actual_qty": d.actual_qty
+						})
+
+		return self.bins.get((cstr(item_code).lower(), cstr(warehouse).lower()))
+
+	def get_item_price(self, price_list, item_code):
+		if price_list not in self.item_prices:
+			self.item_prices[price_list] = {}
+			if self.item_codes:
+				for d in frappe.db.sql("""select item_code, price_list_rate from `tabItem Price`
+					where price_list=%s and item_code in ({0})""".format(", ".join(["%s"] * len(self.item_codes))),
+					[price_list] + self.item_codes, as_dict=1):
+						self.item_prices[price_list].setdefault(d.item_code.lower(), d.price_list_rate)
+
+		return self.item_prices[price_list].get(cstr(item_code).lower())
+
+	def get_company_default(self, company, fieldname):
+		if company not in self.company_defaults:
+			self.company_defaults[company] = frappe.db.get_value("Company", company,
+				["default_income_account", "default_expense_account"], as_dict=True) or {}
+
+		return self.company_defaults[company].get(fieldname)
+
+	def get_pos_settings(self, company):
+		if company not in self.pos_settings:
+			self.pos_settings[company] = get_pos_settings(company)
+
+		return self.pos_settings[company]
+
+	def validate_price_list_and_conversion_rate(self, args, meta):
+		"""validate price list and conversion rates once for all rows having the same values"""
+		key = (args.doctype, args.transaction_type, args.company, args.price_list, args.currency,
+			args.conversion_rate, args.price_list_currency, args.plc_conversion_rate)
+
+		if key not in self.validated_rates:
+			validate_price_list(args)
+			validate_conversion_rate(args, meta)
+			self.validated_rates[key] = (args.conversion_rate, args.plc_conversion_rate)
+
+		args.conversion_rate, args.plc_conversion_rate = self.validated_rates[key]
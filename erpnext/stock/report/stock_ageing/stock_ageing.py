@@ -3,92 +3,162 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import date_diff
+from frappe.utils import date_diff, flt, cint
+from erpnext.stock.fifo_queue import FifoQueue
+from erpnext.accounts.ageing import get_ageing_ranges
 
 def execute(filters=None):
-	
-	columns = get_columns()
-	item_details = get_fifo_queue(filters)
+	ageing_ranges = get_ageing_ranges(filters)
+	columns = get_columns(ageing_ranges)
+	fifo_queues = get_fifo_queues(filters)
+	item_details = get_item_details(set(item_code for item_code, warehouse in fifo_queues))
+
 	to_date = filters["to_date"]
 	data = []
-	for item, item_dict in item_details.items():
-		fifo_queue = item_dict["fifo_queue"]
-		details = item_dict["details"]
+	for (item_code, warehouse), fifo_queue in sorted(fifo_queues.items()):
 		if not fifo_queue: continue
-		
+
+		details = item_details.get(item_code, frappe._dict())
 		average_age = get_average_age(fifo_queue, to_date)
-		earliest_age = date_diff(to_date, fifo_queue[0][1])
-		latest_age = date_diff(to_date, fifo_queue[-1][1])
-		
-		data.append([item, details.item_name, details.description, details.item_group, 
-			details.brand, average_age, earliest_age, latest_age, details.stock_uom])
-		
+		earliest_age = date_diff(to_date, fifo_queue.layers[0][1])
+		latest_age = date_diff(to_date, fifo_queue.layers[-1][1])
+
+		data.append([item_code, details.item_name, details.description, details.item_group,
+			details.brand, warehouse, fifo_queue.qty, average_age, earliest_age, latest_age] +
+			get_qty_by_age(fifo_queue, to_date, ageing_ranges) + [details.stock_uom])
+
 	return columns, data
-	
+
 def get_average_age(fifo_queue, to_date):
 	batch_age = age_qty = total_qty = 0.0
-	for batch in fifo_queue:
+	for batch in fifo_queue.layers:
 		batch_age = date_diff(to_date, batch[1])
 		age_qty += batch_age * batch[0]
 		total_qty += batch[0]
-	
+
 	return (age_qty / total_qty) if total_qty else 0.0
-	
-def get_columns():
-	return ["Item Code:Link/Item:100", "Item Name::100", "Description::200", 
-		"Item Group:Link/Item Group:100", "Brand:Link/Brand:100", "Average Age:Float:100", 
-		"Earliest:Int:80", "Latest:Int:80", "UOM:Link/UOM:100"]
-		
-def get_fifo_queue(filters):
-	item_details = {}
-	for d in get_stock_ledger_entries(filters):
-		item_details.setdefault(d.name, {"details": d, "fifo_queue": []})
-		fifo_queue = item_details[d.name]["fifo_queue"]
+
+def get_qty_by_age(fifo_queue, to_date, ageing_ranges):
+	"""qty of layers falling in each ageing range, and above the last range"""
+	qty_by_age = [0.0] * (len(ageing_ranges) + 1)
+	for qty, posting_date in fifo_queue.layers:
+		age = date_diff(to_date, posting_date)
+		index = len(ageing_ranges)
+		for i, days in enumerate(ageing_ranges):
+			if age <= days:
+				index = i
+				break
+
+		qty_by_age[index] += flt(qty)
+
+	return qty_by_age
+
+def get_columns(ageing_ranges):
+	columns, lower_limit = [], 0
+	for days in ageing_ranges:
+		columns.append("{0}-{1}:Float:80".format(lower_limit, days))
+		lower_limit = days
+
+	return ["Item Code:Link/Item:100", "Item Name::100", "Description::200",
+		"Item Group:Link/Item Group:100", "Brand:Link/Brand:100", "Warehouse:Link/Warehouse:100",
+		"Available Qty:Float:100", "Average Age:Float:100", "Earliest:Int:80", "Latest:Int:80"] + \
+		columns + ["{0}-Above:Float:80".format(lower_limit), "UOM:Link/UOM:100"]
+
+def get_fifo_queues(filters):
+	"""FIFO layers of [qty, posting date] per (item, warehouse) on to date.
+
+		entries are streamed in posting order, so only the layers are kept in memory.
+		if a cutoff date is set, layers start from the FIFO queue stored in the last
+		entry before it, instead of replaying the ledger from the beginning"""
+	fifo_queues = {}
+	if filters.get("cutoff_date"):
+		fifo_queues = get_opening_fifo_queues(filters)
+
+	for d in iter_stock_ledger_entries(filters):
+		fifo_queue = fifo_queues.setdefault((d.item_code, d.warehouse), FifoQueue())
 		if d.actual_qty > 0:
-			fifo_queue.append([d.actual_qty, d.posting_date])
+			fifo_queue.add(flt(d.actual_qty), d.posting_date)
 		else:
-			qty_to_pop = abs(d.actual_qty)
-			while qty_to_pop:
-				batch = fifo_queue[0] if fifo_queue else [0, None]
-				if 0 < batch[0] <= qty_to_pop:
-					# if batch qty > 0 
-					# not enough or exactly same qty in current batch, clear batch
-					qty_to_pop -= batch[0]
-					fifo_queue.pop(0)
-				else:
-					# all from current batch
-					batch[0] -= qty_to_pop
-					qty_to_pop = 0
-
-	return item_details
-	
-def get_stock_ledger_entries(filters):
-	return frappe.db.sql("""select 
-			item.name, item.item_name, item_group, brand, description, item.stock_uom, 
-			actual_qty, posting_date
+			fifo_queue.remove(flt(d.actual_qty), allow_negative=False)
+
+	return fifo_queues
+
+def get_opening_fifo_queues(filters):
+	"""layers as on cutoff date, from the stored queue of the last entry before it.
+
+		stored queues keep rates, not dates, so all of their layers are dated to that
+		entry, and ages of stock received before the cutoff date are at least the
+		ages shown. items not valued by queue (moving average) start with a single
+		layer of their qty on that date"""
+	fifo_queues = {}
+	for d in frappe.db.sql("""select sle.item_code, sle.warehouse, sle.posting_date,
+			sle.qty_after_transaction, sle.stock_queue
 		from `tabStock Ledger Entry` sle,
-			(select name, item_name, description, stock_uom, brand, item_group
-				from `tabItem` {item_conditions}) item
-		where item_code = item.name and
-			company = %(company)s and
-			posting_date <= %(to_date)s
-			{sle_conditions}
-			order by posting_date, posting_time, sle.name"""\
-		.format(item_conditions=get_item_conditions(filters),
-			sle_conditions=get_sle_conditions(filters)), filters, as_dict=True)
-	
-def get_item_conditions(filters):
-	conditions = []
-	if filters.get("item_code"):
-		conditions.append("item_code=%(item_code)s")
-	if filters.get("brand"):
-		conditions.append("brand=%(brand)s")
-	
-	return "where {}".format(" and ".join(conditions)) if conditions else ""
-	
+			(select item_code, warehouse, max(posting_datetime) as posting_datetime
+				from `tabStock Ledger Entry`
+				where company = %(company)s and posting_date < %(cutoff_date)s
+					and ifnull(is_cancelled, 'No') = 'No' {conditions}
+				group by item_code, warehouse) last_sle
+		where sle.item_code = last_sle.item_code and sle.warehouse = last_sle.warehouse
+			and sle.posting_datetime = last_sle.posting_datetime
+			and ifnull(sle.is_cancelled, 'No') = 'No'
+		order by sle.name""".format(conditions=get_sle_conditions(filters)), filters, as_dict=True):
+			# of entries posted at the same time, the last one wins
+			fifo_queues[(d.item_code, d.warehouse)] = get_opening_fifo_queue(d)
+
+	return fifo_queues
+
+def get_opening_fifo_queue(sle):
+	stock_queue = FifoQueue.loads(sle.stock_queue)
+	if abs(stock_queue.qty - flt(sle.qty_after_transaction)) > 0.001:
+		stock_queue = FifoQueue([[flt(sle.qty_after_transaction), 0]])
+
+	return FifoQueue([[qty, sle.posting_date] for qty, rate in stock_queue.layers if qty > 0])
+
+def iter_stock_ledger_entries(filters, page_length=1000):
+	"""yield entries in posting order, fetching them a page at a time"""
+	values = filters.copy()
+	conditions = get_sle_conditions(filters)
+	if filters.get("cutoff_date"):
+		conditions += " and posting_date >= %(cutoff_date)s"
+
+	page_condition = ""
+	while True:
+		entries = frappe.db.sql("""select name, item_code, warehouse, actual_qty, posting_date,
+				posting_datetime
+			from `tabStock Ledger Entry`
+			where company = %(company)s and posting_date <= %(to_date)s
+				and ifnull(is_cancelled, 'No') = 'No' {conditions} {page_condition}
+			order by posting_datetime, name
+			limit {page_length}""".format(conditions=conditions, page_condition=page_condition,
+				page_length=cint(page_length)), values, as_dict=True)
+
+		for sle in entries:
+			yield sle
+
+		if len(entries) < page_length:
+			break
+
+		page_condition = """and (posting_datetime > %(after_datetime)s
+			or (posting_datetime = %(after_datetime)s and name > %(after_name)s))"""
+		values.update({"after_datetime": entries[-1].posting_datetime, "after_name": entries[-1].name})
+
+def get_item_details(items):
+	if not items:
+		return {}
+
+	return dict(((d.name, d) for d in frappe.db.sql("""select name, item_name, description,
+			item_group, brand, stock_uom
+		from `tabItem` where name in ({0})""".format(", ".join(["%s"] * len(items))),
+		tuple(items), as_dict=True)))
+
 def get_sle_conditions(filters):
 	conditions = []
 	if filters.get("warehouse"):
 		conditions.append("warehouse=%(warehouse)s")
-	
-	return "and {}".format(" and ".join(conditions)) if conditions else ""
\ No newline at end of file
+	if filters.get("item_code"):
+		conditions.append("item_code=%(item_code)s")
+	if filters.get("brand"):
+		conditions.append("item_code in (select name from `tabItem` where brand=%(brand)s)")
+
+	return "and {}".format(" and ".join(conditions)) if conditions else ""
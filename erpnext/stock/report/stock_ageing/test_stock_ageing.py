@@ -0,0 +1,24 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest
+from erpnext.stock.fifo_queue import FifoQueue
+from erpnext.stock.report.stock_ageing.stock_ageing import get_opening_fifo_queue, \
+	get_qty_by_age
+
+class TestStockAgeing(unittest.TestCase):
+	def test_opening_fifo_queue(self):
+		sle = frappe._dict({"posting_date": "2013-01-10", "qty_after_transaction": 15,
+			"stock_queue": "[[10,100],[5,120]]"})
+		self.assertEquals(get_opening_fifo_queue(sle).to_list(),
+			[[10, "2013-01-10"], [5, "2013-01-10"]])
+
+		# moving average items do not keep a queue
+		sle.stock_queue = "[]"
+		self.assertEquals(get_opening_fifo_queue(sle).to_list(), [[15, "2013-01-10"]])
+
+	def test_qty_by_age(self):
+		fifo_queue = FifoQueue([[10, "2013-01-01"], [5, "2013-02-20"], [2, "2013-03-01"]])
+		self.assertEquals(get_qty_by_age(fifo_queue, "2013-03-01", [30, 60, 90]),
+			[7.0, 10.0, 0.0, 0.0])
@@ -3,6 +3,7 @@
 
 from __future__ import unicode_literals
 import frappe
+from frappe import _
 
 def execute(filters=None):
 	columns = get_columns()
@@ -20,8 +21,23 @@ def execute(filters=None):
 			item_detail.brand, item_detail.description, sle.warehouse, item_detail.stock_uom, 
 			sle.actual_qty, sle.qty_after_transaction, sle.stock_value, sle.voucher_type, 
 			sle.voucher_no, voucher_link_icon, sle.batch_no, sle.serial_no, sle.company])
+
+	show_pending_reposts(filters, sl_entries)
 	
 	return columns, data
+
+def show_pending_reposts(filters, sl_entries):
+	"""warn if balances shown are still to be reposted in the background"""
+	from erpnext.stock.doctype.stock_repost_request.stock_repost_request import get_pending_reposts
+
+	item_warehouses = set((sle.item_code, sle.warehouse) for sle in sl_entries)
+	pending = ["{0} ({1})".format(d.item_code, d.warehouse) for d in
+		get_pending_reposts(filters.get("item_code"), filters.get("warehouse"))
+		if (d.item_code, d.warehouse) in item_warehouses]
+
+	if pending:
+		frappe.msgprint(_("Balance Qty and Value are still being reposted for: {0}").format(
+			", ".join(pending)))
 	
 def get_columns():
 	return ["Date:Datetime:95", "Item:Link/Item:100", "Item Name::100", 
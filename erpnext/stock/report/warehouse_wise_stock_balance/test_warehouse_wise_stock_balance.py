@@ -0,0 +1,41 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest
+from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot import rebuild_snapshots
+from erpnext.stock.report.warehouse_wise_stock_balance.warehouse_wise_stock_balance \
+	import get_item_warehouse_map
+
+test_dependencies = ["Stock Entry"]
+
+class TestWarehouseWiseStockBalance(unittest.TestCase):
+	def test_balance_with_and_without_snapshots(self):
+		from erpnext.stock.doctype.stock_entry.test_stock_entry import test_records
+		for doctype in ("Stock Ledger Entry", "Stock Balance Snapshot", "Bin"):
+			frappe.db.sql("delete from `tab%s`" % doctype)
+
+		frappe.db.set_default("stock_balance_snapshots_built", 0)
+
+		receipt = frappe.copy_doc(test_records[0])
+		receipt.insert()
+		receipt.submit()
+
+		issue = frappe.copy_doc(test_records[1])
+		issue.posting_date = "2013-02-10"
+		issue.get("mtn_details")[0].qty = 10
+		issue.insert()
+		issue.submit()
+
+		filters = {"from_date": "2013-02-01", "to_date": "2013-02-28"}
+		key = ("_Test Company", "_Test Item", "_Test Warehouse - _TC")
+
+		from_ledger = get_item_warehouse_map(filters)[key]
+		self.assertEquals([from_ledger.opening_qty, from_ledger.in_qty, from_ledger.out_qty,
+			from_ledger.bal_qty], [50, 0, 10, 40])
+
+		rebuild_snapshots("Monthly")
+		try:
+			self.assertEquals(get_item_warehouse_map(filters)[key], from_ledger)
+		finally:
+			frappe.db.set_default("stock_balance_snapshots_built", 0)
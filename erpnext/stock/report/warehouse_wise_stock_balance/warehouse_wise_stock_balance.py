@@ -10,19 +10,17 @@ def execute(filters=None):
 	if not filters: filters = {}
 
 	columns = get_columns(filters)
-	item_map = get_item_details(filters)
 	iwb_map = get_item_warehouse_map(filters)
+	item_map = get_item_details(set(item for company, item, wh in iwb_map))
 
 	data = []
-	for company in sorted(iwb_map):
-		for item in sorted(iwb_map[company]):
-			for wh in sorted(iwb_map[company][item]):
-				qty_dict = iwb_map[company][item][wh]
-				data.append([item, item_map[item]["item_name"],
-					item_map[item]["description"], wh,
-					qty_dict.opening_qty, qty_dict.in_qty,
-					qty_dict.out_qty, qty_dict.bal_qty, company
-				])
+	for (company, item, wh) in sorted(iwb_map):
+		qty_dict = iwb_map[(company, item, wh)]
+		data.append([item, item_map[item]["item_name"],
+			item_map[item]["description"], wh,
+			qty_dict.opening_qty, qty_dict.in_qty,
+			qty_dict.out_qty, qty_dict.bal_qty, company
+		])
 
 	return columns, data
 
@@ -35,52 +33,77 @@ def get_columns(filters):
 
 	return columns
 
-def get_conditions(filters):
-	conditions = ""
+def validate_filters(filters):
 	if not filters.get("from_date"):
 		frappe.throw(_("'From Date' is required"))
 
-	if filters.get("to_date"):
-		conditions += " and posting_date <= '%s'" % filters["to_date"]
-	else:
+	if not filters.get("to_date"):
 		frappe.throw(_("'To Date' is required"))
 
-	return conditions
+def get_item_warehouse_map(filters):
+	"""opening, in, out and balance qty per (company, item, warehouse).
 
-#get all details
-def get_stock_ledger_entries(filters):
-	conditions = get_conditions(filters)
-	return frappe.db.sql("""select item_code, warehouse,
-		posting_date, actual_qty, company
-		from `tabStock Ledger Entry`
-		where docstatus < 2 %s order by item_code, warehouse""" %
-		conditions, as_dict=1)
+		quantities are summed per item and warehouse in the database, so memory
+		grows with the number of item-warehouse pairs, not with the ledger.
+		once stock balance snapshots are built, opening qty of past periods is
+		read from the snapshots and only entries from the period of from date
+		onwards are summed"""
+	from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+		import snapshots_complete, get_period_dates
 
-def get_item_warehouse_map(filters):
-	sle = get_stock_ledger_entries(filters)
-	iwb_map = {}
+	validate_filters(filters)
+	values = {"from_date": filters["from_date"], "to_date": filters["to_date"]}
 
-	for d in sle:
-		iwb_map.setdefault(d.company, {}).setdefault(d.item_code, {}).\
-		setdefault(d.warehouse, frappe._dict({\
-				"opening_qty": 0.0, "in_qty": 0.0, "out_qty": 0.0, "bal_qty": 0.0
-			}))
-		qty_dict = iwb_map[d.company][d.item_code][d.warehouse]
-		if d.posting_date < filters["from_date"]:
-			qty_dict.opening_qty += flt(d.actual_qty)
-		elif d.posting_date >= filters["from_date"] and d.posting_date <= filters["to_date"]:
-			if flt(d.actual_qty) > 0:
-				qty_dict.in_qty += flt(d.actual_qty)
-			else:
-				qty_dict.out_qty += abs(flt(d.actual_qty))
-
-		qty_dict.bal_qty += flt(d.actual_qty)
+	iwb_map = {}
+	conditions = ""
+	if snapshots_complete():
+		values["period_start"] = get_period_dates(filters["from_date"])[0]
+		conditions = " and posting_date >= %(period_start)s"
+
+		for d in get_snapshot_balances(values["period_start"]):
+			qty_dict = get_qty_dict(iwb_map, d)
+			qty_dict.opening_qty = qty_dict.bal_qty = flt(d.qty_after_transaction)
+
+	for d in frappe.db.sql("""select company, item_code, warehouse,
+			sum(if(posting_date < %(from_date)s, actual_qty, 0)) as opening_qty,
+			sum(if(posting_date >= %(from_date)s and actual_qty > 0, actual_qty, 0)) as in_qty,
+			sum(if(posting_date >= %(from_date)s and actual_qty < 0, -actual_qty, 0)) as out_qty
+		from `tabStock Ledger Entry`
+		where docstatus < 2 and posting_date <= %(to_date)s {0}
+		group by company, item_code, warehouse""".format(conditions), values, as_dict=1):
+			qty_dict = get_qty_dict(iwb_map, d)
+			qty_dict.opening_qty += flt(d.opening_qty)
+			qty_dict.in_qty += flt(d.in_qty)
+			qty_dict.out_qty += flt(d.out_qty)
+			qty_dict.bal_qty += flt(d.opening_qty) + flt(d.in_qty) - flt(d.out_qty)
 
 	return iwb_map
 
-def get_item_details(filters):
+def get_snapshot_balances(period_start):
+	"""closing qty of each item and warehouse in its latest snapshot before period start"""
+	return frappe.db.sql("""select snapshot.company, snapshot.item_code, snapshot.warehouse,
+			snapshot.qty_after_transaction
+		from `tabStock Balance Snapshot` snapshot,
+			(select item_code, warehouse, max(period_end_date) as period_end_date
+				from `tabStock Balance Snapshot`
+				where period_end_date < %s
+				group by item_code, warehouse) last_snapshot
+		where snapshot.item_code = last_snapshot.item_code
+			and snapshot.warehouse = last_snapshot.warehouse
+			and snapshot.period_end_date = last_snapshot.period_end_date""", period_start, as_dict=1)
+
+def get_qty_dict(iwb_map, d):
+	return iwb_map.setdefault((d.company, d.item_code, d.warehouse), frappe._dict({
+		"opening_qty": 0.0, "in_qty": 0.0, "out_qty": 0.0, "bal_qty": 0.0
+	}))
+
+def get_item_details(items):
 	item_map = {}
-	for d in frappe.db.sql("select name, item_name, description from tabItem", as_dict=1):
-		item_map.setdefault(d.name, d)
+	if not items:
+		return item_map
+
+	for d in frappe.db.sql("""select name, item_name, description from tabItem
+		where name in ({0})""".format(", ".join(["%s"] * len(items))), tuple(items), as_dict=1):
+			item_map.setdefault(d.name, d)
 
 	return item_map
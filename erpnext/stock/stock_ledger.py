@@ -4,8 +4,13 @@ from __future__ import unicode_literals
 
 import frappe
 from frappe import _
-from frappe.utils import cint, flt, cstr, now
-from erpnext.stock.utils import get_valuation_method
+from frappe.utils import cint, flt, cstr, now, add_days
+from frappe.model.meta import get_field_precision
+from erpnext.stock.utils import get_valuation_method, get_posting_datetime
+from erpnext.stock.fifo_queue import FifoQueue
+from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+	import get_snapshot_before, get_snapshot_period, get_period_dates, make_snapshot, \
+	delete_snapshots_for_voucher
 import json
 
 # future reposting
@@ -14,6 +19,11 @@ class NegativeStockError(frappe.ValidationError): pass
 _exceptions = frappe.local('stockledger_exceptions')
 # _exceptions = []
 
+# columns required to repost an entry
+repost_fields = ["name", "posting_date", "posting_time", "posting_datetime", "actual_qty",
+	"incoming_rate", "serial_no", "qty_after_transaction", "valuation_rate", "stock_value",
+	"stock_value_difference", "stock_queue", "voucher_type", "voucher_no", "company"]
+
 def make_sl_entries(sl_entries, is_amended=None):
 	if sl_entries:
 		from erpnext.stock.utils import update_bin
@@ -40,7 +50,47 @@ def make_sl_entries(sl_entries, is_amended=None):
 			delete_cancelled_entry(sl_entries[0].get('voucher_type'),
 				sl_entries[0].get('voucher_no'))
 
+def make_sl_entries_in_bulk(sl_entries):
+	"""
+		post entries of one voucher, having the same posting date and time and
+		no serial or batch nos, in batches.
+
+		the first entry is validated like a single entry, the others only for
+		their warehouse's company. each Bin is updated once with the total change
+		in qty, and each item and warehouse is reposted once, after all entries are in
+	"""
+	from erpnext.utilities import bulk_insert
+	from erpnext.stock.utils import get_bin_name, validate_warehouse_company
+	from erpnext.stock.doctype.bin.bin import update_qty, repost_entries_after
+
+	sl_entries = [args for args in sl_entries if flt(args.get("actual_qty"))]
+	if not sl_entries:
+		return
+
+	sle = frappe.get_doc(dict(sl_entries[0], doctype="Stock Ledger Entry"))
+	sle.validate()
+	sle.check_stock_frozen_date()
+
+	qty_map = {}
+	for args in sl_entries:
+		validate_warehouse_company(args["warehouse"], args["company"])
+		args.update({
+			"posting_time": sle.posting_time,
+			"posting_datetime": sle.posting_datetime,
+			"is_cancelled": "No"
+		})
+
+		key = (args["item_code"], args["warehouse"])
+		qty_map[key] = flt(qty_map.get(key)) + flt(args["actual_qty"])
+
+	bulk_insert("Stock Ledger Entry", sl_entries, docstatus=1)
+
+	for (item_code, warehouse), actual_qty in sorted(qty_map.items()):
+		update_qty(get_bin_name(item_code, warehouse), {"actual_qty": actual_qty})
+		repost_entries_after(item_code, warehouse, sle.posting_date, sle.posting_time)
+
 def set_as_cancel(voucher_type, voucher_no):
+	delete_snapshots_for_voucher(voucher_type, voucher_no)
 	frappe.db.sql("""update `tabStock Ledger Entry` set is_cancelled='Yes',
 		modified=%s, modified_by=%s
 		where voucher_no=%s and voucher_type=%s""",
@@ -55,14 +105,27 @@ def make_entry(args):
 	return sle.name
 
 def delete_cancelled_entry(voucher_type, voucher_no):
+	delete_snapshots_for_voucher(voucher_type, voucher_no)
 	frappe.db.sql("""delete from `tabStock Ledger Entry`
 		where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
 
-def update_entries_after(args, verbose=1):
+def update_entries_after(args, verbose=1, allow_early_exit=True, defer_later_entries=False):
 	"""
 		update valution rate and qty after transaction
 		from the current time-bucket onwards
 
+		entries are fetched and locked in chunks and the recomputed values are
+		written back in batches. once an entry after the current time-bucket
+		recomputes to exactly what is already stored against it, all later
+		entries are unaffected too and reposting stops there, unless
+		`allow_early_exit` is off (full repost)
+
+		with `defer_later_entries`, only the current time-bucket is reposted.
+		if there are entries after it, `deferred` is set in the result and
+		those entries and the bin are left to be reposted later
+
+		returns the number of entries `processed` and `updated`
+
 		args = {
 			"item_code": "ABC",
 			"warehouse": "XYZ",
@@ -77,18 +140,39 @@ def update_entries_after(args, verbose=1):
 
 	qty_after_transaction = flt(previous_sle.get("qty_after_transaction"))
 	valuation_rate = flt(previous_sle.get("valuation_rate"))
-	stock_queue = json.loads(previous_sle.get("stock_queue") or "[]")
+	stock_queue = FifoQueue.loads(previous_sle.get("stock_queue"))
 	stock_value = flt(previous_sle.get("stock_value"))
 	prev_stock_value = flt(previous_sle.get("stock_value"))
 
-	entries_to_fix = get_sle_after_datetime(previous_sle or \
-		{"item_code": args["item_code"], "warehouse": args["warehouse"]}, for_update=True)
-
 	valuation_method = get_valuation_method(args["item_code"])
-	stock_value_difference = 0.0
-
-	for sle in entries_to_fix:
-		if sle.serial_no or not cint(frappe.db.get_default("allow_negative_stock")):
+	allow_negative_stock = cint(frappe.db.get_default("allow_negative_stock"))
+	stock_value_precision = None
+	repost_from = get_posting_datetime(args.get("posting_date") or "1900-01-01",
+		args.get("posting_time"))
+
+	# closing balance of a period is saved as a snapshot once reposting moves past it
+	snapshot_period = get_snapshot_period()
+	last_sle = None if previous_sle.get("period_end_date") else previous_sle
+
+	writer = StockLedgerEntryWriter()
+	status = frappe._dict({"processed": 0, "updated": 0, "converged": False, "deferred": False})
+
+	for sle in iterate_sle_after_datetime(dict(previous_sle, item_code=args["item_code"],
+			warehouse=args["warehouse"]), for_update=True):
+
+		if defer_later_entries and sle.posting_datetime > repost_from:
+			status.deferred = True
+			if sle.serial_no or not allow_negative_stock:
+				validate_future_negative_stock(args, sle, qty_after_transaction)
+			break
+
+		status.processed += 1
+		if last_sle and get_period_dates(sle.posting_date, snapshot_period) != \
+				get_period_dates(last_sle.posting_date, snapshot_period):
+			make_snapshot(args["item_code"], args["warehouse"], last_sle, snapshot_period)
+			last_sle = None
+
+		if sle.serial_no or not allow_negative_stock:
 			# validate negative stock for serialized items, fifo valuation
 			# or when negative stock is not allowed for moving average
 			if not validate_negative_stock(qty_after_transaction, sle):
@@ -111,28 +195,61 @@ def update_entries_after(args, verbose=1):
 			stock_value = (qty_after_transaction > 0) and \
 				(qty_after_transaction * valuation_rate) or 0
 		else:
-			stock_value = sum((flt(batch[0]) * flt(batch[1]) for batch in stock_queue))
+			stock_value = stock_queue.value
 
 		# rounding as per precision
-		from frappe.model.meta import get_field_precision
-		meta = frappe.get_meta("Stock Ledger Entry")
+		if stock_value_precision is None:
+			stock_value_precision = get_field_precision(
+				frappe.get_meta("Stock Ledger Entry").get_field("stock_value"),
+				frappe._dict({"fields": sle}))
 
-		stock_value = flt(stock_value, get_field_precision(meta.get_field("stock_value"),
-			frappe._dict({"fields": sle})))
+		stock_value = flt(stock_value, stock_value_precision)
 
 		stock_value_difference = stock_value - prev_stock_value
 		prev_stock_value = stock_value
 
+		values = frappe._dict({
+			"qty_after_transaction": qty_after_transaction,
+			"valuation_rate": valuation_rate,
+			"stock_queue": stock_queue.dumps(),
+			"stock_value": stock_value,
+			"stock_value_difference": stock_value_difference
+		})
+
+		last_sle = frappe._dict(values, name=sle.name, posting_date=sle.posting_date,
+			posting_time=sle.posting_time, posting_datetime=sle.posting_datetime, company=sle.company)
+
+		if is_unchanged(sle, values):
+			if allow_early_exit and not _exceptions and sle.posting_datetime > repost_from:
+				status.converged = True
+				break
+			continue
+
 		# update current sle
-		frappe.db.sql("""update `tabStock Ledger Entry`
-			set qty_after_transaction=%s, valuation_rate=%s, stock_queue=%s,
-			stock_value=%s, stock_value_difference=%s where name=%s""",
-			(qty_after_transaction, valuation_rate,
-			json.dumps(stock_queue), stock_value, stock_value_difference, sle.name))
+		writer.append(sle.name, values)
+		status.updated += 1
+
+	writer.flush()
 
 	if _exceptions:
 		_raise_exceptions(args, verbose)
 
+	if status.deferred:
+		return status
+
+	if last_sle and not status.converged:
+		make_snapshot(args["item_code"], args["warehouse"], last_sle, snapshot_period)
+
+	if status.converged:
+		# later entries are already correct, bin follows the last one
+		last_sle = get_stock_ledger_entries({"item_code": args["item_code"],
+			"warehouse": args["warehouse"]}, order="desc", limit="limit 1",
+			fields=["qty_after_transaction", "valuation_rate", "stock_value"])[0]
+
+		qty_after_transaction = flt(last_sle.qty_after_transaction)
+		valuation_rate = flt(last_sle.valuation_rate)
+		stock_value = flt(last_sle.stock_value)
+
 	# update bin
 	if not frappe.db.exists({"doctype": "Bin", "item_code": args["item_code"],
 			"warehouse": args["warehouse"]}):
@@ -150,6 +267,55 @@ def update_entries_after(args, verbose=1):
 		where item_code=%s and warehouse=%s""", (valuation_rate, qty_after_transaction,
 		stock_value, args["item_code"], args["warehouse"]))
 
+	return status
+
+def is_unchanged(sle, values):
+	"""check if recomputed values match the ones stored against the entry"""
+	if cstr(sle.stock_queue) != values.stock_queue:
+		# queue stored in the older JSON format
+		if ", " not in cstr(sle.stock_queue) or \
+			json.loads(sle.stock_queue) != json.loads(values.stock_queue):
+				return False
+
+	for fieldname in ("qty_after_transaction", "valuation_rate", "stock_value",
+		"stock_value_difference"):
+			if flt(sle.get(fieldname), 6) != flt(values.get(fieldname), 6):
+				return False
+
+	return True
+
+class StockLedgerEntryWriter(object):
+	"""buffer recomputed values of Stock Ledger Entries and write them
+		as multi-row updates"""
+	fields = ("qty_after_transaction", "valuation_rate", "stock_queue", "stock_value",
+		"stock_value_difference")
+
+	def __init__(self, batch_size=100):
+		self.batch_size = batch_size
+		self.rows = []
+
+	def append(self, name, values):
+		self.rows.append((name, values))
+		if len(self.rows) >= self.batch_size:
+			self.flush()
+
+	def flush(self):
+		if not self.rows:
+			return
+
+		set_clause, values = [], []
+		for fieldname in self.fields:
+			set_clause.append("`%s` = case name %s end" % (fieldname,
+				" ".join(["when %s then %s"] * len(self.rows))))
+			for name, row in self.rows:
+				values.extend([name, row.get(fieldname)])
+
+		names = [name for name, row in self.rows]
+		frappe.db.sql("""update `tabStock Ledger Entry` set %s where name in (%s)""" %
+			(", ".join(set_clause), ", ".join(["%s"] * len(names))), tuple(values + names))
+
+		self.rows = []
+
 def get_sle_before_datetime(args, for_update=False):
 	"""
 		get previous stock ledger entry before current time-bucket
@@ -160,37 +326,86 @@ def get_sle_before_datetime(args, for_update=False):
 		this is necessary because at the time of cancellation, there may be
 		entries between the cancelled entries in the same time-bucket
 	"""
-	sle = get_stock_ledger_entries(args,
-		["timestamp(posting_date, posting_time) < timestamp(%(posting_date)s, %(posting_time)s)"],
-		"desc", "limit 1", for_update=for_update)
+	return get_latest_sle(args,
+		["posting_datetime < %(posting_datetime)s"],
+		for_update=for_update) or frappe._dict()
 
-	return sle and sle[0] or frappe._dict()
+def get_latest_sle(args, conditions, for_update=False):
+	"""
+		get the latest stock ledger entry matching conditions.
 
-def get_sle_after_datetime(args, for_update=False):
+		if a stock balance snapshot exists for a period ending before the posting date,
+		only entries after that period are looked at, and if there are none,
+		the snapshot (taken at the last entry of that period) is returned instead
+	"""
+	snapshot = args.get("posting_date") and get_snapshot_before(args["item_code"],
+		args["warehouse"], args["posting_date"])
+
+	if snapshot and snapshot.name != args.get("sle"):
+		args = dict(args, snapshot_datetime=get_posting_datetime(add_days(snapshot.period_end_date, 1)))
+		conditions = conditions + ["posting_datetime >= %(snapshot_datetime)s"]
+	else:
+		snapshot = None
+
+	sle = get_stock_ledger_entries(args, conditions, "desc", "limit 1", for_update=for_update)
+
+	return sle and sle[0] or snapshot
+
+def get_sle_after_datetime(args, for_update=False, fields=None, limit=None):
 	"""get Stock Ledger Entries after a particular datetime, for reposting"""
 	# NOTE: using for update of
-	conditions = ["timestamp(posting_date, posting_time) > timestamp(%(posting_date)s, %(posting_time)s)"]
+	conditions = ["posting_datetime > %(posting_datetime)s"]
 
-	# Excluding name: Workaround for MariaDB timestamp() floating microsecond issue
 	if args.get("name"):
 		conditions.append("name!=%(name)s")
 
-	return get_stock_ledger_entries(args, conditions, "asc", for_update=for_update)
-
-def get_stock_ledger_entries(args, conditions=None, order="desc", limit=None, for_update=False):
+	return get_stock_ledger_entries(args, conditions, "asc", limit, for_update=for_update,
+		fields=fields)
+
+def iterate_sle_after_datetime(args, for_update=False, chunk_size=500):
+	"""yield Stock Ledger Entries after a particular datetime, for reposting.
+		entries are fetched (and locked) chunk by chunk, so that reposting which
+		stops early does not read the rest of the ledger"""
+	limit = "limit %d" % chunk_size
+	entries = get_sle_after_datetime(args, for_update=for_update,
+		fields=repost_fields, limit=limit)
+
+	while entries:
+		for sle in entries:
+			yield sle
+
+		if len(entries) < chunk_size:
+			break
+
+		# continue after the last entry, in the same order
+		entries = get_stock_ledger_entries({
+				"item_code": args["item_code"],
+				"warehouse": args["warehouse"],
+				"posting_datetime": entries[-1].posting_datetime,
+				"last_name": entries[-1].name
+			}, ["""(posting_datetime > %(posting_datetime)s
+				or (posting_datetime = %(posting_datetime)s and name > %(last_name)s))"""],
+			"asc", limit, for_update=for_update, fields=repost_fields)
+
+def get_stock_ledger_entries(args, conditions=None, order="desc", limit=None, for_update=False,
+	fields=None):
 	"""get stock ledger entries filtered by specific posting datetime conditions"""
 	if not args.get("posting_date"):
 		args["posting_date"] = "1900-01-01"
 	if not args.get("posting_time"):
 		args["posting_time"] = "00:00"
+	if not args.get("posting_datetime"):
+		args["posting_datetime"] = get_posting_datetime(args["posting_date"], args["posting_time"])
 
-	return frappe.db.sql("""select *, timestamp(posting_date, posting_time) as "timestamp" from `tabStock Ledger Entry`
+	return frappe.db.sql("""select %(fields)s
+		from `tabStock Ledger Entry`
 		where item_code = %%(item_code)s
 		and warehouse = %%(warehouse)s
 		and ifnull(is_cancelled, 'No')='No'
 		%(conditions)s
-		order by timestamp(posting_date, posting_time) %(order)s, name %(order)s
+		order by posting_datetime %(order)s, name %(order)s
 		%(limit)s %(for_update)s""" % {
+			"fields": fields and ", ".join(fields) or "*",
 			"conditions": conditions and ("and " + " and ".join(conditions)) or "",
 			"limit": limit or "",
 			"for_update": for_update and "for update" or "",
@@ -215,6 +430,29 @@ def validate_negative_stock(qty_after_transaction, sle):
 	else:
 		return True
 
+def validate_future_negative_stock(args, next_sle, qty_after_transaction):
+	"""
+		entries after a deferred repost keep their stored qty till the queue runs.
+		check with one query that none of them goes negative once shifted by the
+		change in qty before them
+	"""
+	diff = qty_after_transaction - (flt(next_sle.qty_after_transaction) - flt(next_sle.actual_qty))
+	if diff >= 0:
+		return
+
+	lowest_sle = frappe.db.sql("""select name, posting_date, posting_time, voucher_type,
+			voucher_no, qty_after_transaction
+		from `tabStock Ledger Entry`
+		where item_code=%s and warehouse=%s and ifnull(is_cancelled, 'No')='No'
+			and posting_datetime >= %s
+		order by qty_after_transaction asc, posting_datetime asc limit 1""",
+		(args["item_code"], args["warehouse"], next_sle.posting_datetime), as_dict=1)
+
+	if lowest_sle:
+		lowest_qty = flt(lowest_sle[0].qty_after_transaction) + diff
+		if lowest_qty < 0 and abs(lowest_qty) > 0.0001:
+			_exceptions.append(lowest_sle[0].update({"diff": lowest_qty}))
+
 def get_serialized_values(qty_after_transaction, sle, valuation_rate):
 	incoming_rate = flt(sle.incoming_rate)
 	actual_qty = flt(sle.actual_qty)
@@ -270,40 +508,14 @@ def get_moving_average_values(qty_after_transaction, sle, valuation_rate):
 def get_fifo_values(qty_after_transaction, sle, stock_queue):
 	incoming_rate = flt(sle.incoming_rate)
 	actual_qty = flt(sle.actual_qty)
-	if not stock_queue:
-		stock_queue.append([0, 0])
 
 	if actual_qty > 0:
-		if stock_queue[-1][0] > 0:
-			stock_queue.append([actual_qty, incoming_rate])
-		else:
-			qty = stock_queue[-1][0] + actual_qty
-			stock_queue[-1] = [qty, qty > 0 and incoming_rate or 0]
+		stock_queue.add(actual_qty, incoming_rate)
 	else:
-		incoming_cost = 0
-		qty_to_pop = abs(actual_qty)
-		while qty_to_pop:
-			if not stock_queue:
-				stock_queue.append([0, 0])
-
-			batch = stock_queue[0]
-
-			if 0 < batch[0] <= qty_to_pop:
-				# if batch qty > 0
-				# not enough or exactly same qty in current batch, clear batch
-				incoming_cost += flt(batch[0]) * flt(batch[1])
-				qty_to_pop -= batch[0]
-				stock_queue.pop(0)
-			else:
-				# all from current batch
-				incoming_cost += flt(qty_to_pop) * flt(batch[1])
-				batch[0] -= qty_to_pop
-				qty_to_pop = 0
-
-	stock_value = sum((flt(batch[0]) * flt(batch[1]) for batch in stock_queue))
-	stock_qty = sum((flt(batch[0]) for batch in stock_queue))
-
-	valuation_rate = stock_qty and (stock_value / flt(stock_qty)) or 0
+		stock_queue.remove(actual_qty)
+
+	stock_qty = stock_queue.qty
+	valuation_rate = stock_qty and (stock_queue.value / flt(stock_qty)) or 0
 
 	return valuation_rate
 
@@ -333,7 +545,6 @@ def get_previous_sle(args, for_update=False):
 	"""
 	if not args.get("sle"): args["sle"] = ""
 
-	sle = get_stock_ledger_entries(args, ["name != %(sle)s",
-		"timestamp(posting_date, posting_time) <= timestamp(%(posting_date)s, %(posting_time)s)"],
-		"desc", "limit 1", for_update=for_update)
-	return sle and sle[0] or {}
+	return get_latest_sle(args, ["name != %(sle)s",
+		"posting_datetime <= %(posting_datetime)s"],
+		for_update=for_update) or {}
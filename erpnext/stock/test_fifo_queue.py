@@ -0,0 +1,40 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import unittest
+from erpnext.stock.fifo_queue import FifoQueue
+
+class TestFifoQueue(unittest.TestCase):
+	def test_incoming_and_outgoing(self):
+		queue = FifoQueue()
+		queue.add(10, 100)
+		queue.add(5, 100)
+		queue.add(10, 200)
+
+		# same rate layers are merged
+		self.assertEquals(queue.to_list(), [[15, 100], [10, 200]])
+		self.assertEquals(queue.get_outgoing_rate(-20), 125)
+
+		consumed = queue.remove(-20)
+		self.assertEquals(consumed, [[15, 100], [5, 200]])
+		self.assertEquals(queue.to_list(), [[5, 200]])
+		self.assertEquals(queue.value, 1000)
+
+	def test_negative_stock(self):
+		queue = FifoQueue()
+		queue.remove(-5)
+		self.assertEquals(queue.to_list(), [[-5, 0]])
+
+		queue.add(8, 50)
+		self.assertEquals(queue.to_list(), [[3, 50]])
+
+		queue = FifoQueue([[2, 10]])
+		queue.remove(-5, allow_negative=False)
+		self.assertEquals(len(queue), 0)
+
+	def test_encoding(self):
+		queue = FifoQueue.loads("[[10.0, 100.0], [5.0, 200.0]]")
+		self.assertEquals(queue.dumps(), "[[10.0,100.0],[5.0,200.0]]")
+		self.assertEquals(FifoQueue.loads(queue.dumps()).to_list(), queue.to_list())
+		self.assertEquals(FifoQueue.loads(None).to_list(), [])
@@ -2,33 +2,60 @@
 # License: GNU General Public License v3. See license.txt
 
 import frappe
+import datetime, time
 from frappe import _
-import json
-from frappe.utils import flt, cstr, nowdate, add_days, cint
+from frappe.utils import flt, cstr, nowdate, add_days, cint, getdate
 from frappe.defaults import get_global_default
 from frappe.utils.email_lib import sendmail
+from erpnext.stock.fifo_queue import FifoQueue
+from erpnext.utilities.master_data import get_master_value
 
 class InvalidWarehouseCompany(frappe.ValidationError): pass
 
 def get_stock_balance_on(warehouse, posting_date=None):
+	from erpnext.stock.doctype.stock_balance_snapshot.stock_balance_snapshot \
+		import snapshots_complete, get_period_dates
+
 	if not posting_date: posting_date = nowdate()
 
+	sle_map = {}
+	conditions, values = "", [warehouse, posting_date]
+	if snapshots_complete():
+		# closing balances of past periods, only the current period is read from the ledger
+		period_start = get_period_dates(posting_date)[0]
+		for d in frappe.db.sql("""select item_code, stock_value
+			from `tabStock Balance Snapshot`
+			where warehouse=%s and period_end_date < %s
+			order by period_end_date desc""", (warehouse, period_start), as_dict=1):
+				sle_map.setdefault(d.item_code, flt(d.stock_value))
+
+		conditions = " and posting_date >= %s"
+		values.append(period_start)
+
 	stock_ledger_entries = frappe.db.sql("""
 		SELECT
 			item_code, stock_value
 		FROM
 			`tabStock Ledger Entry`
 		WHERE
-			warehouse=%s AND posting_date <= %s
-		ORDER BY timestamp(posting_date, posting_time) DESC, name DESC
-	""", (warehouse, posting_date), as_dict=1)
+			warehouse=%s AND posting_date <= %s {0}
+		ORDER BY posting_datetime DESC, name DESC
+	""".format(conditions), tuple(values), as_dict=1)
 
-	sle_map = {}
+	current_period_map = {}
 	for sle in stock_ledger_entries:
-		sle_map.setdefault(sle.item_code, flt(sle.stock_value))
+		current_period_map.setdefault(sle.item_code, flt(sle.stock_value))
+
+	sle_map.update(current_period_map)
 
 	return sum(sle_map.values())
 
+def get_posting_datetime(posting_date, posting_time=None):
+	"""posting date and time combined, as stored in Stock Ledger Entry posting_datetime"""
+	hours, minutes, seconds = (cstr(posting_time or "00:00").split(".")[0].split(":") + ["0", "0"])[:3]
+	return datetime.datetime.combine(getdate(posting_date),
+		datetime.time(cint(hours), cint(minutes), cint(seconds)))
+
 def get_latest_stock_balance():
 	bin_map = {}
 	for d in frappe.db.sql("""SELECT item_code, warehouse, stock_value as stock_value
@@ -52,8 +79,33 @@ def get_bin(item_code, warehouse):
 	bin_obj.ignore_permissions = True
 	return bin_obj
 
+def get_bin_name(item_code, warehouse):
+	"""name of the Bin of item and warehouse, which is created if missing"""
+	return frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse}) \
+		or get_bin(item_code, warehouse).name
+
+def update_bin_qty(args_list):
+	"""add reserved, ordered, indented and planned qty of a document's rows to their Bins.
+		deltas of rows with the same item and warehouse are summed, so that each Bin is
+		updated once, and Bins are updated in a fixed order to avoid deadlocks"""
+	from erpnext.stock.doctype.bin.bin import update_qty
+
+	qty_map = {}
+	for args in args_list:
+		if get_master_value("Item", args.get("item_code"), "is_stock_item") != 'Yes':
+			frappe.msgprint(_("Item {0} ignored since it is not a stock item").format(args.get("item_code")))
+			continue
+
+		qty_dict = qty_map.setdefault((args.get("item_code"), args.get("warehouse")), {})
+		for fieldname in ("reserved_qty", "ordered_qty", "indented_qty", "planned_qty"):
+			qty_dict[fieldname] = flt(qty_dict.get(fieldname)) + flt(args.get(fieldname))
+
+	for (item_code, warehouse), qty_dict in sorted(qty_map.items()):
+		if any(qty_dict.values()):
+			update_qty(get_bin_name(item_code, warehouse), qty_dict)
+
 def update_bin(args):
-	is_stock_item = frappe.db.get_value('Item', args.get("item_code"), 'is_stock_item')
+	is_stock_item = get_master_value("Item", args.get("item_code"), "is_stock_item")
 	if is_stock_item == 'Yes':
 		bin = get_bin(args.get("item_code"), args.get("warehouse"))
 		bin.update_stock(args)
@@ -78,7 +130,7 @@ def get_incoming_rate(args):
 		if valuation_method == 'FIFO':
 			if not previous_sle:
 				return 0.0
-			previous_stock_queue = json.loads(previous_sle.get('stock_queue', '[]') or '[]')
+			previous_stock_queue = FifoQueue.loads(previous_sle.get('stock_queue'))
 			in_rate = get_fifo_rate(previous_stock_queue, args.get("qty") or 0) if previous_stock_queue else 0
 		elif valuation_method == 'Moving Average':
 			in_rate = previous_sle.get('valuation_rate') or 0
@@ -95,36 +147,21 @@ def get_avg_purchase_rate(serial_nos):
 
 def get_valuation_method(item_code):
 	"""get valuation method from item or default"""
-	val_method = frappe.db.get_value('Item', item_code, 'valuation_method')
+	val_method = get_master_value("Item", item_code, "valuation_method")
 	if not val_method:
 		val_method = get_global_default('valuation_method') or "FIFO"
 	return val_method
 
 def get_fifo_rate(previous_stock_queue, qty):
 	"""get FIFO (average) Rate from Queue"""
+	if not isinstance(previous_stock_queue, FifoQueue):
+		previous_stock_queue = FifoQueue(previous_stock_queue)
+
 	if qty >= 0:
-		total = sum(f[0] for f in previous_stock_queue)
-		return total and sum(f[0] * f[1] for f in previous_stock_queue) / flt(total) or 0.0
+		total = previous_stock_queue.qty
+		return total and previous_stock_queue.value / flt(total) or 0.0
 	else:
-		available_qty_for_outgoing, outgoing_cost = 0, 0
-		qty_to_pop = abs(qty)
-		while qty_to_pop and previous_stock_queue:
-			batch = previous_stock_queue[0]
-			if 0 < batch[0] <= qty_to_pop:
-				# if batch qty > 0
-				# not enough or exactly same qty in current batch, clear batch
-				available_qty_for_outgoing += flt(batch[0])
-				outgoing_cost += flt(batch[0]) * flt(batch[1])
-				qty_to_pop -= batch[0]
-				previous_stock_queue.pop(0)
-			else:
-				# all from current batch
-				available_qty_for_outgoing += flt(qty_to_pop)
-				outgoing_cost += flt(qty_to_pop) * flt(batch[1])
-				batch[0] -= qty_to_pop
-				qty_to_pop = 0
-
-		return outgoing_cost / available_qty_for_outgoing
+		return previous_stock_queue.get_outgoing_rate(qty)
 
 def get_valid_serial_nos(sr_nos, qty=0, item_code=''):
 	"""split serial nos, validate and return list of valid serial nos"""
@@ -146,80 +183,86 @@ def get_valid_serial_nos(sr_nos, qty=0, item_code=''):
 	return valid_serial_nos
 
 def validate_warehouse_company(warehouse, company):
-	warehouse_company = frappe.db.get_value("Warehouse", warehouse, "company")
+	warehouse_company = get_master_value("Warehouse", warehouse, "company")
 	if warehouse_company and warehouse_company != company:
 		frappe.throw(_("Warehouse {0} does not belong to company {1}").format(warehouse, company),
 			InvalidWarehouseCompany)
 
-def get_sales_bom_buying_amount(item_code, warehouse, voucher_type, voucher_no, voucher_detail_no,
-		stock_ledger_entries, item_sales_bom):
-	# sales bom item
-	buying_amount = 0.0
-	for bom_item in item_sales_bom[item_code]:
-		if bom_item.get("parent_detail_docname")==voucher_detail_no:
-			buying_amount += get_buying_amount(voucher_type, voucher_no, voucher_detail_no,
-				stock_ledger_entries.get((bom_item.item_code, warehouse), []))
-
-	return buying_amount
-
-def get_buying_amount(voucher_type, voucher_no, item_row, stock_ledger_entries):
-	# IMP NOTE
-	# stock_ledger_entries should already be filtered by item_code and warehouse and
-	# sorted by posting_date desc, posting_time desc
-	for i, sle in enumerate(stock_ledger_entries):
-		if sle.voucher_type == voucher_type and sle.voucher_no == voucher_no and \
-			sle.voucher_detail_no == item_row:
-				previous_stock_value = len(stock_ledger_entries) > i+1 and \
-					flt(stock_ledger_entries[i+1].stock_value) or 0.0
-				buying_amount =  previous_stock_value - flt(sle.stock_value)
-
-				return buying_amount
-	return 0.0
-
-
-def reorder_item():
-	""" Reorder item if stock reaches reorder level"""
+def reorder_item(dry_run=False):
+	"""Reorder item if stock reaches reorder level.
+
+		with `dry_run`, material requests are planned but not created, and the
+		candidates are returned with the time taken by each step"""
 	if getattr(frappe.local, "auto_indent", None) is None:
 		frappe.local.auto_indent = cint(frappe.db.get_value('Stock Settings', None, 'auto_indent'))
 
-	if frappe.local.auto_indent:
-		material_requests = {}
-		bin_list = frappe.db.sql("""select item_code, warehouse, projected_qty
-			from tabBin where ifnull(item_code, '') != '' and ifnull(warehouse, '') != ''
-			and exists (select name from `tabItem`
-				where `tabItem`.name = `tabBin`.item_code and
-				is_stock_item='Yes' and (is_purchase_item='Yes' or is_sub_contracted_item='Yes') and
-				(ifnull(end_of_life, '')='' or end_of_life > curdate()))""", as_dict=True)
-		for bin in bin_list:
-			#check if re-order is required
-			item_reorder = frappe.db.get("Item Reorder",
-				{"parent": bin.item_code, "warehouse": bin.warehouse})
-			if item_reorder:
-				reorder_level = item_reorder.warehouse_reorder_level
-				reorder_qty = item_reorder.warehouse_reorder_qty
-				material_request_type = item_reorder.material_request_type or "Purchase"
-			else:
-				reorder_level, reorder_qty = frappe.db.get_value("Item", bin.item_code,
-					["re_order_level", "re_order_qty"])
-				material_request_type = "Purchase"
-
-			if flt(reorder_level) and flt(bin.projected_qty) < flt(reorder_level):
-				if flt(reorder_level) - flt(bin.projected_qty) > flt(reorder_qty):
-					reorder_qty = flt(reorder_level) - flt(bin.projected_qty)
-
-				company = frappe.db.get_value("Warehouse", bin.warehouse, "company") or \
-					frappe.defaults.get_defaults()["company"] or \
-					frappe.db.sql("""select name from tabCompany limit 1""")[0][0]
-
-				material_requests.setdefault(material_request_type, frappe._dict()).setdefault(
-					company, []).append(frappe._dict({
-						"item_code": bin.item_code,
-						"warehouse": bin.warehouse,
-						"reorder_qty": reorder_qty
-					})
-				)
+	if not (frappe.local.auto_indent or dry_run):
+		return
+
+	timings = frappe._dict()
+	start = time.time()
+	candidates = get_reorder_candidates()
+	timings.query = time.time() - start
+
+	start = time.time()
+	material_requests = get_material_requests_to_reorder(candidates)
+	timings.plan = time.time() - start
 
+	if not dry_run:
+		start = time.time()
 		create_material_request(material_requests)
+		timings.create = time.time() - start
+
+	return frappe._dict({
+		"candidates": candidates,
+		"material_requests": material_requests,
+		"timings": timings
+	})
+
+def get_reorder_candidates():
+	"""bins below their reorder level, with the item details needed for the material request,
+		from one joined query. the first Item Reorder row of a warehouse, if any, overrides
+		the level set in the item"""
+	candidates = []
+	for d in frappe.db.sql("""select bin.item_code, bin.warehouse, bin.projected_qty,
+			warehouse.company, item.item_name, item.description, item.item_group, item.brand,
+			item.stock_uom, item.lead_time_days, ir.material_request_type,
+			if(ir.name is null, item.re_order_level, ir.warehouse_reorder_level) as reorder_level,
+			if(ir.name is null, item.re_order_qty, ir.warehouse_reorder_qty) as reorder_qty
+		from `tabBin` bin
+			inner join `tabItem` item on item.name = bin.item_code
+			left join `tabWarehouse` warehouse on warehouse.name = bin.warehouse
+			left join `tabItem Reorder` ir on ir.parent = bin.item_code
+				and ir.parenttype = 'Item' and ir.warehouse = bin.warehouse
+				and ir.idx = (select min(idx) from `tabItem Reorder`
+					where parent = bin.item_code and parenttype = 'Item'
+						and warehouse = bin.warehouse)
+		where ifnull(bin.warehouse, '') != ''
+			and item.is_stock_item='Yes'
+			and (item.is_purchase_item='Yes' or item.is_sub_contracted_item='Yes')
+			and (ifnull(item.end_of_life, '')='' or item.end_of_life > curdate())
+			and ifnull(if(ir.name is null, item.re_order_level, ir.warehouse_reorder_level), 0) != 0
+			and ifnull(bin.projected_qty, 0) <
+				if(ir.name is null, item.re_order_level, ir.warehouse_reorder_level)""", as_dict=True):
+			d.material_request_type = d.material_request_type or "Purchase"
+			d.reorder_qty = max(flt(d.reorder_qty), flt(d.reorder_level) - flt(d.projected_qty))
+			candidates.append(d)
+
+	return candidates
+
+def get_material_requests_to_reorder(candidates):
+	"""candidates grouped by material request type and company"""
+	material_requests = {}
+	default_company = None
+	for d in candidates:
+		if not d.company and not default_company:
+			default_company = frappe.defaults.get_defaults()["company"] or \
+				frappe.db.sql("""select name from tabCompany limit 1""")[0][0]
+
+		material_requests.setdefault(d.material_request_type, frappe._dict()).setdefault(
+			d.company or default_company, []).append(d)
+
+	return material_requests
 
 def create_material_request(material_requests):
 	"""	Create indent on reaching reorder level	"""
@@ -244,18 +287,17 @@ def create_material_request(material_requests):
 				})
 
 				for d in items:
-					item = frappe.get_doc("Item", d.item_code)
 					mr.append("indent_details", {
 						"doctype": "Material Request Item",
 						"item_code": d.item_code,
-						"schedule_date": add_days(nowdate(),cint(item.lead_time_days)),
-						"uom":	item.stock_uom,
+						"schedule_date": add_days(nowdate(), cint(d.lead_time_days)),
+						"uom":	d.stock_uom,
 						"warehouse": d.warehouse,
-						"item_name": item.item_name,
-						"description": item.description,
-						"item_group": item.item_group,
+						"item_name": d.item_name,
+						"description": d.description,
+						"item_group": d.item_group,
 						"qty": d.reorder_qty,
-						"brand": item.brand,
+						"brand": d.brand,
 					})
 
 				mr.insert()
@@ -17,7 +17,7 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import cint, comma_or
+from frappe.utils import cint, cstr, comma_or, now
 
 def validate_status(status, options):
 	if status not in options:
@@ -31,3 +31,64 @@ def build_filter_conditions(filters):
 
 	conditions = conditions and " and " + " and ".join(conditions) or ""
 	return conditions, filter_values
+
+def make_autonames(autoname, count):
+	"""reserve `count` consecutive names of a naming series like "GL.#######"
+		with a single update of the series"""
+	from frappe.model.naming import make_autoname
+
+	parts = autoname.split(".")
+	series_parts = [i for i, part in enumerate(parts) if part.startswith("#")]
+
+	if len(series_parts) != 1 or [part for part in parts if part in ("YY", "YYYY", "MM", "DD")]:
+		return [make_autoname(autoname) for i in xrange(count)]
+
+	i = series_parts[0]
+	prefix, digits, suffix = "".join(parts[:i]), len(parts[i]), "".join(parts[i+1:])
+
+	current = frappe.db.sql("select `current` from `tabSeries` where name=%s for update", prefix)
+	if current and current[0][0] is not None:
+		start = cint(current[0][0]) + 1
+		frappe.db.sql("update `tabSeries` set current = current + %s where name=%s", (count, prefix))
+	else:
+		start = 1
+		frappe.db.sql("insert into `tabSeries` (name, current) values (%s, %s)", (prefix, count))
+
+	return [prefix + ("%0" + cstr(digits) + "d") % n + suffix for n in xrange(start, start + count)]
+
+def bulk_insert(doctype, rows, docstatus=0, chunk_size=500):
+	"""insert already validated rows of a doctype with multi-row insert statements,
+		without loading a document (or running its controller) per row.
+		rows without a name are named as per the doctype's autoname series.
+		rows of child tables must have parent, parentfield, parenttype and idx set"""
+	from frappe.model import no_value_fields
+
+	meta = frappe.get_meta(doctype)
+	fields = [df for df in meta.get("fields") if df.fieldtype not in no_value_fields]
+	parent_columns = ["parent", "parentfield", "parenttype", "idx"] if meta.istable else []
+	columns = ["name", "creation", "modified", "owner", "modified_by", "docstatus"] + \
+		parent_columns + [df.fieldname for df in fields]
+
+	unnamed = [row for row in rows if not row.get("name")]
+	if unnamed:
+		for row, name in zip(unnamed, make_autonames(meta.autoname, len(unnamed))):
+			row["name"] = name
+
+	timestamp, user = now(), frappe.session.user
+	row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+	for i in xrange(0, len(rows), chunk_size):
+		chunk = rows[i:i + chunk_size]
+		values = []
+		for row in chunk:
+			values.extend([row["name"], timestamp, timestamp, user, user, docstatus])
+			values.extend([row.get(c) for c in parent_columns])
+			for df in fields:
+				value = row.get(df.fieldname)
+				values.append(df.default if value is None else value)
+
+		frappe.db.sql("""insert into `tab{0}` ({1}) values {2}""".format(doctype,
+			", ".join("`{0}`".format(c) for c in columns),
+			", ".join([row_placeholder] * len(chunk))), tuple(values))
+
+	return [row["name"] for row in rows]
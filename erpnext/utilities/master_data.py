@@ -0,0 +1,81 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+"""
+	Cached attributes of master records which are looked up again and again
+	while posting transactions, like an Item's valuation method or an Account's
+	report type.
+
+	Records are memoized in `frappe.local`, and only for the transaction being
+	posted: the memo is dropped when a transaction document is loaded or created,
+	and when a cached record is saved, renamed or deleted. So a record changed
+	with `frappe.db.set_value` or raw SQL, or read in a transaction that was
+	rolled back, is read again for the next transaction. Nothing is kept in the
+	shared cache, which could not be cleared on rollback.
+"""
+
+from __future__ import unicode_literals
+import frappe
+
+cached_fields = {
+	"Item": ["is_stock_item", "valuation_method", "tolerance", "stock_uom"],
+	"Account": ["report_type", "freeze_account", "balance_must_be", "group_or_ledger",
+		"docstatus", "company"],
+	"Cost Center": ["company"],
+	"Company": ["default_currency"],
+	"Warehouse": ["company"]
+}
+
+def get_master_value(doctype, name, fieldname):
+	"""like `frappe.db.get_value` for cached fields of a master record"""
+	row = get_master(doctype, name)
+	if isinstance(fieldname, (list, tuple)):
+		return [row.get(f) for f in fieldname] if row else None
+	else:
+		return row.get(fieldname) if row else None
+
+def get_master(doctype, name):
+	"""cached fields of a master record, None if it does not exist"""
+	if not name:
+		return None
+
+	local_cache = get_local_cache().setdefault(doctype, {})
+	stats = get_master_cache_stats().setdefault(doctype,
+		frappe._dict({"hits": 0, "misses": 0}))
+
+	if name in local_cache:
+		stats.hits += 1
+		return local_cache[name]
+
+	stats.misses += 1
+	row = frappe.db.get_value(doctype, name, cached_fields[doctype], as_dict=True)
+
+	# missing records are not cached, they may be created later in the request
+	if row:
+		local_cache[name] = row
+
+	return row
+
+def clear_master_value(doctype, name):
+	get_local_cache().get(doctype, {}).pop(name, None)
+
+def clear_local_cache():
+	"""called when a transaction document is loaded or created"""
+	frappe.local.master_data_cache = {}
+
+def clear_master_cache(doc, method=None, old=None, new=None, merge=False):
+	"""called on update, trash and rename of cached doctypes"""
+	clear_master_value(doc.doctype, doc.name)
+	if old:
+		clear_master_value(doc.doctype, old)
+
+def get_master_cache_stats():
+	"""hits and misses per doctype in this request"""
+	if getattr(frappe.local, "master_data_cache_stats", None) is None:
+		frappe.local.master_data_cache_stats = {}
+	return frappe.local.master_data_cache_stats
+
+def get_local_cache():
+	if getattr(frappe.local, "master_data_cache", None) is None:
+		frappe.local.master_data_cache = {}
+	return frappe.local.master_data_cache
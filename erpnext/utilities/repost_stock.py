@@ -3,32 +3,121 @@
 
 from __future__ import unicode_literals
 import frappe
+import json, time
+from multiprocessing import Pool
 
 from frappe.utils import flt, cstr, nowdate, nowtime
 from erpnext.stock.utils import update_bin
 from erpnext.stock.stock_ledger import update_entries_after
 from erpnext.accounts.utils import get_fiscal_year
 
-def repost(allow_negative_stock=False):
+def repost(allow_negative_stock=False, workers=1, resume=False, chunk_size=100, verbose=False):
 	"""
 	Repost everything!
+
+	(item_code, warehouse) pairs are reposted in chunks by a pool of `workers`
+	processes, each with its own database connection. Each chunk is committed
+	when done and checkpointed, so that an interrupted repost can be continued
+	with `resume=True`. With `verbose`, progress is reported after each chunk.
 	"""
 	frappe.db.auto_commit_on_many_writes = 1
 
 	if allow_negative_stock:
 		frappe.db.set_default("allow_negative_stock", 1)
 
-	for d in frappe.db.sql("""select distinct item_code, warehouse from
+	item_warehouses = sorted(frappe.db.sql("""select distinct item_code, warehouse from
 		(select item_code, warehouse from tabBin
 		union
-		select item_code, warehouse from `tabStock Ledger Entry`) a"""):
-			repost_stock(d[0], d[1], allow_negative_stock)
+		select item_code, warehouse from `tabStock Ledger Entry`) a
+		where ifnull(item_code, '')!='' and ifnull(warehouse, '')!=''"""))
+
+	checkpoint = resume and frappe.db.get_default("repost_stock_checkpoint")
+	if checkpoint:
+		checkpoint = tuple(json.loads(checkpoint))
+		item_warehouses = [d for d in item_warehouses if tuple(d) > checkpoint]
+
+	qty_maps = get_qty_maps()
+	chunks = []
+	for i in xrange(0, len(item_warehouses), chunk_size):
+		chunks.append([(item_code, warehouse, dict((fieldname, flt(qty_map.get((item_code, warehouse))))
+			for fieldname, qty_map in qty_maps.items()))
+				for item_code, warehouse in item_warehouses[i:i + chunk_size]])
+
+	# workers must see committed settings
+	frappe.db.commit()
+
+	pool = None
+	if workers > 1:
+		# forked workers must not share this connection
+		frappe.db.close()
+		pool = Pool(workers, initializer=connect_worker,
+			initargs=(frappe.local.site, frappe.local.sites_path))
+		frappe.connect()
+		results = pool.imap(repost_chunk, chunks)
+	else:
+		results = (repost_chunk(chunk) for chunk in chunks)
+
+	progress = RepostProgress(len(item_warehouses), verbose)
+	try:
+		# results are in order of chunks, so all chunks till the checkpoint are done
+		for result in results:
+			progress.update(result)
+			frappe.db.set_default("repost_stock_checkpoint", json.dumps(result["last"]))
+			frappe.db.commit()
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
+
+	frappe.db.set_default("repost_stock_checkpoint", None)
 
 	if allow_negative_stock:
 		frappe.db.set_default("allow_negative_stock",
 			frappe.db.get_value("Stock Settings", None, "allow_negative_stock"))
 	frappe.db.auto_commit_on_many_writes = 0
 
+	return progress.get_summary()
+
+def connect_worker(site, sites_path):
+	frappe.init(site=site, sites_path=sites_path)
+	frappe.connect()
+	frappe.db.auto_commit_on_many_writes = 1
+
+def repost_chunk(chunk):
+	for item_code, warehouse, qty_dict in chunk:
+		repost_actual_qty(item_code, warehouse)
+		update_bin(item_code, warehouse, qty_dict)
+
+	frappe.db.commit()
+
+	# plain types, results are pickled back from worker processes
+	return {"count": len(chunk), "last": list(chunk[-1][:2])}
+
+class RepostProgress(object):
+	def __init__(self, total, verbose=False):
+		self.total = total
+		self.done = 0
+		self.verbose = verbose
+		self.start = time.time()
+
+	def update(self, result):
+		self.done += result["count"]
+		if self.verbose:
+			summary = self.get_summary()
+			frappe.errprint("Reposted {done}/{total} item-warehouses, {rate:.1f} per second, "
+				"{remaining:.0f} seconds remaining".format(**summary))
+
+	def get_summary(self):
+		elapsed = time.time() - self.start
+		rate = self.done / elapsed if elapsed else 0.0
+		return {
+			"done": self.done,
+			"total": self.total,
+			"elapsed": elapsed,
+			"rate": rate,
+			"remaining": (self.total - self.done) / rate if rate else 0.0
+		}
+
 def repost_stock(item_code, warehouse):
 	repost_actual_qty(item_code, warehouse)
 
@@ -42,78 +131,127 @@ def repost_stock(item_code, warehouse):
 
 def repost_actual_qty(item_code, warehouse):
 	try:
-		update_entries_after({ "item_code": item_code, "warehouse": warehouse })
+		update_entries_after({ "item_code": item_code, "warehouse": warehouse },
+			allow_early_exit=False)
 	except:
 		pass
 
+def get_qty_maps():
+	"""reserved, indented, ordered and planned qty of all item-warehouses,
+		each as {(item_code, warehouse): qty}"""
+	return {
+		"reserved_qty": get_reserved_qty_map(),
+		"indented_qty": get_indented_qty_map(),
+		"ordered_qty": get_ordered_qty_map(),
+		"planned_qty": get_planned_qty_map()
+	}
+
+def get_item_warehouse_conditions(item_code, warehouse, item_field, warehouse_field):
+	conditions, values = "", []
+	if item_code:
+		conditions += " and {0}=%s".format(item_field)
+		values.append(item_code)
+	if warehouse:
+		conditions += " and {0}=%s".format(warehouse_field)
+		values.append(warehouse)
+
+	return conditions, values
+
 def get_reserved_qty(item_code, warehouse):
+	return flt(get_reserved_qty_map(item_code, warehouse).get((item_code, warehouse)))
+
+def get_reserved_qty_map(item_code=None, warehouse=None):
+	dnpi_conditions, dnpi_values = get_item_warehouse_conditions(item_code, warehouse,
+		"dnpi.item_code", "dnpi.warehouse")
+	so_item_conditions, so_item_values = get_item_warehouse_conditions(item_code, warehouse,
+		"so_item.item_code", "so_item.reserved_warehouse")
+
 	reserved_qty = frappe.db.sql("""
 		select
+			item_code, warehouse,
 			sum((dnpi_qty / so_item_qty) * (so_item_qty - so_item_delivered_qty))
 		from
 			(
 				(select
-					qty as dnpi_qty,
-					(
-						select qty from `tabSales Order Item`
-						where name = dnpi.parent_detail_docname
-					) as so_item_qty,
-					(
-						select ifnull(delivered_qty, 0) from `tabSales Order Item`
-						where name = dnpi.parent_detail_docname
-					) as so_item_delivered_qty,
-					parent, name
+					dnpi.item_code, dnpi.warehouse,
+					dnpi.qty as dnpi_qty,
+					so_item.qty as so_item_qty,
+					ifnull(so_item.delivered_qty, 0) as so_item_delivered_qty,
+					dnpi.parent, dnpi.name
 				from
-				(
-					select qty, parent_detail_docname, parent, name
-					from `tabPacked Item` dnpi_in
-					where item_code = %s and warehouse = %s
-					and parenttype="Sales Order"
-				and item_code != parent_item
-					and exists (select * from `tabSales Order` so
-					where name = dnpi_in.parent and docstatus = 1 and status != 'Stopped')
-				) dnpi)
+					`tabPacked Item` dnpi, `tabSales Order Item` so_item, `tabSales Order` so
+				where
+					dnpi.parenttype="Sales Order"
+					and dnpi.item_code != dnpi.parent_item
+					and so_item.name = dnpi.parent_detail_docname
+					and so.name = dnpi.parent and so.docstatus = 1 and so.status != 'Stopped'
+					{0})
 			union
-				(select qty as dnpi_qty, qty as so_item_qty,
-					ifnull(delivered_qty, 0) as so_item_delivered_qty, parent, name
-				from `tabSales Order Item` so_item
-				where item_code = %s and reserved_warehouse = %s
-				and exists(select * from `tabSales Order` so
-					where so.name = so_item.parent and so.docstatus = 1
-					and so.status != 'Stopped'))
+				(select
+					so_item.item_code, so_item.reserved_warehouse as warehouse,
+					so_item.qty as dnpi_qty, so_item.qty as so_item_qty,
+					ifnull(so_item.delivered_qty, 0) as so_item_delivered_qty,
+					so_item.parent, so_item.name
+				from `tabSales Order Item` so_item, `tabSales Order` so
+				where so.name = so_item.parent and so.docstatus = 1
+					and so.status != 'Stopped'
+					{1})
 			) tab
 		where
 			so_item_qty >= so_item_delivered_qty
-	""", (item_code, warehouse, item_code, warehouse))
+		group by item_code, warehouse
+	""".format(dnpi_conditions, so_item_conditions), tuple(dnpi_values + so_item_values))
 
-	return flt(reserved_qty[0][0]) if reserved_qty else 0
+	return dict(((d[0], d[1]), flt(d[2])) for d in reserved_qty)
 
 def get_indented_qty(item_code, warehouse):
-	indented_qty = frappe.db.sql("""select sum(pr_item.qty - ifnull(pr_item.ordered_qty, 0))
+	return flt(get_indented_qty_map(item_code, warehouse).get((item_code, warehouse)))
+
+def get_indented_qty_map(item_code=None, warehouse=None):
+	conditions, values = get_item_warehouse_conditions(item_code, warehouse,
+		"pr_item.item_code", "pr_item.warehouse")
+
+	indented_qty = frappe.db.sql("""select pr_item.item_code, pr_item.warehouse,
+			sum(pr_item.qty - ifnull(pr_item.ordered_qty, 0))
 		from `tabMaterial Request Item` pr_item, `tabMaterial Request` pr
-		where pr_item.item_code=%s and pr_item.warehouse=%s
-		and pr_item.qty > ifnull(pr_item.ordered_qty, 0) and pr_item.parent=pr.name
-		and pr.status!='Stopped' and pr.docstatus=1""", (item_code, warehouse))
+		where pr_item.qty > ifnull(pr_item.ordered_qty, 0) and pr_item.parent=pr.name
+		and pr.status!='Stopped' and pr.docstatus=1 {0}
+		group by pr_item.item_code, pr_item.warehouse""".format(conditions), tuple(values))
 
-	return flt(indented_qty[0][0]) if indented_qty else 0
+	return dict(((d[0], d[1]), flt(d[2])) for d in indented_qty)
 
 def get_ordered_qty(item_code, warehouse):
+	return flt(get_ordered_qty_map(item_code, warehouse).get((item_code, warehouse)))
+
+def get_ordered_qty_map(item_code=None, warehouse=None):
+	conditions, values = get_item_warehouse_conditions(item_code, warehouse,
+		"po_item.item_code", "po_item.warehouse")
+
 	ordered_qty = frappe.db.sql("""
-		select sum((po_item.qty - ifnull(po_item.received_qty, 0))*po_item.conversion_factor)
+		select po_item.item_code, po_item.warehouse,
+			sum((po_item.qty - ifnull(po_item.received_qty, 0))*po_item.conversion_factor)
 		from `tabPurchase Order Item` po_item, `tabPurchase Order` po
-		where po_item.item_code=%s and po_item.warehouse=%s
-		and po_item.qty > ifnull(po_item.received_qty, 0) and po_item.parent=po.name
-		and po.status!='Stopped' and po.docstatus=1""", (item_code, warehouse))
+		where po_item.qty > ifnull(po_item.received_qty, 0) and po_item.parent=po.name
+		and po.status!='Stopped' and po.docstatus=1 {0}
+		group by po_item.item_code, po_item.warehouse""".format(conditions), tuple(values))
 
-	return flt(ordered_qty[0][0]) if ordered_qty else 0
+	return dict(((d[0], d[1]), flt(d[2])) for d in ordered_qty)
 
 def get_planned_qty(item_code, warehouse):
+	return flt(get_planned_qty_map(item_code, warehouse).get((item_code, warehouse)))
+
+def get_planned_qty_map(item_code=None, warehouse=None):
+	conditions, values = get_item_warehouse_conditions(item_code, warehouse,
+		"production_item", "fg_warehouse")
+
 	planned_qty = frappe.db.sql("""
-		select sum(ifnull(qty, 0) - ifnull(produced_qty, 0)) from `tabProduction Order`
-		where production_item = %s and fg_warehouse = %s and status != "Stopped"
-		and docstatus=1 and ifnull(qty, 0) > ifnull(produced_qty, 0)""", (item_code, warehouse))
+		select production_item, fg_warehouse, sum(ifnull(qty, 0) - ifnull(produced_qty, 0))
+		from `tabProduction Order`
+		where status != "Stopped" and docstatus=1
+		and ifnull(qty, 0) > ifnull(produced_qty, 0) {0}
+		group by production_item, fg_warehouse""".format(conditions), tuple(values))
 
-	return flt(planned_qty[0][0]) if planned_qty else 0
+	return dict(((d[0], d[1]), flt(d[2])) for d in planned_qty)
 
 
 def update_bin(item_code, warehouse, qty_dict=None):
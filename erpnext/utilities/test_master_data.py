@@ -0,0 +1,49 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest
+from erpnext.utilities.master_data import get_master_value, get_master_cache_stats
+
+test_dependencies = ["Item"]
+
+class TestMasterData(unittest.TestCase):
+	def setUp(self):
+		frappe.local.master_data_cache = {}
+		frappe.local.master_data_cache_stats = {}
+
+	def test_lookups_are_memoized(self):
+		for i in xrange(5):
+			self.assertEquals(get_master_value("Item", "_Test Item", "is_stock_item"), "Yes")
+
+		self.assertEquals(get_master_value("Item", "_Test Item", ["is_stock_item", "stock_uom"]),
+			["Yes", "_Test UOM"])
+
+		stats = get_master_cache_stats()["Item"]
+		self.assertEquals(stats.misses, 1)
+		self.assertEquals(stats.hits, 5)
+
+		self.assertEquals(get_master_value("Item", "_Test Non Existing Item", "stock_uom"), None)
+
+	def test_cleared_on_save(self):
+		item = frappe.get_doc("Item", "_Test Item")
+		tolerance = item.tolerance
+		self.assertEquals(get_master_value("Item", "_Test Item", "tolerance"), tolerance)
+
+		item.tolerance = 20
+		item.save()
+
+		try:
+			self.assertEquals(get_master_value("Item", "_Test Item", "tolerance"), 20)
+		finally:
+			frappe.db.set_value("Item", "_Test Item", "tolerance", tolerance)
+
+	def test_cleared_for_new_transaction(self):
+		tolerance = get_master_value("Item", "_Test Item", "tolerance")
+		frappe.db.set_value("Item", "_Test Item", "tolerance", 30)
+
+		try:
+			frappe.new_doc("Purchase Receipt")
+			self.assertEquals(get_master_value("Item", "_Test Item", "tolerance"), 30)
+		finally:
+			frappe.db.set_value("Item", "_Test Item", "tolerance", tolerance)
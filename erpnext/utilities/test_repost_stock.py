@@ -0,0 +1,61 @@
+# Copyright (c) 2013, Web Notes Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, unittest, json
+from frappe.utils import flt
+from erpnext.utilities.repost_stock import repost, get_qty_maps, get_reserved_qty, \
+	get_indented_qty, get_ordered_qty, get_planned_qty
+
+test_dependencies = ["Sales Order", "Purchase Order", "Material Request", "Stock Entry"]
+
+class TestRepostStock(unittest.TestCase):
+	def tearDown(self):
+		frappe.db.set_default("repost_stock_checkpoint", None)
+
+	def test_qty_maps(self):
+		for doctype in ("Sales Order", "Purchase Order", "Material Request"):
+			doc = frappe.copy_doc(frappe.get_test_records(doctype)[0])
+			doc.insert()
+			doc.submit()
+
+		qty_maps = get_qty_maps()
+		self.assertTrue(qty_maps["reserved_qty"])
+		self.assertTrue(qty_maps["ordered_qty"])
+		self.assertTrue(qty_maps["indented_qty"])
+
+		for fieldname, get_qty in (("reserved_qty", get_reserved_qty),
+			("indented_qty", get_indented_qty), ("ordered_qty", get_ordered_qty),
+			("planned_qty", get_planned_qty)):
+				for (item_code, warehouse), qty in qty_maps[fieldname].items():
+					self.assertEquals(flt(qty), get_qty(item_code, warehouse))
+
+	def test_resume(self):
+		from erpnext.stock.doctype.stock_entry.test_stock_entry import test_records
+		frappe.db.sql("delete from `tabStock Ledger Entry`")
+		frappe.db.sql("delete from `tabBin`")
+
+		for item_code in ("_Test Item", "_Test Item Home Desktop 100"):
+			se = frappe.copy_doc(test_records[0])
+			se.get("mtn_details")[0].item_code = item_code
+			se.insert()
+			se.submit()
+
+		def _get_actual_qty(item_code):
+			return flt(frappe.db.get_value("Bin", {"item_code": item_code,
+				"warehouse": "_Test Warehouse - _TC"}, "actual_qty"))
+
+		frappe.db.sql("update `tabBin` set actual_qty=0")
+
+		# a partial run got as far as _Test Item
+		frappe.db.set_default("repost_stock_checkpoint",
+			json.dumps(["_Test Item", "_Test Warehouse - _TC"]))
+		summary = repost(resume=True)
+
+		self.assertEquals(summary["done"], 1)
+		self.assertEquals(_get_actual_qty("_Test Item"), 0)
+		self.assertEquals(_get_actual_qty("_Test Item Home Desktop 100"), 50)
+		self.assertFalse(frappe.db.get_default("repost_stock_checkpoint"))
+
+		repost()
+		self.assertEquals(_get_actual_qty("_Test Item"), 50)
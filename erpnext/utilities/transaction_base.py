@@ -7,9 +7,15 @@ from frappe import _
 from frappe.utils import cstr, now_datetime, cint
 
 from erpnext.controllers.status_updater import StatusUpdater
+from erpnext.utilities.master_data import clear_local_cache
 
 
 class TransactionBase(StatusUpdater):
+	def __init__(self, arg1, arg2=None):
+		# master records are memoized for one transaction only
+		clear_local_cache()
+		super(TransactionBase, self).__init__(arg1, arg2)
+
 	def load_notification_message(self):
 		dt = self.doctype.lower().replace(" ", "_")
 		if int(frappe.db.get_value("Notification Control", None, dt) or 0):